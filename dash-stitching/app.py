@@ -1,9 +1,17 @@
+import functools
+import hashlib
+import json
+import os
+import re
+import tempfile
+
 import numpy as np
 import pandas as pd
 from skimage import io, data, transform
 from time import sleep
 
 import dash
+import flask
 from dash.exceptions import PreventUpdate
 from dash.dependencies import Input, Output, State
 import dash_html_components as html
@@ -16,10 +24,10 @@ from dash_canvas.utils import (
     image_string_to_PILImage,
     array_to_data_url,
     parse_jsonstring_line,
-    brightness_adjust,
-    contrast_adjust,
 )
+from deepzoom import touch_pyramid, write_deepzoom_once
 from registration import register_tiles
+from tile_store import TileStore
 from utils import StaticUrlPath
 import pathlib
 
@@ -34,6 +42,31 @@ PATH = pathlib.Path(__file__).parent
 
 DATA_PATH = PATH.joinpath("data").resolve()
 
+# Decoded mosaics of the uploads, keyed by a hash of the upload and shared between
+# server processes through the disk tier, in shared memory where available
+SHARED_PATH = pathlib.Path("/dev/shm")
+if not SHARED_PATH.is_dir():
+    SHARED_PATH = pathlib.Path(tempfile.gettempdir())
+TILE_STORE = TileStore(
+    max_bytes=512 * 2 ** 20, disk_dir=SHARED_PATH / "dash_stitching_tiles", disk_max_bytes=2 * 2 ** 30
+)
+
+# DeepZoom pyramids of stitched results, one directory per content hash, the least
+# recently used ones are pruned past a byte budget
+DEEPZOOM_PATH = pathlib.Path(tempfile.gettempdir()) / "dash_stitching_deepzoom"
+DEEPZOOM_PATH.mkdir(parents=True, exist_ok=True)
+DEEPZOOM_MAX_BYTES = int(os.environ.get("DEEPZOOM_MAX_BYTES", 2 * 2 ** 30))
+
+
+@server.route("/deepzoom/<key>/<path:filename>")
+def deepzoom_file(key, filename):
+    # Pyramids are named by the hash of their content, so tiles never change
+    if not re.fullmatch("[0-9a-f]{40}", key):
+        flask.abort(404)
+    response = flask.send_from_directory(str(DEEPZOOM_PATH / key), filename)
+    response.headers["Cache-Control"] = "public, max-age=31536000"
+    return response
+
 
 def demo_explanation():
     # Markdown files
@@ -60,10 +93,36 @@ def tile_images(list_of_images, n_rows, n_cols):
     )
 
 
-def untile_images(image_string, n_rows, n_cols):
-    big_im = np.asarray(image_string_to_PILImage(image_string))
-    tiles = [np.split(im, n_cols, axis=1) for im in np.split(big_im, n_rows)]
-    return np.array(tiles)
+def untile_images(big_im, n_rows, n_cols):
+    # View of the mosaic as an (n_rows, n_cols, l_r, l_c) array of tiles, without copying
+    if big_im.shape[0] % n_rows or big_im.shape[1] % n_cols:
+        raise ValueError("array split does not result in an equal division")
+    l_r, l_c = big_im.shape[0] // n_rows, big_im.shape[1] // n_cols
+    tiles = big_im.reshape((n_rows, l_r, n_cols, l_c) + big_im.shape[2:])
+    return tiles.swapaxes(1, 2)
+
+
+def upload_key(list_image_string, list_filenames, downsample, n_rows, n_cols):
+    # Hash of the uploaded files and of the parameters of their mosaic
+    digest = hashlib.sha1(json.dumps([list_filenames, downsample, n_rows, n_cols]).encode())
+    for image_string in list_image_string:
+        digest.update(image_string.encode())
+    return digest.hexdigest()
+
+
+def stitch_key(tile_key, *params):
+    # Hash of an upload and of the stitching parameters
+    return hashlib.sha1(json.dumps([tile_key, *params], sort_keys=True).encode()).hexdigest()
+
+
+@functools.lru_cache(maxsize=4)
+def mosaic_data_url(key):
+    # The drawing canvas needs the mosaic as an image, encoded once per upload
+    mosaic = TILE_STORE.get(key)
+    if mosaic is None:
+        # Evicted from the store, the files have to be uploaded again
+        raise PreventUpdate
+    return array_to_data_url(mosaic)
 
 
 def demo_data():
@@ -306,12 +365,11 @@ def fill_tab(tab):
             dcc.Loading(
                 id="loading-1",
                 children=[
-                    html.Img(
+                    html.Iframe(
                         id="stitching-result",
-                        src=array_to_data_url(
-                            np.zeros((height, width), dtype=np.uint8)
-                        ),
                         width=canvas_width,
+                        height=canvas_height,
+                        style={"border": "none"},
                     )
                 ],
                 type="circle",
@@ -370,13 +428,13 @@ def update_store(click):
         Input("stitched-res", "children"),
     ],
 )
-def modify_result(contrast, brightness, image_string):
-    if image_string is None:
+def modify_result(contrast, brightness, key):
+    # The viewer fetches the tiles of its viewport and applies contrast and brightness itself
+    if key is None:
         raise PreventUpdate
-    img = np.asarray(image_string_to_PILImage(image_string))
-    img = contrast_adjust(img, contrast)
-    img = brightness_adjust(img, brightness)
-    return array_to_data_url(img)
+    return "{}deepzoom/{}/viewer.html?contrast={}&brightness={}".format(
+        app.config.requests_pathname_prefix, key, contrast, brightness
+    )
 
 
 @app.callback(
@@ -391,13 +449,21 @@ def modify_result(contrast, brightness, image_string):
         State("do-blending-stitch", "values"),
     ],
 )
-def modify_content(n_cl, n_rows, n_cols, overlap, estimate, image_string, vals):
+def modify_content(n_cl, n_rows, n_cols, overlap, estimate, tile_key, vals):
     blending = 0
     if vals is not None:
         blending = 1 in vals
-    if image_string is None:
+    if tile_key is None:
         raise PreventUpdate
-    tiles = untile_images(image_string, n_rows, n_cols)
+    # Stitching the same upload with the same parameters gives the same pyramid
+    key = stitch_key(tile_key, n_rows, n_cols, overlap, estimate, blending)
+    if touch_pyramid(DEEPZOOM_PATH, key):
+        return key
+    mosaic = TILE_STORE.get(tile_key)
+    if mosaic is None:
+        # Evicted from the store, the files have to be uploaded again
+        raise PreventUpdate
+    tiles = untile_images(mosaic, n_rows, n_cols)
     if estimate is not None and len(estimate) > 0:
 
         overlap_dict = _sort_props_lines(
@@ -412,15 +478,17 @@ def modify_content(n_cl, n_rows, n_cols, overlap, estimate, image_string, vals):
         n_cols,
         overlap_global=overlap,
         overlap_local=overlap_dict,
-        pad=np.max(tiles.shape[2:]),
         blending=blending,
     )
-    return array_to_data_url(canvas)
+    write_deepzoom_once(canvas, DEEPZOOM_PATH, key, max_bytes=DEEPZOOM_MAX_BYTES)
+    return key
 
 
 @app.callback(Output("canvas-stitch", "image_content"), [Input("sh_x", "children")])
-def update_canvas_image(im):
-    return im
+def update_canvas_image(key):
+    if key is None:
+        raise PreventUpdate
+    return mosaic_data_url(key)
 
 
 @app.callback(Output("upload-stitch", "contents"), [Input("demo", "n_clicks")])
@@ -445,6 +513,9 @@ def upload_content(
 
     downsample = int(downsample)
     if list_image_string is not None:
+        key = upload_key(list_image_string, list_filenames, downsample, n_rows, n_cols)
+        if key in TILE_STORE:
+            return key
         order = np.argsort(list_filenames)
         image_list = [
             np.asarray(image_string_to_PILImage(list_image_string[i])) for i in order
@@ -459,11 +530,13 @@ def upload_content(
                 for image in image_list
             ]
         res = tile_images(image_list, n_rows, n_cols)
-        return array_to_data_url(res)
+        TILE_STORE.put(key, res)
+        return key
     elif click:
-        res = demo_data()
-        tmp = array_to_data_url(res)
-        return tmp
+        key = "demo"
+        if key not in TILE_STORE:
+            TILE_STORE.put(key, demo_data())
+        return key
 
     raise PreventUpdate
 
@@ -8,7 +8,7 @@ from dash.dependencies import Input, Output, State
 from dash import html
 from dash import dcc
 from dash import dash_table
-import plotly.express as px
+import plotly.graph_objects as go
 
 import dash_canvas
 from dash_canvas.components import image_upload_zone
@@ -22,7 +22,15 @@ from dash_canvas.utils import (
 from registration import register_tiles
 from utils import StaticUrlPath
 import pathlib
+import functools
+import dataclasses
+import tempfile
 import vrad_utils as vru
+import vrad_jobs
+import vrad_cache
+import vrad_presets
+import vrad_views
+import os
 
 app = dash.Dash(
     __name__, meta_tags=[{"name": "viewport", "content": "width=device-width"}]
@@ -41,24 +49,6 @@ table_header_style = {
     "textAlign": "center",
 }
 
-class simulation_parameters:
-    sim_duration = 60*5
-    num_rads = 6
-    arr_rate_1 = 2
-    arr_rate_2 = 2
-    arr_rate_3 = 2
-    proc_rate_1 = 2
-    proc_rate_2 = 2
-    proc_rate_3 = 2
-    targ_time_1 = 30
-    targ_time_2 = 60
-    targ_time_3 = 24*60
-    percent_special = .40
-    cutoff = 2
-    verbose = False
-    fig = px.scatter()
-
-
 def demo_explanation():
     # Markdown files
     with open(PATH.joinpath("demo.md"), "r") as file:
@@ -69,38 +59,6 @@ def demo_explanation():
         style={"margin": "10px"},
     )
 
-"""""
-def run_simulation(): 
-    print("Running sim")
-    sim_duration = simulation_parameters.sim_duration
-    num_rads = simulation_parameters.num_rads
-    arr_rates = [simulation_parameters.arr_rate_1, simulation_parameters.arr_rate_2, simulation_parameters.arr_rate_3]
-    proc_rates = [simulation_parameters.proc_rate_1, simulation_parameters.proc_rate_2, simulation_parameters.proc_rate_3]
-    constant_rads = False
-    cutoff = simulation_parameters.cutoff
-    verbose = simulation_parameters.verbose
-
-    sys_state = vru.sim(sim_duration, num_rads, arr_rates, proc_rates, constant_rads, cutoff, verbose)
-    img_table = sys_state.img_table
-    print("sim done")
-    simulation_parameters.fig = px.scatter(img_table, x="time_created", y="total_time",
-                                            color="urgency", hover_name="img_id",
-                                            log_x=False, size_max=60)
-"""""
-
-
-
-def demo_data():
-    #Define variables
-    sim_duration = 60*5
-    num_rads = 6
-    arr_rate_var = 2
-    arr_rates = [arr_rate_var, arr_rate_var, arr_rate_var]
-    urg_times = [2, 5, 10]
-    #run sim
-    sys_state = vru.sim(sim_duration, num_rads, arr_rates, urg_times, cutoff=True, verbose=False)
-    print("demo")
-
 
 def instructions():
     return html.P(
@@ -383,7 +341,7 @@ app.layout = html.Div(
                                     dcc.Checklist(
                                     id="verbose-val",
                                     options=[{"label": "", "value": 1}],
-                                    value=[1],
+                                    value=[],
                                     style={"margin-left": "50px", "margin-right": "5px"},
                                     ),
                                 ],
@@ -410,7 +368,29 @@ app.layout = html.Div(
                             ],
                             style={'horizontalAlign':'middle', 'verticalAlign':'middle', 'width': '100%', 'display':'table'}
                             ),
-                        
+                        html.Label("Routing Policy", style={'margin-bottom': '5px', 'margin-top': '35px'}),
+                        dcc.Dropdown(
+                            id="routing-policy",
+                            options=[
+                                {"label": "Broadcast to all capable radiologists", "value": "broadcast"},
+                                {"label": "Join shortest queue", "value": "jsq"},
+                                {"label": "Least work left", "value": "least_work"},
+                                {"label": "Power of 2 choices", "value": "power_of_d"},
+                                {"label": "Round robin within specialty", "value": "round_robin"},
+                            ],
+                            value="broadcast",
+                            clearable=False,
+                            style={'width': '87%'},
+                        ),
+                        html.Label("Random Seed (blank for a fresh random run)", style={'margin-bottom': '5px', 'margin-top': '35px'}),
+                        dcc.Input(
+                            id="seed",
+                            type="number",
+                            value=1,
+                            min=0,
+                            step=1,
+                            style={'font-size': '12px', 'width': '80px'}
+                        ),
                         
                     ],
                     className="radio_items",
@@ -419,14 +399,44 @@ app.layout = html.Div(
                 html.Button(
                     "Run Simulation", id="button-run-sim", className="button_submit", style={"margin-top": "50px", "margin-left": "110px"},
                 ),
+                html.Label("Preset Scenario", style={'margin-bottom': '5px', 'margin-top': '20px', 'margin-left': '25px'}),
+                dcc.Dropdown(
+                    id="preset",
+                    options=[{"label": label, "value": name} for name, label in vrad_presets.PRESET_LABELS.items()],
+                    value="demo",
+                    clearable=False,
+                    style={'width': '87%', 'margin-left': '12px'},
+                ),
+                html.Button(
+                    "Load Preset", id="button-load-preset", className="button_submit", style={"margin-top": "10px", "margin-left": "110px"},
+                ),
+                html.Button(
+                    "Cancel", id="button-cancel-sim", className="button_submit", style={"margin-top": "10px", "margin-left": "110px"},
+                ),
+                html.Div(id="sim-progress", style={"margin-top": "10px", "margin-left": "25px"}),
+                html.Div(id="sim-cancel-note", hidden=True),
+                dcc.Store(id="sim-job"),
+                dcc.Store(id="sim-live-offset"),
+                dcc.Interval(id="sim-poll", interval=1000, disabled=True),
             ],
             className="four columns instruction",
         ),
         html.Div(
             className="eight columns result",
             children=[
+                dcc.Graph(id="live-graph"),
+                dcc.Store(id="sim-result"),
+                html.Div(id="results-count"),
                 dash_table.DataTable(
                     id="results-table",
+                    page_action="custom",
+                    page_current=0,
+                    page_size=25,
+                    sort_action="custom",
+                    sort_mode="multi",
+                    sort_by=[],
+                    filter_action="custom",
+                    filter_query="",
                     style_header=table_header_style,
                     style_data_conditional=[
                         {
@@ -440,7 +450,8 @@ app.layout = html.Div(
                         },
                     ],
                 ),
-                dcc.Graph(id="results-graph"),              
+                dcc.Graph(id="results-graph"),
+                dcc.Graph(id="idle-graph"),              
             ],
         ),
     ],
@@ -472,14 +483,87 @@ def update_graph(
 
 
 
-@app.callback([
-                Output("results-table", "columns"),
-                Output("results-table", "data"),
-                Output("results-graph", "figure")
-                
-            ],
-            [   Input("button-run-sim", "n_clicks")],
+jobs = vrad_jobs.JobManager()
+#Results of seeded runs are shared by every session, capped by a byte budget
+result_cache = vrad_cache.ResultCache(
+    max_bytes=int(os.environ.get("VRAD_CACHE_BYTES", 256 * 2 ** 20)),
+    disk_dir=os.environ.get("VRAD_CACHE_DIR", str(pathlib.Path(tempfile.gettempdir()) / "vrad_cache")),
+)
+presets = vrad_presets.PresetLibrary(jobs, result_cache, lock_dir=jobs.job_dir)
+
+
+@server.before_request
+def start_presets():
+    #on the first request rather than at import, so importing the app submits nothing
+    presets.start()
+
+
+def progress_text(status):
+    state = status["state"]
+    if state == "failed":
+        return f"Simulation failed: {status.get('error')}"
+    if "sim_time" not in status:
+        return f"Simulation {state}..."
+    return (f"Simulation {state}: {status['sim_time']:.0f} / {status['horizon']:.0f} simulated minutes, "
+            f"{status['n_events']} events, {status['wall_time']:.1f} s")
+
+
+def scenario_key(config, targ_rates, perc_special):
+    #verbose is left out since it only changes the logs
+    if config.seed is None:
+        return None
+    return vrad_cache.cache_key(
+        vru.ENGINE_VERSION, dataclasses.asdict(config.replace(verbose=False)),
+        [round(float(r), 6) for r in targ_rates], round(float(perc_special), 6),
+    )
+
+
+def load_result(job):
+    """
+    Result of the run described by a sim-job store, which holds all the
+    state of a session. Seeded runs are cached under their scenario key,
+    others under their job id in memory only. Misses fall back to the job
+    directory, so any worker process can serve any session.
+    """
+    for key in (job["key"], job["job_id"]):
+        if key is not None:
+            result = result_cache.get(key)
+            if result is not None:
+                return result
+    if job["job_id"] is None:
+        return None
+    result = jobs.result(job["job_id"])
+    if result is None:
+        return None
+    if job["key"] is not None and not result["cancelled"]:
+        result_cache.put(job["key"], result)
+    else:
+        result_cache.put(job["job_id"], result, disk=False)
+    return result
+
+
+list_columns = ['img_id','urgency', 'rad_id', 'time_created','time_rad_job_starts', 'time_job_finished', 'wait_time', 'time_w_rad', 'total_time']
+results_columns = [{"name": i, "id": i, "type": "numeric"} for i in list_columns]
+def relayout_range(relayout_data, axis):
+    #Zoomed range of an axis, None when autoscaled or untouched
+    if not relayout_data or relayout_data.get(f"{axis}.autorange"):
+        return None
+    if f"{axis}.range[0]" in relayout_data:
+        return relayout_data[f"{axis}.range[0]"], relayout_data[f"{axis}.range[1]"]
+    return relayout_data.get(f"{axis}.range")
+
+
+@functools.lru_cache(maxsize=16)
+def table_view(key, job_id, sort_by, filter_query):
+    #Row positions after filtering and sorting, reused while paging the same view
+    img_table = load_result({"key": key, "job_id": job_id})["img_table"]
+    return vrad_views.view_positions(img_table, sort_by, filter_query)
+
+
+@app.callback(Output("sim-job", "data"),
+            [   Input("button-run-sim", "n_clicks"), Input("button-load-preset", "n_clicks")],
             [
+                State("preset", "value"),
                 State("sim-duration", "value"),
                 State("num-rads", "value"),
                 State("arr-rate-1", "value"),
@@ -493,45 +577,179 @@ def update_graph(
                 State("targ-rate-3", "value"),
                 State("cutoff", "value"),
                 State("percent-special", "value"),
-                State("verbose-val", "value")
+                State("verbose-val", "value"),
+                State("routing-policy", "value"),
+                State("seed", "value")
             ],
             )
-def update_simulation(n_cl, sim_duration, num_rads, arr_rate_1, arr_rate_2, arr_rate_3, 
+def update_simulation(n_cl, n_preset, preset, sim_duration, num_rads, arr_rate_1, arr_rate_2, arr_rate_3, 
                             proc_rate_1, proc_rate_2, proc_rate_3, targ_rate_1, targ_rate_2, targ_rate_3, 
-                            cutoff_val, perc_special, verb_val):
-    verbose = 0
-    if verb_val is not None:
-        verbose = 1 
-    sim_duration = sim_duration * 60
-    arr_rates = [arr_rate_1, arr_rate_2, arr_rate_3]
-    proc_rates = [proc_rate_1, proc_rate_2, proc_rate_3]
+                            cutoff_val, perc_special, verb_val, routing_policy, seed):
+    triggered = [t["prop_id"] for t in dash.callback_context.triggered]
+    if "button-load-preset.n_clicks" in triggered:
+        #Precomputed at startup, renders at once unless still running
+        return presets.job(preset)
+    if "button-run-sim.n_clicks" not in triggered:
+        raise PreventUpdate
     targ_rates = [targ_rate_1, targ_rate_2, targ_rate_3]
-    sys_state = vru.sim(sim_duration, num_rads, arr_rates, proc_rates, constant_rads=False, cutoff=cutoff_val, verbose=verb_val)
-    img_table = sys_state.img_table
-    img_table['urgency'] = img_table['urgency'].astype(int).astype(str)
-    list_columns = ['img_id','urgency', 'rad_id', 'time_created','time_rad_job_starts', 'time_job_finished', 'wait_time', 'time_w_rad', 'total_time']
-    columns = [{"name": i, "id": i} for i in list_columns]
-    #Make figure
-    fig = px.scatter(img_table, x="time_created", y="total_time",
-                                            color="urgency", color_discrete_map={"1": "red", "2": "orange", "3": "green"},
-                                            hover_name="img_id",
-                                            log_x=False, size_max=60)
-
-    return columns, img_table.tail().to_dict('rows'), fig
-
-    """""
-    simulation_parameters.sim_duration = sim_dur
-    simulation_parameters.num_rads = num_rads
-    simulation_parameters.arr_rate_1 = arr_rate_1
-    simulation_parameters.arr_rate_2 = arr_rate_2
-    simulation_parameters.arr_rate_3 = arr_rate_3
-    simulation_parameters.proc_rate_1 = proc_rate_1
-    simulation_parameters.proc_rate_2 = proc_rate_2
-    simulation_parameters.proc_rate_3 = proc_rate_3
-    simulation_parameters.cutoff = cutoff
-    simulation_parameters.percent_special = per_spec
-    simulation_parameters.verbose = verbose_val
-    """""
+    #Everything the run depends on, passed explicitly to the worker
+    config = vru.SimConfig(
+        sim_time=float(sim_duration) * 60,
+        rads_count=int(num_rads),
+        arr_rates=[float(r) for r in (arr_rate_1, arr_rate_2, arr_rate_3)],
+        urg_times=[float(r) for r in (proc_rate_1, proc_rate_2, proc_rate_3)],
+        cutoff=bool(cutoff_val),
+        verbose=bool(verb_val),
+        router=routing_policy,
+        seed=None if seed is None else int(seed),
+    )
+    key = scenario_key(config, targ_rates, perc_special)
+    if key is not None and key in result_cache:
+        return {"job_id": None, "key": key}
+    #Run in the background, the poll callback fills in the results
+    return {"job_id": jobs.submit(config), "key": key}
+
+
+@app.callback([
+                Output("sim-progress", "children"),
+                Output("sim-result", "data"),
+                Output("results-table", "columns"),
+                Output("sim-poll", "disabled")
+            ],
+            [Input("sim-poll", "n_intervals"), Input("sim-job", "data")],
+            )
+def poll_simulation(n_intervals, job):
+    if job is None:
+        raise PreventUpdate
+    if job["job_id"] is None:
+        if load_result(job) is None:
+            if presets.pending(job["key"]):
+                #a preset computed by another worker, it shows up in the shared cache
+                return "Preset still computing...", dash.no_update, dash.no_update, False
+            return "Cached result expired, run the simulation again", dash.no_update, dash.no_update, True
+        return "Loaded from cache", job, results_columns, True
+    status = jobs.status(job["job_id"])
+    if status["state"] in ("queued", "running", "unknown"):
+        return progress_text(status), dash.no_update, dash.no_update, False
+    if load_result(job) is None:
+        return progress_text(status), dash.no_update, dash.no_update, True
+    return progress_text(status), job, results_columns, True
+
+
+def live_figure():
+    #Empty traces filled in by extendData while the run goes on
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=[], y=[], name="backlog", line={"color": "black"}, yaxis="y2"))
+    for urg, color in vrad_views.urgency_colors.items():
+        fig.add_trace(go.Scatter(x=[], y=[], name=f"wait p90, urgency {urg}", line={"color": color}))
+    fig.update_layout(title="Live snapshots", xaxis_title="time", yaxis_title="wait time, p90 over the window",
+                      yaxis2={"title": "backlog", "overlaying": "y", "side": "right"})
+    return fig
+
+
+@app.callback([
+                Output("live-graph", "figure"),
+                Output("live-graph", "extendData"),
+                Output("sim-live-offset", "data")
+            ],
+            [Input("sim-job", "data"), Input("sim-poll", "n_intervals")],
+            [State("sim-live-offset", "data")],
+            )
+def stream_snapshots(job, n_intervals, offset):
+    #A new job clears the graph, then only the deltas published since the last poll are sent
+    if job is None:
+        raise PreventUpdate
+    triggered = [t["prop_id"] for t in dash.callback_context.triggered]
+    if "sim-job.data" in triggered:
+        return live_figure(), dash.no_update, 0
+    if job["job_id"] is None:
+        raise PreventUpdate
+    deltas, offset = jobs.snapshots(job["job_id"], offset or 0)
+    if not deltas:
+        raise PreventUpdate
+    times = [delta["time"] for delta in deltas]
+    ys = [[delta["backlog"] for delta in deltas]]
+    for urg in vrad_views.urgency_colors:
+        ys.append([delta["wait_p90"].get(str(urg)) for delta in deltas])
+    return dash.no_update, ({"x": [times] * len(ys), "y": ys}, list(range(len(ys)))), offset
+
+
+def idle_figure(timeline):
+    #One WebGL line trace per state, segments separated by gaps, instead of one bar per segment
+    fig = go.Figure()
+    for busy, color, label in ((False, "red", "idle"), (True, "orange", "busy")):
+        seg = timeline[timeline["busy"] == busy]
+        x = np.full((len(seg), 3), np.nan)
+        x[:, 0] = seg["start"].to_numpy()
+        x[:, 1] = x[:, 0] + seg["duration"].to_numpy()
+        y = np.repeat(seg["rad_id"].to_numpy(dtype=float)[:, None], 3, axis=1)
+        y[:, 2] = np.nan
+        fig.add_trace(go.Scattergl(x=x.ravel(), y=y.ravel(), mode="lines", name=label,
+                                   line={"color": color, "width": 8}))
+    fig.update_layout(title="Idle and busy time", xaxis_title="time", yaxis_title="Radiologist ID")
+    return fig
+
+
+@app.callback(Output("idle-graph", "figure"), [Input("sim-result", "data")])
+def update_idle_graph(job):
+    result = None if job is None else load_result(job)
+    if result is None or "timeline" not in result:
+        raise PreventUpdate
+    return idle_figure(result["timeline"])
+
+
+@app.callback(Output("results-graph", "figure"),
+            [Input("sim-result", "data"), Input("results-graph", "relayoutData")],
+            )
+def update_results_graph(job, relayout_data):
+    #Re-aggregated on every zoom, so the detail follows the visible range
+    result = None if job is None else load_result(job)
+    if result is None:
+        raise PreventUpdate
+    triggered = [t["prop_id"] for t in dash.callback_context.triggered]
+    if "sim-result.data" in triggered:
+        relayout_data = None
+    elif not relayout_data or not any(k.startswith(("xaxis.", "yaxis.")) for k in relayout_data):
+        raise PreventUpdate
+    fig = vrad_views.results_figure(result["img_table"], relayout_range(relayout_data, "xaxis"), relayout_range(relayout_data, "yaxis"))
+    fig.update_layout(uirevision=job["key"] or job["job_id"])
+    return fig
+
+
+@app.callback([
+                Output("results-table", "data"),
+                Output("results-table", "page_count"),
+                Output("results-count", "children")
+            ],
+            [
+                Input("sim-result", "data"),
+                Input("results-table", "page_current"),
+                Input("results-table", "page_size"),
+                Input("results-table", "sort_by"),
+                Input("results-table", "filter_query")
+            ],
+            )
+def update_table_page(job, page_current, page_size, sort_by, filter_query):
+    #Only the visible page is serialized, sorting and filtering run on the server
+    result = None if job is None else load_result(job)
+    if result is None:
+        raise PreventUpdate
+    sort_by = tuple((col["column_id"], col["direction"]) for col in sort_by or [])
+    positions = table_view(job["key"], job["job_id"], sort_by, filter_query or "")
+    img_table = result["img_table"]
+    page, page_count = vrad_views.table_page(img_table, positions, page_current, page_size)
+    return page.to_dict("records"), page_count, f"{len(positions)} of {len(img_table)} studies"
+
+
+@app.callback(Output("sim-cancel-note", "children"),
+            [Input("button-cancel-sim", "n_clicks")],
+            [State("sim-job", "data")],
+            )
+def cancel_simulation(n_clicks, job):
+    if not n_clicks or job is None or job["job_id"] is None:
+        raise PreventUpdate
+    jobs.cancel(job["job_id"])
+    return job["job_id"]
 
 
 
@@ -0,0 +1,218 @@
+import math
+import os
+import pathlib
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+# File extension and PIL format of the supported tile formats
+TILE_FORMATS = {"jpeg": ("jpg", "JPEG"), "webp": ("webp", "WEBP"), "png": ("png", "PNG")}
+
+# Levels larger than this are halved into a memory-mapped file rather than in memory
+MAX_IN_MEMORY_BYTES = 256 * 2 ** 20
+
+# Where the viewer loads OpenSeadragon from, a CDN unless set to a local copy, see README.md
+OPENSEADRAGON_URL = os.environ.get(
+    "OPENSEADRAGON_URL", "https://cdn.jsdelivr.net/npm/openseadragon@4.1/build/openseadragon/"
+)
+
+# Temporary directories of pyramids older than this (in seconds) are left over by a dead writer
+STALE_TMP_AGE = 24 * 3600
+
+VIEWER_HTML = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<script src="{osd}openseadragon.min.js"></script>
+<style>html, body, #viewer {{margin: 0; width: 100%; height: 100%; background: #111;}}</style>
+</head>
+<body>
+<div id="viewer"></div>
+<script>
+// Contrast and brightness sliders go from 0 to 1, 0.5 leaves the image unchanged
+var params = new URLSearchParams(window.location.search);
+var contrast = 2 * parseFloat(params.get("contrast") || "0.5");
+var brightness = 2 * parseFloat(params.get("brightness") || "0.5");
+document.getElementById("viewer").style.filter =
+    "contrast(" + contrast + ") brightness(" + brightness + ")";
+OpenSeadragon({{
+    id: "viewer",
+    tileSources: "{dzi}",
+    prefixUrl: "{osd}images/",
+    showNavigator: true,
+}});
+</script>
+</body>
+</html>
+"""
+
+
+def level_count(width, height):
+    # Number of levels of the pyramid, the last one at full resolution and the first one 1 x 1
+    return int(math.ceil(math.log2(max(width, height, 1)))) + 1
+
+
+def _halve(img, out, band_rows=512):
+    # 2 x 2 block means of img written into out, band_rows output rows at a time
+    height, width = img.shape[:2]
+    for start in range(0, out.shape[0], band_rows):
+        block = img[2 * start : 2 * (start + band_rows)].astype(np.float32)
+        pad = ((0, block.shape[0] % 2), (0, width % 2)) + ((0, 0),) * (img.ndim - 2)
+        block = np.pad(block, pad, mode="edge")
+        block = block.reshape((block.shape[0] // 2, 2, block.shape[1] // 2, 2) + img.shape[2:])
+        out[start : start + band_rows] = np.rint(block.mean(axis=(1, 3)))
+
+
+def _save_tile(tile, path, pil_format, quality):
+    Image.fromarray(np.ascontiguousarray(tile)).save(path, pil_format, quality=quality)
+
+
+def write_deepzoom(image, out_dir, name="image", tile_size=254, overlap=1, fmt="jpeg", quality=90,
+                   max_workers=None):
+    """
+    Write a DeepZoom tile pyramid of a uint8 image.
+
+    Level ``level_count - 1`` is the image itself and every level below
+    is half the size of the next one. Each level is cut into
+    ``tile_size`` tiles, overlapping their neighbors by ``overlap``
+    pixels, saved as ``<out_dir>/<name>_files/<level>/<col>_<row>.<ext>``
+    next to the ``<name>.dzi`` descriptor, so a DeepZoom viewer only
+    fetches the tiles of its viewport. ``image`` may be an ``np.memmap``
+    such as the output of ``registration.stitch_directory``: levels are
+    read band by band and large ones are halved into temporary
+    memory-mapped files. Tiles are encoded on ``max_workers`` threads.
+    Returns the path of the ``.dzi`` file.
+    """
+    try:
+        ext, pil_format = TILE_FORMATS[fmt]
+    except KeyError:
+        raise ValueError(f"fmt should be one of {tuple(TILE_FORMATS)}") from None
+    out_dir = pathlib.Path(out_dir)
+    files_dir = out_dir / f"{name}_files"
+    files_dir.mkdir(parents=True, exist_ok=True)
+    height, width = image.shape[:2]
+    n_levels = level_count(width, height)
+
+    level_img = image
+    with ThreadPoolExecutor(max_workers) as executor:
+        for level in range(n_levels - 1, -1, -1):
+            level_dir = files_dir / str(level)
+            level_dir.mkdir(exist_ok=True)
+            level_height, level_width = level_img.shape[:2]
+            futures = []
+            for row in range(int(math.ceil(level_height / tile_size))):
+                for col in range(int(math.ceil(level_width / tile_size))):
+                    top = max(row * tile_size - overlap, 0)
+                    left = max(col * tile_size - overlap, 0)
+                    tile = level_img[top : (row + 1) * tile_size + overlap, left : (col + 1) * tile_size + overlap]
+                    futures.append(executor.submit(
+                        _save_tile, np.array(tile), level_dir / f"{col}_{row}.{ext}", pil_format, quality
+                    ))
+            for future in futures:
+                future.result()
+            if level == 0:
+                break
+            shape = ((level_height + 1) // 2, (level_width + 1) // 2) + image.shape[2:]
+            if np.prod(shape) > MAX_IN_MEMORY_BYTES:
+                halved = np.lib.format.open_memmap(
+                    out_dir / f"level_{level - 1}.npy", mode="w+", dtype=np.uint8, shape=shape
+                )
+            else:
+                halved = np.empty(shape, dtype=np.uint8)
+            _halve(level_img, halved)
+            _remove_level(level_img, image)
+            level_img = halved
+
+    dzi_path = out_dir / f"{name}.dzi"
+    with open(dzi_path, "w") as file:
+        file.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" Format="{ext}" '
+            f'Overlap="{overlap}" TileSize="{tile_size}">\n'
+            f'  <Size Width="{width}" Height="{height}"/>\n'
+            "</Image>\n"
+        )
+    with open(out_dir / "viewer.html", "w") as file:
+        file.write(VIEWER_HTML.format(osd=OPENSEADRAGON_URL, dzi=dzi_path.name))
+    return dzi_path
+
+
+def _remove_level(level_img, image):
+    # Temporary file of a halved level, once the next level is written
+    if level_img is not image and isinstance(level_img, np.memmap):
+        os.remove(level_img.filename)
+
+
+def write_deepzoom_once(image, root_dir, key, max_bytes=None, **kwargs):
+    """
+    Write the pyramid of ``image`` to ``<root_dir>/<key>`` unless it is
+    already there, for instance with ``key`` a hash of the image.
+
+    The pyramid is written to a temporary directory that is then renamed,
+    so concurrent requests never serve a partial pyramid. With
+    ``max_bytes``, the least recently used pyramids of ``root_dir`` are
+    then pruned, see ``prune_pyramids``. Returns the directory of the
+    pyramid.
+    """
+    root_dir = pathlib.Path(root_dir)
+    pyramid_dir = root_dir / key
+    if touch_pyramid(root_dir, key):
+        return pyramid_dir
+    tmp_dir = tempfile.mkdtemp(prefix=f"{key}.", suffix=".tmp", dir=root_dir)
+    try:
+        write_deepzoom(image, tmp_dir, **kwargs)
+        os.rename(tmp_dir, pyramid_dir)
+    except OSError:
+        # Written meanwhile by another thread or process, or the write failed
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not pyramid_dir.exists():
+            raise
+    if max_bytes is not None:
+        prune_pyramids(root_dir, max_bytes, keep=(key,))
+    return pyramid_dir
+
+
+def touch_pyramid(root_dir, key):
+    # Mark a pyramid as recently used, False if it is not there
+    try:
+        os.utime(pathlib.Path(root_dir) / key)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def _tree_bytes(path):
+    return sum(entry.stat().st_size for entry in pathlib.Path(path).rglob("*") if entry.is_file())
+
+
+def prune_pyramids(root_dir, max_bytes, keep=()):
+    """
+    Remove the least recently used pyramids of ``root_dir`` until the
+    others fit in ``max_bytes``, never removing the pyramids named in
+    ``keep``. Use is tracked by the modification time of the pyramid
+    directories, updated by ``touch_pyramid``. Temporary directories left
+    over by writers that died are removed as well.
+    """
+    now = time.time()
+    pyramids = []
+    for path in pathlib.Path(root_dir).iterdir():
+        try:
+            mtime = path.stat().st_mtime
+        except FileNotFoundError:
+            continue
+        if path.suffix == ".tmp":
+            if now - mtime > STALE_TMP_AGE:
+                shutil.rmtree(path, ignore_errors=True)
+        else:
+            pyramids.append((mtime, path))
+    total = 0
+    for mtime, path in sorted(pyramids, reverse=True):
+        size = _tree_bytes(path)
+        if path.name not in keep and total + size > max_bytes:
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            total += size
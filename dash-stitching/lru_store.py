@@ -0,0 +1,127 @@
+import os
+import pathlib
+import threading
+from collections import OrderedDict
+
+
+class LRUStore:
+    """
+    Bounded in-memory LRU store with an optional on-disk tier, keyed by
+    strings such as content hashes.
+
+    The memory tier holds at most ``max_bytes`` of values and evicts the
+    least recently used ones first. When ``disk_dir`` is given, values are
+    also written there, one ``<key><suffix>`` file each, so they survive
+    restarts and every process sharing the directory can read them. Past
+    ``disk_max_bytes`` the least recently used files are removed. Files are
+    written under a unique name then renamed, so readers never load a
+    partial file, and several processes may prune the directory at once.
+
+    Subclasses set ``suffix`` and ``load_errors`` and implement
+    ``_nbytes``, ``_load_file`` and ``_dump_file``.
+    """
+
+    suffix = ""
+    # Errors of _load_file meaning a missing or unreadable file, read as a miss
+    load_errors = (OSError,)
+
+    def __init__(self, max_bytes, disk_dir=None, disk_max_bytes=2 * 2 ** 30):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.disk_dir = None
+        self.disk_max_bytes = disk_max_bytes
+        if disk_dir is not None:
+            self.disk_dir = pathlib.Path(disk_dir)
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+    def _nbytes(self, value):
+        raise NotImplementedError
+
+    def _load_file(self, file):
+        raise NotImplementedError
+
+    def _dump_file(self, file, value):
+        raise NotImplementedError
+
+    def _path(self, key):
+        return self.disk_dir / f"{key}{self.suffix}"
+
+    def __contains__(self, key):
+        with self.lock:
+            if key in self.entries:
+                return True
+        return self.disk_dir is not None and self._path(key).exists()
+
+    def get(self, key):
+        # The value, or None if it was never stored or has been evicted
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key][0]
+        value = self._load(key)
+        if value is not None:
+            self._put_memory(key, value)
+        return value
+
+    def put(self, key, value, disk=True):
+        self._put_memory(key, value)
+        if disk:
+            self._dump(key, value)
+
+    def _put_memory(self, key, value):
+        nbytes = self._nbytes(value)
+        if nbytes > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.nbytes -= self.entries.pop(key)[1]
+            self.entries[key] = (value, nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                self.nbytes -= self.entries.popitem(last=False)[1][1]
+
+    def _load(self, key):
+        if self.disk_dir is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as file:
+                value = self._load_file(file)
+            # Marks the file as recently used for the pruning
+            os.utime(path)
+        except self.load_errors:
+            return None
+        return value
+
+    def _dump(self, key, value):
+        if self.disk_dir is None:
+            return
+        path = self._path(key)
+        tmp_path = self.disk_dir / f"{key}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as file:
+            self._dump_file(file, value)
+        os.replace(tmp_path, path)
+        self._prune()
+
+    def _prune(self):
+        # Other processes prune the same directory, a file can vanish at any point
+        files = []
+        for file_path in self.disk_dir.glob(f"*{self.suffix}"):
+            try:
+                stat = file_path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, file_path))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        # The newest file, just written, is always kept
+        for _, size, file_path in files[:-1]:
+            if total <= self.disk_max_bytes:
+                break
+            total -= size
+            try:
+                file_path.unlink()
+            except FileNotFoundError:
+                continue
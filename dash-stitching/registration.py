@@ -1,6 +1,24 @@
+import functools
+import os
+import re
+import warnings
+
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from skimage import io, measure, feature
-from scipy import ndimage
+from scipy import ndimage, sparse, fft
+from scipy.sparse.linalg import lsqr
+
+try:
+    from skimage.registration import phase_cross_correlation
+
+    def _register_translation(src_image, target_image):
+        # Unnormalized cross-correlation, as feature.register_translation computed it
+        return phase_cross_correlation(src_image, target_image, normalization=None)
+
+
+except ImportError:  # scikit-image < 0.19
+    _register_translation = feature.register_translation
 
 
 def autocrop(img):
@@ -17,10 +35,392 @@ def autocrop(img):
     return img[slices]
 
 
-def _blending_mask(shape):
-    mask = np.zeros(shape, dtype=np.int)
-    mask[1:-1, 1:-1] = 1
-    return ndimage.distance_transform_cdt(mask) + 1
+BLENDING_MODES = ("distance", "feather", "none")
+
+
+@functools.lru_cache(maxsize=32)
+def _blending_mask(shape, mode="distance"):
+    """
+    Weight of every pixel of a tile when compositing, as a read-only
+    float32 array cached by (shape, mode).
+
+    'distance' is the chessboard distance to the tile border plus one,
+    'feather' the outer product of the 1-D distances to the borders plus
+    one, and 'none' uniform weights. Both are broadcast from 1-D ramps, so
+    building them is O(l_r + l_c) plus filling the mask.
+    """
+    if mode not in BLENDING_MODES:
+        raise ValueError(f"blending mode should be one of {BLENDING_MODES}")
+    ramps = [np.minimum(np.arange(size), np.arange(size)[::-1]).astype(np.float32) + 1 for size in shape]
+    if mode == "distance":
+        mask = np.minimum.outer(*ramps)
+    elif mode == "feather":
+        mask = np.multiply.outer(*ramps)
+    else:
+        mask = np.ones(shape, dtype=np.float32)
+    mask.flags.writeable = False
+    return mask
+
+
+def _blending_mode(blending):
+    # blending=True keeps the distance weights it always used, False weighs tiles uniformly
+    if isinstance(blending, str):
+        return blending
+    return "distance" if blending else "none"
+
+
+def _accumulate(canvas, weights, tile, tile_slice, mask, buffer):
+    # Add a weighted tile to the canvas, multiplying into a reused buffer
+    np.multiply(tile, mask if tile.ndim == 2 else mask[..., np.newaxis], out=buffer)
+    canvas[tile_slice] += buffer
+    weights[tile_slice] += mask
+
+
+# ITU-R BT.709 luma weights, as skimage.color.rgb2gray
+LUMINANCE_WEIGHTS = np.array([0.2125, 0.7154, 0.0721], dtype=np.float32)
+
+
+def _luminance(img, channel=None):
+    # Single-channel float32 projection of a tile or strip used for registration
+    if img.ndim == 2:
+        return img.astype(np.float32)
+    if channel is not None:
+        return img[..., channel].astype(np.float32)
+    return img[..., :3].astype(np.float32) @ LUMINANCE_WEIGHTS
+
+
+def _tile_pairs(n_rows, n_cols, all_pairs=False):
+    """
+    Neighboring pairs registered against each other: down the first
+    column (every column with ``all_pairs``), then along every row.
+    Tiles are (row, column) tuples.
+    """
+    vert_cols = range(n_cols) if all_pairs else range(1)
+    pairs = [
+        ((i_rows - 1, j_cols), (i_rows, j_cols))
+        for i_rows in range(1, n_rows)
+        for j_cols in vert_cols
+    ]
+    pairs += [
+        ((i_rows, j_cols), (i_rows, j_cols + 1))
+        for i_rows in range(n_rows)
+        for j_cols in range(n_cols - 1)
+    ]
+    return pairs
+
+
+def _pair_strips(imgs, pair, overlap):
+    # Overlapping strips of the two tiles of a pair, given their expected overlap
+    (i_orig, j_orig), (i_target, j_target) = pair
+    return _strips(imgs[i_orig, j_orig], imgs[i_target, j_target], i_target > i_orig, overlap)
+
+
+def _strips(tile_orig, tile_target, vertical, overlap):
+    l_r, l_c = tile_orig.shape[:2]
+    if vertical:
+        return (
+            tile_orig[-overlap[0] :, : (l_c - overlap[1])],
+            tile_target[: overlap[0], -(l_c - overlap[1]) :],
+        )
+    if overlap[0] < 0:
+        rows_1 = slice(-(l_r + overlap[0]), None)
+        rows_2 = slice(None, l_r + overlap[0])
+    else:
+        rows_1 = slice(None, l_r - overlap[0])
+        rows_2 = slice(-(l_r - overlap[0]), None)
+    return tile_orig[rows_1, -overlap[1] :], tile_target[rows_2, : overlap[1]]
+
+
+def batch_register(src_strips, target_strips, workers=None):
+    """
+    Register many pairs of same-shaped strips at once.
+
+    Computes the same unnormalized cross-correlation as
+    ``_register_translation``, but with one batched real FFT per stack
+    (``scipy.fft.rfftn`` with ``workers`` threads, about half the work of
+    a complex FFT) and a vectorized peak search over all pairs.
+
+    Returns
+    -------
+
+    shifts: ndarray of shape (n_pairs, strip.ndim)
+    errors: ndarray of shape (n_pairs,)
+        Translation invariant RMS error of each registration.
+    """
+    src = np.stack(src_strips).astype(np.float64)
+    target = np.stack(target_strips).astype(np.float64)
+    if src.shape != target.shape:
+        raise ValueError("images must be same shape")
+    shape = src.shape[1:]
+    axes = tuple(range(1, src.ndim))
+    src_freq = fft.rfftn(src, axes=axes, workers=workers)
+    target_freq = fft.rfftn(target, axes=axes, workers=workers)
+    cross_correlation = fft.irfftn(src_freq * target_freq.conj(), s=shape, axes=axes, workers=workers)
+    cross_correlation = cross_correlation.reshape(len(src), -1)
+    maxima = np.argmax(np.abs(cross_correlation), axis=1)
+    cc_max = cross_correlation[np.arange(len(src)), maxima]
+    shifts = np.stack(np.unravel_index(maxima, shape), axis=1).astype(np.float64)
+    size = np.array(shape)
+    midpoints = np.trunc(size / 2)
+    shifts = np.where(shifts > midpoints, shifts - size, shifts)
+    shifts[:, size == 1] = 0
+    # Parseval: the spectral amplitudes of skimage are the sums of squares
+    src_amp = (src ** 2).sum(axis=axes)
+    target_amp = (target ** 2).sum(axis=axes)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        errors = np.sqrt(np.abs(1.0 - cc_max ** 2 / (src_amp * target_amp)))
+    return shifts, errors
+
+
+def _downscale(stack, factor):
+    # Block means of factor x factor pixels of a stack of images
+    n, l_r, l_c = stack.shape[:3]
+    h, w = l_r // factor, l_c // factor
+    blocks = stack[:, : h * factor, : w * factor].reshape((n, h, factor, w, factor) + stack.shape[3:])
+    return blocks.mean(axis=(2, 4))
+
+
+def _window_ncc(src, target, workers=None):
+    """
+    Normalized cross-correlation of a stack of crops with a stack of
+    larger search regions, at every offset where the crop fits inside.
+
+    ``target`` is larger than ``src`` by 2 * window along the first two
+    axes, the result is of shape (n, 2 * window + 1, 2 * window + 1).
+    Color channels are summed over.
+    """
+    src = src.astype(np.float64)
+    target = target.astype(np.float64)
+    crop = src.shape[1:3]
+    n_offsets = tuple(np.array(target.shape[1:3]) - crop + 1)
+    src -= src.mean(axis=tuple(range(1, src.ndim)), keepdims=True)
+    padded = np.zeros_like(target)
+    padded[:, : crop[0], : crop[1]] = src
+    # The crop sits at the origin of the padded stack, so offsets up to 2 * window do not wrap
+    cross_correlation = fft.irfftn(
+        fft.rfftn(target, axes=(1, 2), workers=workers) * fft.rfftn(padded, axes=(1, 2), workers=workers).conj(),
+        s=target.shape[1:3], axes=(1, 2), workers=workers,
+    )
+    cross_correlation = cross_correlation.reshape(target.shape[:3] + (-1,)).sum(axis=3)
+    cross_correlation = cross_correlation[:, : n_offsets[0], : n_offsets[1]]
+
+    def window_sums(stack):
+        # Sums over every crop-sized window, from a summed-area table
+        stack = stack.reshape(target.shape[:3] + (-1,)).sum(axis=3)
+        table = np.pad(stack.cumsum(axis=1).cumsum(axis=2), ((0, 0), (1, 0), (1, 0)))
+        return (
+            table[:, crop[0] :, crop[1] :] - table[:, : n_offsets[0], crop[1] :]
+            - table[:, crop[0] :, : n_offsets[1]] + table[:, : n_offsets[0], : n_offsets[1]]
+        )
+
+    n_pixels = src[0].size
+    target_var = window_sums(target ** 2) - window_sums(target) ** 2 / n_pixels
+    src_var = (src ** 2).sum(axis=tuple(range(1, src.ndim)))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ncc = cross_correlation / np.sqrt(np.maximum(target_var, 0) * src_var[:, np.newaxis, np.newaxis])
+    return np.nan_to_num(ncc)
+
+
+def pyramid_register(src_strips, target_strips, workers=None, factor=4, crop_size=128):
+    """
+    Coarse-to-fine version of ``batch_register``.
+
+    Shifts are first estimated on strips downscaled ``factor`` times, then
+    refined at full resolution on a crop of at most ``crop_size`` pixels
+    per side of the overlapping part, by normalized cross-correlation
+    (``_window_ncc``) over the ``factor`` pixels around the coarse shift,
+    so full resolution FFTs only touch the small crops.
+    Returns the same as ``batch_register``, the error being
+    sqrt(1 - ncc ** 2) at the best shift.
+    """
+    src = np.stack(src_strips)
+    target = np.stack(target_strips)
+    if src.shape != target.shape:
+        raise ValueError("images must be same shape")
+    shape = np.array(src.shape[1:3])
+    # Keep a few pixels per axis at the coarse level
+    factor = int(max(1, min(factor, shape.min() // 4)))
+    if factor == 1:
+        return batch_register(src, target, workers)
+    coarse, _ = batch_register(_downscale(src, factor), _downscale(target, factor), workers)
+    coarse = coarse[:, :2].astype(int) * factor
+    window = factor
+    crop = np.clip(shape - np.abs(coarse).max(axis=0) - 2 * window, 1, crop_size)
+    src_crops, target_crops, offsets = [], [], []
+    for src_strip, target_strip, shift in zip(src, target, coarse):
+        # src(x) matches target(x - shift): center the crop on the common part
+        low = np.maximum(0, shift)
+        high = np.minimum(shape, shape + shift)
+        start = np.clip((low + high - crop) // 2, 0, shape - crop)
+        target_start = np.clip(start - shift - window, 0, shape - crop - 2 * window)
+        src_crops.append(src_strip[start[0] : start[0] + crop[0], start[1] : start[1] + crop[1]])
+        target_crops.append(target_strip[
+            target_start[0] : target_start[0] + crop[0] + 2 * window,
+            target_start[1] : target_start[1] + crop[1] + 2 * window,
+        ])
+        offsets.append(start - target_start)
+    ncc = _window_ncc(np.stack(src_crops), np.stack(target_crops), workers)
+    peaks = ncc.reshape(len(src), -1).argmax(axis=1)
+    best = ncc.reshape(len(src), -1)[np.arange(len(src)), peaks]
+    shifts = np.zeros((len(src), src.ndim - 1))
+    shifts[:, :2] = np.array(offsets) - np.stack(np.unravel_index(peaks, ncc.shape[1:]), axis=1)
+    errors = np.sqrt(1 - np.clip(best, 0, 1) ** 2)
+    return shifts, errors
+
+
+def pair_shifts(imgs, n_rows, n_cols, overlap_global=None, overlap_local=None, max_workers=None,
+                all_pairs=False, backend="batched", batch_size=64, pyramid=1, channel=None):
+    """
+    Register pairs of neighboring tiles.
+
+    With the 'batched' backend, strips of the same shape are registered
+    ``batch_size`` pairs at a time by ``batch_register``, whose FFTs use
+    ``max_workers`` threads (all cores by default). With 'pairwise', each
+    pair is registered separately on a thread pool of ``max_workers``
+    threads, the FFTs releasing the GIL. With ``all_pairs`` every
+    horizontal and vertical pair is registered, otherwise only the
+    spanning chain used by ``tile_positions``. With ``pyramid`` > 1, pairs
+    are registered coarse-to-fine by ``pyramid_register``, ``pyramid``
+    being the downscaling factor of the coarse level. Color tiles are
+    registered on their luminance, or on ``channel`` if given, so shifts
+    are always 2-D.
+
+    Returns
+    -------
+
+    pairs: dict
+        pairs[(tile, neighbor)] is the (overlap, shift, confidence) of the
+        pair: the expected overlap, the residual shift found by registration
+        and the height of the normalized correlation peak, between 0 and 1.
+    """
+    overlaps = _pair_overlaps(n_rows, n_cols, imgs.shape[2], overlap_global, overlap_local, all_pairs)
+    strips = {
+        pair: tuple(_luminance(strip, channel) for strip in _pair_strips(imgs, pair, overlaps[pair]))
+        for pair in overlaps
+    }
+    results = _register_strips(strips, max_workers, backend, batch_size, pyramid)
+    return {pair: (overlaps[pair],) + results[pair] for pair in overlaps}
+
+
+def _pair_overlaps(n_rows, n_cols, l_r, overlap_global=None, overlap_local=None, all_pairs=False):
+    # Expected overlap of every pair, from overlap_local or else overlap_global
+    if overlap_global is None:
+        overlap_global = 0.15
+    overlap_value = int(float(overlap_global) * l_r)
+    overlaps = {}
+    for pair in _tile_pairs(n_rows, n_cols, all_pairs):
+        index_orig, index_target = (np.ravel_multi_index(tile, (n_rows, n_cols)) for tile in pair)
+        try:
+            overlaps[pair] = overlap_local[(index_orig, index_target)]
+        except (KeyError, TypeError):
+            if pair[1][0] > pair[0][0]:
+                overlaps[pair] = np.array([overlap_value, 0])
+            else:
+                overlaps[pair] = np.array([0, overlap_value])
+    return overlaps
+
+
+def _register_strips(strips, max_workers=None, backend="batched", batch_size=64, pyramid=1):
+    # (shift, confidence) of every pair of strips, see pair_shifts
+    def register_batch(src_strips, target_strips, workers):
+        if pyramid > 1:
+            return pyramid_register(src_strips, target_strips, workers, pyramid)
+        return batch_register(src_strips, target_strips, workers)
+
+    if backend == "batched":
+        groups = {}
+        for pair, (src, target) in strips.items():
+            groups.setdefault((src.shape, target.shape), []).append(pair)
+        results = {}
+        workers = -1 if max_workers is None else max_workers
+        for group in groups.values():
+            for start in range(0, len(group), batch_size):
+                batch = group[start : start + batch_size]
+                shifts, errors = register_batch(
+                    [strips[pair][0] for pair in batch],
+                    [strips[pair][1] for pair in batch],
+                    workers,
+                )
+                results.update(zip(batch, zip(shifts, 1 - errors)))
+        return results
+    if backend == "pairwise":
+        def register(pair):
+            if pyramid > 1:
+                shifts, errors = pyramid_register(*([strip] for strip in strips[pair]), 1, pyramid)
+                return shifts[0], 1 - errors[0]
+            shift, error, _ = _register_translation(*strips[pair])
+            return shift, 1 - error
+
+        with ThreadPoolExecutor(max_workers) as executor:
+            return dict(zip(strips, executor.map(register, strips)))
+    raise ValueError("backend should be 'batched' or 'pairwise'")
+
+
+def _pair_offset(pair, overlap, shift, tile_shape):
+    # Measured offset between the top-left corners of the two tiles of a pair
+    (i_orig, _), (i_target, _) = pair
+    l_r, l_c = tile_shape
+    offset_r = int(shift[0]) - overlap[0]
+    offset_c = int(shift[1]) - overlap[1]
+    if i_target > i_orig:
+        offset_r += l_r
+    else:
+        offset_c += l_c
+    return offset_r, offset_c
+
+
+def tile_positions(pairs, n_rows, n_cols, tile_shape, pad):
+    # Top-left corner of every tile on the canvas, chaining the pair shifts
+    l_r, l_c = tile_shape
+    positions = np.empty((n_rows, n_cols, 2), dtype=int)
+    positions[0, 0] = pad, pad
+    for pair, (overlap, shift, _) in pairs.items():
+        offset_r, offset_c = _pair_offset(pair, overlap, shift, tile_shape)
+        init_r, init_c = positions[pair[0]]
+        positions[pair[1]] = init_r + offset_r, init_c + offset_c
+    return positions
+
+
+def global_positions(pairs, n_rows, n_cols, tile_shape, pad, min_confidence=1e-3):
+    """
+    Top-left corner of every tile from a weighted least-squares fit of all
+    pair offsets.
+
+    Each registered pair gives one equation, position[neighbor] -
+    position[tile] = measured offset, weighted by the pair's correlation
+    confidence, so a single bad pair is outvoted by its neighbors instead
+    of shifting every tile after it. The sparse system is solved with
+    ``scipy.sparse.linalg.lsqr``, tile (0, 0) anchors the solution, and
+    the positions are then moved so that the top-left-most tile sits at
+    ``pad``.
+    """
+    n_tiles = n_rows * n_cols
+    n_pairs = len(pairs)
+    rows = np.repeat(np.arange(n_pairs), 2)
+    cols = np.empty(2 * n_pairs, dtype=int)
+    values = np.tile([-1.0, 1.0], n_pairs)
+    offsets = np.empty((n_pairs, 2))
+    weights = np.empty(n_pairs)
+    for k, (pair, (overlap, shift, confidence)) in enumerate(pairs.items()):
+        cols[2 * k : 2 * k + 2] = [np.ravel_multi_index(tile, (n_rows, n_cols)) for tile in pair]
+        offsets[k] = _pair_offset(pair, overlap, shift, tile_shape)
+        weights[k] = np.sqrt(max(confidence, min_confidence))
+    # Anchor equation for tile (0, 0)
+    anchor_weight = weights.sum() + 1
+    matrix = sparse.csr_matrix(
+        (
+            np.append(values * np.repeat(weights, 2), anchor_weight),
+            (np.append(rows, n_pairs), np.append(cols, 0)),
+        ),
+        shape=(n_pairs + 1, n_tiles),
+    )
+    positions = np.empty((n_tiles, 2))
+    for axis in range(2):
+        rhs = np.append(offsets[:, axis] * weights, 0)
+        positions[:, axis] = lsqr(matrix, rhs, atol=1e-10, btol=1e-10)[0]
+    positions = np.rint(positions).astype(int)
+    positions += pad - positions.min(axis=0)
+    return positions.reshape(n_rows, n_cols, 2)
 
 
 def register_tiles(
@@ -31,6 +431,10 @@ def register_tiles(
     overlap_local=None,
     pad=None,
     blending=True,
+    max_workers=None,
+    placement="chain",
+    pyramid=1,
+    channel=None,
 ):
     """
     Stitch together overlapping tiles of a mosaic, using Fourier-based
@@ -52,98 +456,213 @@ def register_tiles(
         of (x, y) shifts giving the 2D shift vector between tiles i and j.
         Indices (i, j) are the raveled indices of the tile numbers.
     pad : int
-        Value of the padding used at the border of the stitched image. An
-        autocrop is performed at the end to remove the unnecessary padding.
+        Deprecated and ignored, the canvas is sized from the tile positions.
+    blending : bool or {'distance', 'feather', 'none'}
+        Weights of overlapping tiles, see ``_blending_mask``. True is
+        'distance' and False 'none'.
+    max_workers : int
+        Number of threads registering pairs of tiles, see ``pair_shifts``.
+    placement : {'chain', 'global'}
+        'chain' places each tile from a single neighbor
+        (``tile_positions``), 'global' registers all neighboring pairs and
+        solves for the tile positions by weighted least squares
+        (``global_positions``), which is more robust to a bad pair.
+    pyramid : int
+        Downscaling factor of the coarse level of coarse-to-fine
+        registration, 1 registers at full resolution only. See
+        ``pyramid_register``.
+    channel : int
+        Channel of color tiles used for registration, their luminance by
+        default. The shifts found are applied to all channels.
 
     Notes
     -----
 
     Fourier-based registration is used in this function
-    (skimage.feature.register_translation).
+    (skimage.registration.phase_cross_correlation). All pairs are
+    registered first, then the tiles are composited on the canvas.
     """
-    if pad is None:
-        pad = 200
+    if pad is not None:
+        warnings.warn("pad is ignored and will be removed", DeprecationWarning, stacklevel=2)
     l_r, l_c = imgs.shape[2:4]
-    if overlap_global is None:
-        overlap_global = 0.15
-    overlap_value = int(float(overlap_global) * l_r)
-    imgs = imgs.astype(np.float)
-    if blending:
-        blending_mask = _blending_mask((l_r, l_c))
-    else:
-        blending_mask = np.ones((l_r, l_c))
 
-    if imgs.ndim == 4:
-        canvas = np.zeros(
-            (2 * pad + n_rows * l_r, 2 * pad + n_cols * l_c), dtype=imgs.dtype
+    # Registration of all pairs, then compositing
+    if placement == "chain":
+        pairs = pair_shifts(imgs, n_rows, n_cols, overlap_global, overlap_local, max_workers, pyramid=pyramid, channel=channel)
+        positions = tile_positions(pairs, n_rows, n_cols, (l_r, l_c), 0)
+    elif placement == "global":
+        pairs = pair_shifts(
+            imgs, n_rows, n_cols, overlap_global, overlap_local, max_workers, all_pairs=True,
+            pyramid=pyramid, channel=channel,
         )
+        positions = global_positions(pairs, n_rows, n_cols, (l_r, l_c), 0)
     else:
-        canvas = np.zeros(
-            (2 * pad + n_rows * l_r, 2 * pad + n_cols * l_c, 3), dtype=imgs.dtype
-        )
-        blending_mask = np.dstack((blending_mask,) * 3)
-    weights = np.zeros_like(canvas)
-    init_r, init_c = pad, pad
-    weighted_img = imgs[0, 0] * blending_mask
-    canvas[init_r : init_r + l_r, init_c : init_c + l_c] = weighted_img
-    weights[init_r : init_r + l_r, init_c : init_c + l_c] = blending_mask
-    shifts = np.empty((n_rows, n_cols, 2), dtype=np.int)
-    shifts[0, 0] = init_r, init_c
+        raise ValueError("placement should be 'global' or 'chain'")
 
+    # The canvas is the bounding box of the placed tiles, so no crop is needed
+    positions -= positions.min(axis=(0, 1))
+    height = positions[..., 0].max() + l_r
+    width = positions[..., 1].max() + l_c
+    blending_mask = _blending_mask((l_r, l_c), _blending_mode(blending))
+    # Single-channel weights, broadcast over the color channels
+    weights = np.zeros((height, width), dtype=np.float32)
+    canvas = np.zeros((height, width) + imgs.shape[4:], dtype=np.float32)
+    buffer = np.empty(imgs.shape[2:], dtype=np.float32)
     for i_rows in range(n_rows):
-        # Shifts between rows
-        if i_rows >= 1:
-            index_target = np.ravel_multi_index((i_rows, 0), (n_rows, n_cols))
-            index_orig = index_target - n_cols
-            try:
-                overlap = overlap_local[(index_orig, index_target)]
-            except (KeyError, TypeError):
-                overlap = np.array([overlap_value, 0])
-            init_r, init_c = shifts[i_rows - 1, 0]
-            init_r += l_r
-            shift_vert = feature.register_translation(
-                imgs[i_rows - 1, 0, -overlap[0] :, : (l_c - overlap[1])],
-                imgs[i_rows, 0, : overlap[0], -(l_c - overlap[1]) :],
-            )[0]
-            init_r += int(shift_vert[0]) - overlap[0]
-            init_c += int(shift_vert[1]) - overlap[1]
-            shifts[i_rows, 0] = init_r, init_c
-            # Fill canvas and weights
-            weighted_img = imgs[i_rows, 0] * blending_mask
-            canvas[init_r : init_r + l_r, init_c : init_c + l_c] += weighted_img
-            weights[init_r : init_r + l_r, init_c : init_c + l_c] += blending_mask
-        # Shifts between columns
-        for j_cols in range(n_cols - 1):
-            index_orig = np.ravel_multi_index((i_rows, j_cols), (n_rows, n_cols))
-            index_target = index_orig + 1
+        for j_cols in range(n_cols):
+            init_r, init_c = positions[i_rows, j_cols]
+            tile_slice = (slice(init_r, init_r + l_r), slice(init_c, init_c + l_c))
+            _accumulate(canvas, weights, imgs[i_rows, j_cols], tile_slice, blending_mask, buffer)
+
+    weights += 1.0e-5
+    if canvas.ndim == 3:
+        weights = weights[..., np.newaxis]
+    canvas /= weights
+    return np.rint(canvas, out=canvas).astype(np.uint8)
+
+
+def find_tiles(directory, pattern=r"tile_(\d+)_(\d+)\.\w+$"):
+    """
+    Paths of the tiles of a mosaic stored one file per tile in ``directory``.
+
+    ``pattern`` is a regular expression whose two groups are the row and
+    column of the tile in the file name, by default ``tile_<row>_<col>.<ext>``
+    like the tiles in ``static/``. Returns an object array of shape
+    (n_rows, n_cols) of paths, every tile of the grid must be present.
+    """
+    regex = re.compile(pattern)
+    found = {}
+    for name in os.listdir(directory):
+        match = regex.search(name)
+        if match:
+            found[int(match.group(1)), int(match.group(2))] = os.path.join(directory, name)
+    if not found:
+        raise ValueError(f"no tile matching {pattern!r} in {directory}")
+    n_rows = max(i for i, _ in found) + 1
+    n_cols = max(j for _, j in found) + 1
+    paths = np.empty((n_rows, n_cols), dtype=object)
+    for i_rows in range(n_rows):
+        for j_cols in range(n_cols):
             try:
-                overlap = overlap_local[(index_orig, index_target)]
-            except (KeyError, TypeError):
-                overlap = np.array([0, overlap_value])
-            init_c += l_c
-            if overlap[0] < 0:
-                print("up")
-                row_start_1 = -(l_r + overlap[0])
-                row_end_1 = None
-                row_start_2 = None
-                row_end_2 = l_r + overlap[0]
-            else:
-                print("down")
-                row_start_1 = None
-                row_end_1 = l_r - overlap[0]
-                row_start_2 = -(l_r - overlap[0])
-                row_end_2 = None
-            shift_horiz = feature.register_translation(
-                imgs[i_rows, j_cols, row_start_1:row_end_1, -overlap[1] :],
-                imgs[i_rows, j_cols + 1, row_start_2:row_end_2, : overlap[1]],
-            )[0]
-            init_r += int(shift_horiz[0]) - (overlap[0])
-            init_c += int(shift_horiz[1]) - overlap[1]
-            shifts[i_rows, j_cols + 1] = init_r, init_c
-            # Fill canvas and weights
-            weighted_img = imgs[i_rows, j_cols + 1] * blending_mask
-            canvas[init_r : init_r + l_r, init_c : init_c + l_c] += weighted_img
-            weights[init_r : init_r + l_r, init_c : init_c + l_c] += blending_mask
-
-    canvas /= weights + 1.0e-5
-    return autocrop(np.rint(canvas).astype(np.uint8))
+                paths[i_rows, j_cols] = found[i_rows, j_cols]
+            except KeyError:
+                raise ValueError(f"tile ({i_rows}, {j_cols}) missing from {directory}") from None
+    return paths
+
+
+def stitch_directory(
+    directory,
+    out_path,
+    overlap_global=None,
+    overlap_local=None,
+    blending=True,
+    max_workers=None,
+    placement="chain",
+    pyramid=1,
+    channel=None,
+    pattern=r"tile_(\d+)_(\d+)\.\w+$",
+):
+    """
+    Stitch a mosaic from a directory of tiles into a memory-mapped array,
+    without loading the whole mosaic.
+
+    Tiles are found with ``find_tiles`` and read one row of the grid at a
+    time. During registration only the current and previous rows are
+    resident, as single-channel float32 projections (see ``pair_shifts``),
+    and only the overlapping strips of each band are registered.
+    Compositing then reads the tiles again row by row, accumulates them in
+    a float32 band covering the rows of the canvas that later tiles can
+    still reach, and writes finished rows to ``out_path``, a ``.npy`` file.
+
+    Parameters
+    ----------
+
+    directory : str
+        Directory of the tiles.
+    out_path : str
+        Path of the stitched image, opened with ``np.load(out_path,
+        mmap_mode='r')``.
+    overlap_global, overlap_local, blending, max_workers, placement, pyramid, channel :
+        See ``register_tiles``.
+    pattern : str
+        See ``find_tiles``.
+
+    Returns
+    -------
+
+    canvas: np.memmap of uint8
+        The stitched image, backed by ``out_path``.
+    """
+    paths = find_tiles(directory, pattern)
+    n_rows, n_cols = paths.shape
+    if placement not in ("global", "chain"):
+        raise ValueError("placement should be 'global' or 'chain'")
+
+    with ThreadPoolExecutor(max_workers) as executor:
+        def read_row(i_rows):
+            tiles = list(executor.map(io.imread, paths[i_rows]))
+            if any(tile.shape != tiles[0].shape for tile in tiles):
+                raise ValueError(f"tiles of row {i_rows} have different shapes")
+            return tiles
+
+        def read_projected_row(i_rows):
+            tiles = read_row(i_rows)
+            if tiles[0].shape != tile_shape:
+                raise ValueError(f"tiles of row {i_rows} have different shapes")
+            return [_luminance(tile, channel) for tile in tiles]
+
+        # Registration, one band of two rows at a time
+        tile_shape = io.imread(paths[0, 0]).shape
+        l_r, l_c = tile_shape[:2]
+        overlaps = _pair_overlaps(n_rows, n_cols, l_r, overlap_global, overlap_local, placement == "global")
+        results = {}
+        tiles = None
+        for i_rows in range(n_rows):
+            previous, tiles = tiles, read_projected_row(i_rows)
+            band = {}
+            for pair, overlap in overlaps.items():
+                (i_orig, j_orig), (i_target, j_target) = pair
+                if i_target != i_rows:
+                    continue
+                tile_orig = previous[j_orig] if i_orig < i_rows else tiles[j_orig]
+                band[pair] = _strips(tile_orig, tiles[j_target], i_target > i_orig, overlap)
+            results.update(_register_strips(band, max_workers, pyramid=pyramid))
+        previous = tiles = None
+        pairs = {pair: (overlaps[pair],) + results[pair] for pair in overlaps}
+        if placement == "chain":
+            positions = tile_positions(pairs, n_rows, n_cols, (l_r, l_c), 0)
+        else:
+            positions = global_positions(pairs, n_rows, n_cols, (l_r, l_c), 0)
+        positions -= positions.min(axis=(0, 1))
+        height = positions[..., 0].max() + l_r
+        width = positions[..., 1].max() + l_c
+
+        canvas = np.lib.format.open_memmap(
+            out_path, mode="w+", dtype=np.uint8, shape=(height, width) + tile_shape[2:]
+        )
+        blending_mask = _blending_mask((l_r, l_c), _blending_mode(blending))
+        buffer = np.empty(tile_shape, dtype=np.float32)
+        # Band of canvas rows [band_start, band_start + len(band)) still being accumulated
+        band_start = 0
+        band = np.zeros((0, width) + tile_shape[2:], dtype=np.float32)
+        band_weights = np.zeros((0, width), dtype=np.float32)
+        for i_rows in range(n_rows):
+            band_end = max(band_start + len(band), positions[i_rows, :, 0].max() + l_r)
+            grow = band_end - band_start - len(band)
+            band = np.concatenate([band, np.zeros((grow,) + band.shape[1:], dtype=np.float32)])
+            band_weights = np.concatenate([band_weights, np.zeros((grow, width), dtype=np.float32)])
+            for j_cols, tile in enumerate(read_row(i_rows)):
+                init_r, init_c = positions[i_rows, j_cols]
+                tile_slice = (slice(init_r - band_start, init_r - band_start + l_r), slice(init_c, init_c + l_c))
+                _accumulate(band, band_weights, tile, tile_slice, blending_mask, buffer)
+            # Rows above every later tile are final
+            done = positions[i_rows + 1 :, :, 0].min() if i_rows + 1 < n_rows else height
+            n_done = max(done - band_start, 0)
+            weights = band_weights[:n_done] + 1.0e-5
+            if band.ndim == 3:
+                weights = weights[..., np.newaxis]
+            canvas[band_start : band_start + n_done] = np.rint(band[:n_done] / weights)
+            band, band_weights = band[n_done:], band_weights[n_done:]
+            band_start += n_done
+    canvas.flush()
+    return canvas
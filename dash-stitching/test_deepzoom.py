@@ -0,0 +1,83 @@
+import math
+import os
+import time
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import deepzoom
+
+
+@pytest.mark.parametrize("size, levels", (((1, 1), 1), ((2, 1), 2), ((600, 300), 11), ((1024, 1024), 11), ((1025, 3), 12)))
+def test_level_count(size, levels):
+    assert deepzoom.level_count(*size) == levels
+
+
+def gradient(height, width, channels=()):
+    rows, cols = np.indices((height, width))
+    image = ((rows + 2 * cols) % 256).astype(np.uint8)
+    return np.broadcast_to(image[..., None], (height, width) + channels).copy() if channels else image
+
+
+@pytest.mark.parametrize("channels", ((), (3,)))
+def test_levels_and_tiles_geometry(tmp_path, channels):
+    height, width, tile_size, overlap = 300, 600, 128, 1
+    image = gradient(height, width, channels)
+    dzi = deepzoom.write_deepzoom(image, tmp_path, tile_size=tile_size, overlap=overlap, fmt="png")
+    root = ET.parse(dzi).getroot()
+    assert root.get("TileSize") == str(tile_size) and root.get("Overlap") == str(overlap)
+    size = root[0]
+    assert (int(size.get("Width")), int(size.get("Height"))) == (width, height)
+    files = tmp_path / "image_files"
+    n_levels = deepzoom.level_count(width, height)
+    assert sorted(int(p.name) for p in files.iterdir()) == list(range(n_levels))
+    for level in range(n_levels):
+        scale = 2 ** (n_levels - 1 - level)
+        level_height, level_width = math.ceil(height / scale), math.ceil(width / scale)
+        n_rows, n_cols = math.ceil(level_height / tile_size), math.ceil(level_width / tile_size)
+        assert len(list((files / str(level)).iterdir())) == n_rows * n_cols
+        for row in range(n_rows):
+            for col in range(n_cols):
+                # Tiles overlap their neighbors by overlap pixels on every inner side
+                top, left = max(row * tile_size - overlap, 0), max(col * tile_size - overlap, 0)
+                bottom = min((row + 1) * tile_size + overlap, level_height)
+                right = min((col + 1) * tile_size + overlap, level_width)
+                tile = np.asarray(Image.open(files / str(level) / f"{col}_{row}.png"))
+                assert tile.shape == (bottom - top, right - left) + channels
+                if level == n_levels - 1:
+                    np.testing.assert_array_equal(tile, image[top:bottom, left:right])
+    assert (tmp_path / "viewer.html").read_text().count("image.dzi") == 1
+
+
+def test_halving_averages_blocks():
+    image = np.array([[0, 2, 4], [2, 4, 6], [10, 10, 10]], dtype=np.uint8)
+    out = np.empty((2, 2), dtype=np.uint8)
+    deepzoom._halve(image, out, band_rows=1)
+    # Odd edges are padded by repeating the last row and column
+    np.testing.assert_array_equal(out, [[2, 5], [10, 10]])
+
+
+def test_write_once_and_prune(tmp_path):
+    image = gradient(64, 64)
+    first = deepzoom.write_deepzoom_once(image, tmp_path, "a", fmt="png")
+    written = os.path.getmtime(first / "image.dzi")
+    assert deepzoom.write_deepzoom_once(image, tmp_path, "a", fmt="png") == first
+    assert os.path.getmtime(first / "image.dzi") == written
+    size = deepzoom._tree_bytes(first)
+    for key in ("b", "c"):
+        os.utime(tmp_path / "a", (time.time() - 100, time.time() - 100))
+        deepzoom.write_deepzoom_once(image, tmp_path, key, max_bytes=2 * size, fmt="png")
+    # a was the least recently used
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["b", "c"]
+    stale = tmp_path / "d.x.tmp"
+    stale.mkdir()
+    os.utime(stale, (time.time() - 2 * deepzoom.STALE_TMP_AGE,) * 2)
+    deepzoom.prune_pyramids(tmp_path, 0, keep=("c",))
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["c"]
+
+
+def test_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        deepzoom.write_deepzoom(gradient(8, 8), tmp_path, fmt="gif")
@@ -0,0 +1,217 @@
+import numpy as np
+import pytest
+from scipy import ndimage
+from skimage import io
+
+import registration as reg
+
+N_ROWS, N_COLS, TILE, OVERLAP = 3, 4, 160, 48
+
+
+def noise_mosaic(n_rows=N_ROWS, n_cols=N_COLS, tile=TILE, overlap=OVERLAP, jitter=4, seed=0, rgb=False):
+    """
+    Tiles cut from smoothed noise on a jittered grid, and the position of
+    every tile relative to tile (0, 0). Noise has a single correlation
+    peak, unlike natural images with repeated structures.
+    """
+    rng = np.random.default_rng(seed)
+    step = tile - overlap
+    channels = (3,) if rgb else ()
+    image = rng.random((n_rows * step + tile + 4 * jitter, n_cols * step + tile + 4 * jitter) + channels)
+    image = ndimage.gaussian_filter(image.astype(np.float32), (2, 2) + (0,) * len(channels))
+    image = ((image - image.min()) / np.ptp(image) * 255).astype(np.uint8)
+    tiles = np.empty((n_rows, n_cols, tile, tile) + channels, dtype=np.uint8)
+    positions = np.empty((n_rows, n_cols, 2), dtype=int)
+    for i in range(n_rows):
+        for j in range(n_cols):
+            r, c = 2 * jitter + np.array([i, j]) * step + rng.integers(-jitter, jitter + 1, 2)
+            tiles[i, j] = image[r : r + tile, c : c + tile]
+            positions[i, j] = r, c
+    return tiles, positions - positions[0, 0]
+
+
+def positions_of(pairs, placement="chain"):
+    place = reg.tile_positions if placement == "chain" else reg.global_positions
+    positions = place(pairs, N_ROWS, N_COLS, (TILE, TILE), 0)
+    return positions - positions[0, 0]
+
+
+@pytest.fixture(scope="module")
+def mosaic():
+    return noise_mosaic()
+
+
+@pytest.mark.parametrize("max_workers", (1, 4))
+def test_parallel_pairs_find_the_tile_positions(mosaic, max_workers):
+    tiles, truth = mosaic
+    pairs = reg.pair_shifts(tiles, N_ROWS, N_COLS, OVERLAP / TILE, max_workers=max_workers, backend="pairwise")
+    np.testing.assert_array_equal(positions_of(pairs), truth)
+    assert all(0 < confidence <= 1 for _, _, confidence in pairs.values())
+
+
+def test_global_placement_finds_the_tile_positions(mosaic):
+    tiles, truth = mosaic
+    pairs = reg.pair_shifts(tiles, N_ROWS, N_COLS, OVERLAP / TILE, all_pairs=True)
+    # Every horizontal and vertical pair
+    assert len(pairs) == N_ROWS * (N_COLS - 1) + (N_ROWS - 1) * N_COLS
+    np.testing.assert_array_equal(positions_of(pairs, "global"), truth)
+
+
+def test_global_placement_outvotes_a_bad_pair(mosaic):
+    tiles, truth = mosaic
+    pairs = reg.pair_shifts(tiles, N_ROWS, N_COLS, OVERLAP / TILE, all_pairs=True)
+    pair = ((0, 0), (0, 1))
+    overlap, shift, confidence = pairs[pair]
+    pairs[pair] = (overlap, shift + np.array([0, 20]), 0.05)
+    # Chaining moves every tile placed after the bad pair, the fit spreads a little of it
+    assert np.abs(positions_of(pairs, "chain") - truth).max() == 20
+    assert np.abs(positions_of(pairs, "global") - truth).max() <= 2
+
+
+@pytest.mark.parametrize("all_pairs", (False, True))
+def test_batched_backend_finds_the_tile_positions(mosaic, all_pairs):
+    tiles, truth = mosaic
+    pairs = reg.pair_shifts(tiles, N_ROWS, N_COLS, OVERLAP / TILE, backend="batched", all_pairs=all_pairs)
+    np.testing.assert_array_equal(positions_of(pairs, "global" if all_pairs else "chain"), truth)
+
+
+def test_backends_agree(mosaic):
+    tiles, _ = mosaic
+    batched, pairwise = (
+        reg.pair_shifts(tiles, N_ROWS, N_COLS, OVERLAP / TILE, backend=backend, all_pairs=True)
+        for backend in ("batched", "pairwise")
+    )
+    assert batched.keys() == pairwise.keys()
+    for pair, (overlap, shift, confidence) in batched.items():
+        np.testing.assert_array_equal(shift, pairwise[pair][1])
+        assert confidence == pytest.approx(pairwise[pair][2], abs=1e-3)
+
+
+def test_batch_sizes_agree(mosaic):
+    tiles, _ = mosaic
+    whole = reg.pair_shifts(tiles, N_ROWS, N_COLS, OVERLAP / TILE)
+    split = reg.pair_shifts(tiles, N_ROWS, N_COLS, OVERLAP / TILE, batch_size=2)
+    for pair in whole:
+        np.testing.assert_array_equal(whole[pair][1], split[pair][1])
+        assert whole[pair][2] == pytest.approx(split[pair][2], rel=1e-5)
+
+
+@pytest.mark.parametrize("backend", ("batched", "pairwise"))
+@pytest.mark.parametrize("pyramid", (2, 4))
+@pytest.mark.parametrize("placement", ("chain", "global"))
+def test_pyramid_finds_the_tile_positions(mosaic, backend, pyramid, placement):
+    tiles, truth = mosaic
+    pairs = reg.pair_shifts(tiles, N_ROWS, N_COLS, OVERLAP / TILE, backend=backend, pyramid=pyramid,
+                            all_pairs=placement == "global")
+    np.testing.assert_array_equal(positions_of(pairs, placement), truth)
+
+
+def test_pyramid_backends_agree(mosaic):
+    tiles, _ = mosaic
+    batched, pairwise = (
+        reg.pair_shifts(tiles, N_ROWS, N_COLS, OVERLAP / TILE, backend=backend, pyramid=4, all_pairs=True)
+        for backend in ("batched", "pairwise")
+    )
+    for pair, (overlap, shift, confidence) in batched.items():
+        np.testing.assert_array_equal(shift, pairwise[pair][1])
+        assert confidence == pytest.approx(pairwise[pair][2], abs=1e-3)
+
+
+@pytest.mark.parametrize("placement", ("chain", "global"))
+def test_register_tiles_reconstructs_the_image(mosaic, placement):
+    tiles, truth = mosaic
+    canvas = reg.register_tiles(tiles, N_ROWS, N_COLS, OVERLAP / TILE, placement=placement)
+    offset = -truth.min(axis=(0, 1))
+    assert canvas.shape == tuple(truth.max(axis=(0, 1)) + offset + TILE)
+    # Away from the blended seams every tile is copied as is
+    r, c = truth[1, 2] + offset
+    np.testing.assert_array_equal(canvas[r + 40 : r + 60, c + 60 : c + 100], tiles[1, 2, 40:60, 60:100])
+
+
+def test_register_tiles_pad_is_deprecated(mosaic):
+    tiles, _ = mosaic
+    with pytest.warns(DeprecationWarning):
+        reg.register_tiles(tiles, N_ROWS, N_COLS, OVERLAP / TILE, pad=10)
+    with pytest.raises(ValueError):
+        reg.register_tiles(tiles, N_ROWS, N_COLS, OVERLAP / TILE, placement="greedy")
+
+
+@pytest.mark.parametrize("blending", (True, False))
+def test_canvas_is_the_bounding_box_of_the_tiles(mosaic, blending):
+    # Constant tiles composite to the same constant everywhere, whatever the weights
+    tiles, truth = mosaic
+    flat = np.full_like(tiles, 100)
+    canvas = reg.register_tiles(tiles, N_ROWS, N_COLS, OVERLAP / TILE, blending=blending)
+    assert canvas.dtype == np.uint8
+    extent = tuple(np.ptp(truth, axis=(0, 1)) + TILE)
+    assert canvas.shape == extent
+    positions = truth - truth.min(axis=(0, 1))
+    weights = np.zeros(extent, dtype=np.float32)
+    composite = np.zeros(extent, dtype=np.float32)
+    buffer = np.empty((TILE, TILE), dtype=np.float32)
+    mask = reg._blending_mask((TILE, TILE), reg._blending_mode(blending))
+    for i in range(N_ROWS):
+        for j in range(N_COLS):
+            r, c = positions[i, j]
+            reg._accumulate(composite, weights, flat[i, j], (slice(r, r + TILE), slice(c, c + TILE)), mask, buffer)
+    covered = weights > 0
+    np.testing.assert_allclose(composite[covered] / weights[covered], 100, rtol=1e-5)
+
+
+@pytest.mark.parametrize("placement", ("chain", "global"))
+def test_stitch_directory_matches_register_tiles(tmp_path, placement):
+    tiles, _ = noise_mosaic(2, 3, 96, 32, jitter=3, seed=1)
+    for i in range(2):
+        for j in range(3):
+            io.imsave(tmp_path / f"tile_{i}_{j}.png", tiles[i, j], check_contrast=False)
+    expected = reg.register_tiles(tiles, 2, 3, 1 / 3, placement=placement)
+    canvas = reg.stitch_directory(tmp_path, tmp_path / "out.npy", 1 / 3, placement=placement)
+    np.testing.assert_array_equal(canvas, expected)
+    np.testing.assert_array_equal(np.load(tmp_path / "out.npy", mmap_mode="r"), expected)
+
+
+def test_find_tiles(tmp_path):
+    for name in ("tile_0_0.png", "tile_0_1.png", "tile_1_0.png", "tile_1_1.png", "notes.txt"):
+        (tmp_path / name).touch()
+    paths = reg.find_tiles(tmp_path)
+    assert paths.shape == (2, 2)
+    assert str(paths[1, 0]).endswith("tile_1_0.png")
+    (tmp_path / "tile_0_1.png").unlink()
+    with pytest.raises(ValueError):
+        reg.find_tiles(tmp_path)
+
+
+@pytest.mark.parametrize("channel", (None, 1))
+def test_color_tiles(channel):
+    tiles, truth = noise_mosaic(rgb=True)
+    pairs = reg.pair_shifts(tiles, N_ROWS, N_COLS, OVERLAP / TILE, channel=channel)
+    assert all(shift.shape == (2,) for _, shift, _ in pairs.values())
+    np.testing.assert_array_equal(positions_of(pairs), truth)
+    canvas = reg.register_tiles(tiles, N_ROWS, N_COLS, OVERLAP / TILE, channel=channel)
+    assert canvas.shape[2:] == (3,)
+    # The shifts found on one channel move every channel
+    r, c = truth[1, 2] - truth.min(axis=(0, 1))
+    np.testing.assert_array_equal(canvas[r + 40 : r + 60, c + 60 : c + 100], tiles[1, 2, 40:60, 60:100])
+
+
+@pytest.mark.parametrize("mode", reg.BLENDING_MODES)
+def test_blending_masks(mode):
+    mask = reg._blending_mask((20, 30), mode)
+    assert mask.shape == (20, 30)
+    assert mask.dtype == np.float32
+    assert (mask > 0).all()
+    np.testing.assert_allclose(mask, mask[::-1, ::-1])
+    assert mask[10, 15] == mask.max()
+    # Cached and shared, so it must not be written to
+    assert reg._blending_mask((20, 30), mode) is mask
+    assert not mask.flags.writeable
+
+
+def test_blending_mask_weights():
+    rows, cols = np.indices((20, 30))
+    to_border = [np.minimum(rows, 19 - rows) + 1, np.minimum(cols, 29 - cols) + 1]
+    np.testing.assert_array_equal(reg._blending_mask((20, 30), "distance"), np.minimum(*to_border))
+    np.testing.assert_array_equal(reg._blending_mask((20, 30), "feather"), to_border[0] * to_border[1])
+    assert reg._blending_mode(True) == "distance" and reg._blending_mode(False) == "none"
+    with pytest.raises(ValueError):
+        reg._blending_mask((20, 30), "gaussian")
@@ -0,0 +1,59 @@
+import os
+
+import numpy as np
+
+from tile_store import TileStore
+
+
+def mosaic(value, shape=(10, 10)):
+    # 100 bytes
+    return np.full(shape, value, dtype=np.uint8)
+
+
+def test_memory_tier_evicts_least_recently_used():
+    store = TileStore(max_bytes=250)
+    for key in "abc":
+        store.put(key, mosaic(ord(key)))
+    assert "a" not in store
+    assert store.get("b") is not None
+    store.put("d", mosaic(4))
+    assert "c" not in store
+    assert "b" in store and "d" in store
+    assert store.nbytes == 200
+
+
+def test_replacing_a_mosaic_keeps_the_byte_count():
+    store = TileStore(max_bytes=1000)
+    store.put("a", mosaic(1))
+    store.put("a", mosaic(2, (20, 10)))
+    assert store.nbytes == 200
+    assert (store.get("a") == 2).all()
+
+
+def test_disk_tier_is_shared_and_bounded(tmp_path):
+    store = TileStore(max_bytes=0, disk_dir=tmp_path, disk_max_bytes=3 * 228)
+    for i, key in enumerate("abcd"):
+        store.put(key, mosaic(i))
+        os.utime(tmp_path / f"{key}.npy", (i, i))
+    # .npy files of 128 header bytes and 100 data bytes, the oldest one is removed
+    assert sorted(path.stem for path in tmp_path.glob("*.npy")) == ["b", "c", "d"]
+    other = TileStore(disk_dir=tmp_path)
+    np.testing.assert_array_equal(other.get("c"), mosaic(2))
+    assert other.get("a") is None
+    # Read from disk, then served from memory
+    assert "c" in other.entries
+
+
+def test_mosaic_larger_than_memory_tier_is_kept_on_disk(tmp_path):
+    store = TileStore(max_bytes=50, disk_dir=tmp_path)
+    store.put("a", mosaic(1))
+    assert store.nbytes == 0
+    assert "a" in store
+    np.testing.assert_array_equal(store.get("a"), mosaic(1))
+
+
+def test_unreadable_file_is_a_miss(tmp_path):
+    store = TileStore(disk_dir=tmp_path)
+    (tmp_path / "a.npy").write_bytes(b"not an array")
+    assert store.get("a") is None
+    assert not list(tmp_path.glob("*.tmp"))
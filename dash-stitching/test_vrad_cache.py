@@ -0,0 +1,80 @@
+import os
+import pathlib
+
+import numpy as np
+import pandas as pd
+
+import vrad_utils as vru
+from vrad_cache import ResultCache, cache_key, result_hash, result_nbytes
+from vrad_stats import KPIStats
+
+
+def result(value, n=100):
+    # 800 bytes
+    return {"array": np.full(n, value, dtype=float)}
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = ResultCache(max_bytes=2000)
+    cache.put("a", result(0), disk=False)
+    cache.put("b", result(1), disk=False)
+    cache.get("a")
+    cache.put("c", result(2), disk=False)
+    assert "a" in cache and "c" in cache
+    assert "b" not in cache
+    assert cache.get("b") is None
+    assert cache.nbytes == 1600
+
+
+def test_result_larger_than_memory_tier_is_not_kept():
+    cache = ResultCache(max_bytes=1000)
+    cache.put("a", result(0, n=200), disk=False)
+    assert "a" not in cache
+    assert cache.nbytes == 0
+
+
+def test_disk_tier_keeps_byte_budget(tmp_path):
+    cache = ResultCache(max_bytes=0, disk_dir=tmp_path, disk_max_bytes=3000)
+    for i, key in enumerate("abcde"):
+        cache.put(key, result(i))
+        # Distinct modification times, oldest first
+        os.utime(tmp_path / f"{key}.pkl", (i, i))
+    files = sorted(path.stem for path in tmp_path.glob("*.pkl"))
+    assert sum(path.stat().st_size for path in tmp_path.glob("*.pkl")) <= 3000
+    assert files == ["c", "d", "e"]
+    np.testing.assert_array_equal(cache.get("d")["array"], result(3)["array"])
+    # A second cache on the same directory, e.g. another server process
+    assert "e" in ResultCache(disk_dir=tmp_path)
+
+
+def test_disk_prune_skips_files_removed_meanwhile(tmp_path, monkeypatch):
+    cache = ResultCache(max_bytes=0, disk_dir=tmp_path, disk_max_bytes=1000)
+    cache.put("a", result(0))
+    unlink = pathlib.Path.unlink
+
+    def racing_unlink(path, *args, **kwargs):
+        # Another process pruned the file first
+        unlink(path, *args, **kwargs)
+        unlink(path, *args, **kwargs)
+
+    monkeypatch.setattr(pathlib.Path, "unlink", racing_unlink)
+    cache.put("b", result(1))
+    assert [path.stem for path in tmp_path.glob("*.pkl")] == ["b"]
+
+
+def test_cache_key_is_stable():
+    assert cache_key("run", {"b": 1, "a": [1, 2]}) == cache_key("run", {"a": [1, 2], "b": 1})
+    assert cache_key("run", 1) != cache_key("run", 2)
+
+
+def test_result_hash_and_nbytes_of_a_run():
+    s = vru.sim(vru.SimConfig(120, 4, (1.5, 1.5, 1.5), seed=1))
+    frame = {"img_table": s.img_table}
+    assert result_hash(frame) == result_hash({"img_table": s.img_table.copy()})
+    assert result_nbytes(frame) >= s.img_table.memory_usage(deep=True).sum()
+    # The kpi is sized by its t-digests
+    kpi = s.kpi
+    assert result_nbytes({"kpi": kpi}) > result_nbytes({"kpi": KPIStats()})
+    digest = kpi.wait_digest[1]
+    assert kpi.nbytes > digest.means.nbytes + digest.weights.nbytes
+    assert result_nbytes({"frame": pd.DataFrame({"a": np.zeros(10)})}) >= 80
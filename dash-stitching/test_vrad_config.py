@@ -0,0 +1,68 @@
+import dataclasses
+import json
+
+import pytest
+
+import vrad_utils as vru
+from vrad_config import SimConfig
+from vrad_routing import PowerOfDRouter, RoundRobinRouter
+
+
+def test_defaults():
+    config = SimConfig(60)
+    assert config.router is None and config.router_options == ()
+    assert config.dispatch == "push"
+    assert config.discipline is None
+    assert config.verbose is False
+    assert config.queue_sample_every == 60
+    assert config.urg_times == (2, 5, 10)
+    assert config.process_time(3) == 10
+    assert config.target_time(1) == 2
+
+
+def test_lists_and_options_are_frozen():
+    config = SimConfig(60, 2, [1, 2, 3], router="power_of_d", router_options={"metric": "length", "d": 3})
+    assert config.arr_rates == (1, 2, 3)
+    assert config.router_options == (("d", 3), ("metric", "length"))
+    assert hash(config) == hash(SimConfig(60, 2, (1, 2, 3), router="power_of_d",
+                                          router_options=[("metric", "length"), ("d", 3)]))
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        config.sim_time = 120
+
+
+def test_json_round_trip():
+    # The form in which jobs and cache keys carry a config
+    config = SimConfig(60, 2, (1, 2, 3), router="power_of_d", router_options={"d": 3}, seed=4)
+    assert SimConfig(**json.loads(json.dumps(dataclasses.asdict(config)))) == config
+
+
+@pytest.mark.parametrize(
+    "changes",
+    (
+        {"sim_time": -1},
+        {"rads_count": -1},
+        {"router": "shortest"},
+        {"dispatch": "steal"},
+        {"discipline": "lifo"},
+        {"batch_interval": 0},
+        {"queue_sample_every": 0},
+        {"arr_rates": (1, 1, 1, 1)},
+        {"target_times": (2, 3)},
+    ),
+)
+def test_invalid_values(changes):
+    with pytest.raises(ValueError):
+        SimConfig(**{"sim_time": 60, **changes})
+    with pytest.raises(ValueError):
+        SimConfig(60).replace(**changes)
+
+
+def test_every_state_builds_its_own_router():
+    config = SimConfig(60, 4, (5, 5, 5), router="round_robin", seed=1)
+    first, second = vru.gen_system_state(config), vru.gen_system_state(config)
+    assert isinstance(first.router, RoundRobinRouter)
+    assert first.router is not second.router
+    first.run_simulation()
+    assert second.router.next_index == {}
+    state = vru.gen_system_state(config.replace(router="power_of_d", router_options={"d": 3}))
+    assert isinstance(state.router, PowerOfDRouter) and state.router.d == 3
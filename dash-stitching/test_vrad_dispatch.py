@@ -0,0 +1,119 @@
+import itertools
+import random
+
+import pytest
+
+import vrad_utils as vru
+from vrad_dispatch import BatchDispatcher, PullDispatcher, urgency_priority
+
+
+def images(urgencies, image_type=1, facility=None):
+    return [vru.MedicalImage(i, float(i), urgency, image_type, facility) for i, urgency in enumerate(urgencies)]
+
+
+def test_pull_dispatcher_pops_in_priority_order():
+    rad = vru.Radiologist(0, [1])
+    dispatcher = PullDispatcher([rad])
+    imgs = images([3, 1, 2, 1])
+    for img in imgs:
+        dispatcher.push(img)
+    assert [dispatcher.pop(rad) for _ in range(5)] == [imgs[1], imgs[3], imgs[2], imgs[0], None]
+    assert len(dispatcher) == 0
+
+
+def test_pull_dispatcher_push_front():
+    rad = vru.Radiologist(0, [1])
+    dispatcher = PullDispatcher([rad])
+    imgs = images([1, 2, 2])
+    for img in imgs[:2]:
+        dispatcher.push(img)
+    dispatcher.push_front(imgs[2])
+    assert [dispatcher.pop(rad) for _ in range(4)] == [imgs[0], imgs[2], imgs[1], None]
+
+
+def test_pull_dispatcher_finds_idle_rad_with_privileges():
+    rads = [vru.Radiologist(0, [1], facilities={0}), vru.Radiologist(1, [1, 2], facilities={1})]
+    dispatcher = PullDispatcher(rads)
+    assert dispatcher.find_idle_rad(images([1], facility=1)[0]) is rads[1]
+    assert dispatcher.find_idle_rad(images([1], image_type=3)[0]) is None
+    dispatcher.set_busy(rads[1])
+    assert dispatcher.find_idle_rad(images([1], facility=1)[0]) is None
+
+
+def test_pull_dispatcher_pops_best_eligible_study():
+    # Against a scan of every waiting study
+    rng = random.Random(0)
+    n_facilities = 8
+    rads = [
+        vru.Radiologist(
+            i, rng.sample(range(4), rng.randint(1, 3)),
+            facilities=None if i < 3 else set(rng.sample(range(n_facilities), rng.randint(1, 3))),
+        )
+        for i in range(12)
+    ]
+    dispatcher = PullDispatcher(rads)
+    n_images = 0
+    for _ in range(3000):
+        action = rng.random()
+        if action < 0.5:
+            img = vru.MedicalImage(n_images, float(n_images), rng.randint(1, 3), rng.randrange(4),
+                                   rng.randrange(n_facilities))
+            dispatcher.push(img)
+            n_images += 1
+        elif action < 0.97:
+            rad = rng.choice(rads)
+            eligible = [
+                (urgency_priority(img), img)
+                for img in dispatcher.waiting_images()
+                if img.image_type in rad.specialties and rad.has_privileges(img.facility)
+            ]
+            expected = min(eligible, key=lambda item: item[0])[1] if eligible else None
+            assert dispatcher.pop(rad) is expected
+        else:
+            waiting = dispatcher.waiting_images()
+            dispatcher.remove(rng.sample(waiting, min(2, len(waiting))))
+        assert len(dispatcher) == len(dispatcher.waiting_images())
+    # Stale heads are compacted away
+    assert max(len(heads) for heads in dispatcher.heads.values()) <= 2 * n_facilities + 1
+
+
+def matching_cost(pairs, time, big):
+    # The objective of BatchDispatcher.match: every pair earns big, then least slack and fewest specialties
+    return sum(img.time_created + img.target_time - time - big + 1e-3 * len(rad.specialties) for img, rad in pairs)
+
+
+def test_batch_matching_is_optimal():
+    # Against every matching of a small instance
+    rng = random.Random(0)
+    for _ in range(100):
+        rads = [
+            vru.Radiologist(i, rng.sample(range(3), rng.randint(1, 3)), facilities=set(rng.sample(range(3), 2)))
+            for i in range(3)
+        ]
+        imgs = [vru.MedicalImage(i, rng.uniform(0, 10), rng.randint(1, 3), rng.randrange(3), rng.randrange(3))
+                for i in range(5)]
+        dispatcher = BatchDispatcher(rads)
+        for img in imgs:
+            dispatcher.push(img)
+        time = 10
+        big = 2 * max(abs(img.time_created + img.target_time - time) for img in imgs) + 1
+        best = 0
+        for choice in itertools.product([None] + imgs, repeat=len(rads)):
+            chosen = [img for img in choice if img is not None]
+            if len(set(chosen)) < len(chosen):
+                continue
+            pairs = [(img, rad) for img, rad in zip(choice, rads) if img is not None]
+            if all(img.image_type in rad.specialties and rad.has_privileges(img.facility) for img, rad in pairs):
+                best = min(best, matching_cost(pairs, time, big))
+        pairs = dispatcher.match(time)
+        assert matching_cost(pairs, time, big) == pytest.approx(best)
+        assert len(dispatcher) == len(imgs) - len(pairs)
+
+
+def test_batch_keeps_generalist_for_studies_only_it_can_read():
+    generalist, specialist = vru.Radiologist(0, [1, 2]), vru.Radiologist(1, [1])
+    dispatcher = BatchDispatcher([generalist, specialist])
+    imgs = [vru.MedicalImage(0, 0.0, 1, 1), vru.MedicalImage(1, 0.0, 3, 2)]
+    for img in imgs:
+        dispatcher.push(img)
+    assert sorted(dispatcher.match(0), key=lambda pair: pair[0].img_id) == [(imgs[0], specialist), (imgs[1], generalist)]
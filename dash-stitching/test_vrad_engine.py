@@ -0,0 +1,137 @@
+import numpy as np
+import pytest
+
+import vrad_scenarios as vs
+import vrad_utils as vru
+from vrad_queues import DISCIPLINES
+from vrad_routing import ROUTERS
+
+DISPATCH_MODES = ("push", "pull", "batch")
+
+
+def small_config(**kwargs):
+    # Overloaded on purpose, so that queues build up and urgent jobs find every rad busy
+    return vru.SimConfig(4 * 60, 4, (1.5, 1.5, 1.5), (2, 5, 10), cutoff=True, seed=1, **kwargs)
+
+
+def run_checked(config):
+    # Run a simulation, checking the queue length counter against the rads after every event
+    s = vru.gen_system_state(config)
+    process_event = s.process_event
+
+    def checked_process_event():
+        process_event()
+        assert s.n_queued == sum(rad.queue_size() for rad in s.rads)
+
+    s.process_event = checked_process_event
+    s.run_simulation()
+    return s
+
+
+@pytest.mark.parametrize("router", sorted(ROUTERS))
+def test_every_image_accounted_for_with_each_router(router):
+    s = run_checked(small_config(router=router))
+    done = s.img_table["img_id"]
+    assert done.is_unique
+    assert len(done) + len(s.unfin_img_table) == len(s.images)
+    assert (s.img_table["wait_time"] >= 0).all()
+    assert len(s.queued) == len(s.time_steps)
+
+
+
+def test_pull_mode_leaves_no_rad_idle_beside_a_study_it_can_read():
+    s = vru.gen_system_state(small_config(dispatch="pull"))
+    while s.continue_running and s.time < 120:
+        s.process_event()
+        waiting = s.pull_dispatcher.waiting_images()
+        for rad in s.rads:
+            if rad.current is None:
+                assert not any(img.image_type in rad.specialties for img in waiting)
+    assert len(s.pull_dispatcher) > 0
+
+
+@pytest.mark.parametrize("dispatch", DISPATCH_MODES)
+def test_every_dispatch_mode_drains_a_backlog(dispatch):
+    # Far more studies than one per rad per batch interval
+    scenario = vs.generate_scenario(n_rads=20, n_facilities=5, n_specialties=3, n_procedures=10,
+                                    n_studies=3000, sim_time=6 * 60, seed=0)
+    s = vs.gen_scenario_state(scenario, (2, 5, 10), cutoff=True, dispatch=dispatch,
+                              router="least_work" if dispatch == "push" else None)
+    s.run_simulation()
+    assert len(s.img_table) == 3000
+    assert len(s.unfin_img_table) == 0
+
+
+def test_batch_rads_pull_between_batches():
+    s = vru.gen_system_state(small_config(dispatch="batch", batch_interval=30))
+    while s.continue_running and s.time < 60:
+        s.process_event()
+        if s.events_history[-1][1] == "Job Done":
+            # A rad left idle by a completion has nothing it can read
+            rad = s.events_history[-1][2]
+            waiting = s.pull_dispatcher.waiting_images()
+            assert rad.current is not None or not any(img.image_type in rad.specialties for img in waiting)
+    idle = set(s.pull_dispatcher.idle_rads())
+    assert idle == {rad for rad in s.rads if rad.current is None}
+
+
+@pytest.mark.parametrize("dispatch", DISPATCH_MODES)
+@pytest.mark.parametrize("discipline", sorted(DISCIPLINES))
+def test_every_image_accounted_for(dispatch, discipline):
+    s = run_checked(small_config(dispatch=dispatch, discipline=discipline))
+    done = s.img_table["img_id"]
+    assert done.is_unique
+    assert len(done) + len(s.unfin_img_table) == len(s.images)
+    assert (s.img_table["wait_time"] >= 0).all()
+    assert (s.img_table["time_w_rad"] > 0).all()
+
+
+@pytest.mark.parametrize("dispatch", DISPATCH_MODES)
+def test_preemption_happens_in_every_dispatch_mode(dispatch):
+    s = run_checked(small_config(dispatch=dispatch, discipline="preemptive"))
+    assert any(event[1] == "Job Preempted" for event in s.events_history)
+
+
+@pytest.mark.parametrize("dispatch", ("push", "pull"))
+def test_preemption_shortens_urgent_waits(dispatch):
+    def urgent_wait(discipline):
+        s = vru.sim(small_config(dispatch=dispatch, discipline=discipline))
+        return s.img_table.loc[s.img_table["urgency"] == 1, "wait_time"].mean()
+
+    assert urgent_wait("preemptive") < urgent_wait("priority")
+
+
+@pytest.mark.parametrize("dispatch", ("pull", "batch"))
+def test_preempted_job_resumes_on_idle_rad(dispatch):
+    # Only rads[0] reads specialty 1, the study it is preempted from moves to the idle rads[1]
+    config = vru.SimConfig(60, dispatch=dispatch, discipline="preemptive")
+    rads = [vru.Radiologist(0, [1, 2]), vru.Radiologist(1, [2])]
+    displaced = vru.MedicalImage(0, 0.0, 3, 2, config=config)
+    urgent = vru.MedicalImage(1, 0.5, 1, 1, config=config)
+    s = vru.SystemState(config, vru.create_initial_events(60, [urgent]), [displaced, urgent], rads)
+    s.pull_job(displaced)
+    assert rads[0].current is displaced
+    s.process_event()
+    assert rads[0].current is urgent
+    assert rads[1].current is displaced
+    assert len(s.pull_dispatcher) == 0
+    assert s.n_queued == 2
+
+
+@pytest.mark.parametrize("dispatch", DISPATCH_MODES)
+def test_timeline_segments_cover_the_run(dispatch):
+    s = vru.sim(small_config(dispatch=dispatch))
+    timeline = vru.timeline_table(s.rads)
+    for rad_id, segments in timeline.groupby("rad_id"):
+        start = segments["start"].to_numpy()
+        duration = segments["duration"].to_numpy()
+        # Contiguous from time 0, alternately idle and busy, ending at the end of the run
+        assert start[0] == 0
+        np.testing.assert_allclose(start[1:], start[:-1] + duration[:-1])
+        np.testing.assert_allclose(duration.sum(), s.time)
+        assert (duration >= 0).all()
+        assert list(segments["busy"]) == [i % 2 == 1 for i in range(len(segments))]
+    fractions = vru.busy_fractions(timeline)
+    assert ((fractions >= 0) & (fractions <= 1)).all()
+    collections = vru.timeline_collections(timeline)
+    assert sum(len(collection.get_paths()) for collection in collections) == len(timeline)
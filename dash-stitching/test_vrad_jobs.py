@@ -0,0 +1,116 @@
+import os
+import time
+
+import pytest
+
+import vrad_utils as vru
+from vrad_jobs import JobManager, run_job
+
+
+def small_config(**kwargs):
+    return vru.SimConfig(4 * 60, 4, (1.5, 1.5, 1.5), (2, 5, 10), cutoff=True, seed=1, **kwargs)
+
+
+@pytest.fixture
+def jobs(tmp_path):
+    manager = JobManager(tmp_path / "jobs", max_workers=1)
+    yield manager
+    if manager.executor is not None:
+        manager.executor.shutdown()
+
+
+def wait_for(jobs, job_id, states=("done", "cancelled", "failed"), timeout=60):
+    deadline = time.time() + timeout
+    while jobs.status(job_id)["state"] not in states:
+        assert time.time() < deadline
+        time.sleep(0.05)
+    return jobs.status(job_id)
+
+
+def test_submitted_job_runs_to_done(jobs):
+    job_id = jobs.submit(small_config())
+    assert jobs.status(job_id)["state"] in ("queued", "running", "done")
+    status = wait_for(jobs, job_id)
+    assert status["state"] == "done"
+    assert status["sim_time"] > 0
+    result = jobs.result(job_id)
+    assert not result["cancelled"]
+    expected = vru.sim(small_config()).img_table
+    assert len(result["img_table"]) == len(expected)
+
+
+def test_config_as_dict(jobs):
+    job_id = jobs.submit({"sim_time": 60, "rads_count": 4, "arr_rates": [1.5, 1.5, 1.5], "seed": 1})
+    assert wait_for(jobs, job_id)["state"] == "done"
+
+
+def test_cancelled_job_stops_early(jobs):
+    job_id = jobs.submit(small_config())
+    jobs.cancel(job_id)
+    job_path = jobs.job_dir / job_id
+    # Run in process as well, checking the cancel file every few events
+    run_job(job_path, small_config(), progress_every=10)
+    assert jobs.status(job_id)["state"] == "cancelled"
+    result = jobs.result(job_id)
+    assert result["cancelled"]
+    assert result["n_events"] == 10
+
+
+def test_failed_job(tmp_path, monkeypatch):
+    def broken_state(config):
+        raise ValueError("no radiologists")
+
+    monkeypatch.setattr(vru, "gen_system_state", broken_state)
+    (tmp_path / "job").mkdir()
+    with pytest.raises(ValueError):
+        run_job(tmp_path / "job", small_config())
+    jobs = JobManager(tmp_path)
+    status = jobs.status("job")
+    assert status["state"] == "failed"
+    assert "no radiologists" in status["error"]
+    assert jobs.result("job") is None
+
+
+def test_unknown_job(jobs):
+    assert jobs.status("missing") == {"state": "unknown"}
+    assert jobs.result("missing") is None
+    jobs.cancel("missing")
+    assert not (jobs.job_dir / "missing").exists()
+
+
+def test_prune_drops_old_jobs(tmp_path):
+    jobs = JobManager(tmp_path, max_age=60)
+    for name in ("old", "new"):
+        (tmp_path / name).mkdir()
+    os.utime(tmp_path / "old", (time.time() - 120, time.time() - 120))
+    jobs.prune()
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["new"]
+
+
+def test_snapshots_resume_from_offset(tmp_path):
+    jobs = JobManager(tmp_path)
+    (tmp_path / "job").mkdir()
+    path = tmp_path / "job" / "snapshots.jsonl"
+    assert jobs.snapshots("job") == ([], 0)
+    path.write_bytes(b'{"time": 60}\n{"time": 1')
+    deltas, offset = jobs.snapshots("job")
+    # The partly written line is left for the next read
+    assert deltas == [{"time": 60}]
+    assert offset == len(b'{"time": 60}\n')
+    assert jobs.snapshots("job", offset) == ([], offset)
+    with open(path, "ab") as file:
+        file.write(b'20}\n{"time": 180}\n')
+    deltas, offset = jobs.snapshots("job", offset)
+    assert deltas == [{"time": 120}, {"time": 180}]
+    assert offset == path.stat().st_size
+
+
+def test_run_publishes_snapshots(tmp_path):
+    run_job(tmp_path, small_config(), snapshot_every=30)
+    deltas, offset = JobManager(tmp_path.parent).snapshots(tmp_path.name)
+    times = [delta["time"] for delta in deltas]
+    assert times == sorted(times)
+    assert len(deltas) >= small_config().sim_time // 30
+    result = JobManager(tmp_path.parent).result(tmp_path.name)
+    assert sum(sum(delta["completed"].values()) for delta in deltas) == len(result["img_table"])
+    assert deltas[-1]["backlog"] == len(result["unfin_img_table"]) - deltas[-1]["busy"]
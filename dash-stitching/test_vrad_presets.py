@@ -0,0 +1,109 @@
+import itertools
+import os
+import time
+
+import vrad_utils as vru
+from vrad_cache import ResultCache
+from vrad_presets import PresetLibrary, preset_key
+
+PRESETS = {
+    "small": vru.SimConfig(60, 2, (2, 2, 2), seed=1),
+    "large": vru.SimConfig(120, 4, (2, 2, 2), seed=1),
+}
+
+
+class FakeJobs:
+    # Jobs that finish when told to, with a result per job id
+    def __init__(self):
+        self.ids = itertools.count()
+        self.submitted = []
+        self.finished = set()
+        self.failed = set()
+
+    def submit(self, config):
+        job_id = str(next(self.ids))
+        self.submitted.append(config)
+        return job_id
+
+    def status(self, job_id):
+        if job_id in self.failed:
+            return {"state": "failed"}
+        return {"state": "done" if job_id in self.finished else "running"}
+
+    def result(self, job_id):
+        if job_id in self.finished:
+            return {"job_id": job_id}
+        return None
+
+
+def wait_until(condition, timeout=10):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def library(tmp_path, jobs, **kwargs):
+    cache = ResultCache(disk_dir=tmp_path / "cache")
+    return PresetLibrary(jobs, cache, presets=PRESETS, poll_interval=0.01, lock_dir=tmp_path, **kwargs)
+
+
+def test_one_process_computes_presets_others_wait_on_cache(tmp_path):
+    owner_jobs, other_jobs = FakeJobs(), FakeJobs()
+    owner, other = library(tmp_path, owner_jobs), library(tmp_path, other_jobs)
+    owner.start()
+    other.start()
+    owner.start()
+    assert len(owner_jobs.submitted) == 2
+    assert other_jobs.submitted == []
+    key = preset_key("small", PRESETS["small"])
+    # The owner polls its job, the other process waits for the cache
+    assert owner.job("small") == {"job_id": owner.job_ids["small"], "key": key}
+    assert other.job("small") == {"job_id": None, "key": key}
+    assert other.pending(key)
+    assert other_jobs.submitted == []
+    owner_jobs.finished.update(owner.job_ids.values())
+    wait_until(lambda: not owner.lock_path.exists())
+    assert not other.pending(key)
+    assert other.job("small") == {"job_id": None, "key": key}
+    assert other.cache.get(key) == {"job_id": owner.job_ids["small"]}
+
+
+def test_lock_released_when_jobs_fail(tmp_path):
+    jobs = FakeJobs()
+    owner = library(tmp_path, jobs)
+    owner.start()
+    assert owner.lock_path.exists()
+    jobs.failed.update(owner.job_ids.values())
+    wait_until(lambda: not owner.lock_path.exists())
+    # Nobody is computing the preset any more, so the next request runs it again
+    other_jobs = FakeJobs()
+    other = library(tmp_path, other_jobs)
+    key = preset_key("large", PRESETS["large"])
+    assert not other.pending(key)
+    assert other.job("large")["job_id"] is not None
+    assert other_jobs.submitted == [PRESETS["large"]]
+    assert other.lock_path.exists()
+
+
+def test_stale_lock_is_taken_over(tmp_path):
+    dead = library(tmp_path, FakeJobs())
+    dead.lock_path.touch()
+    os.utime(dead.lock_path, (time.time() - 7200, time.time() - 7200))
+    jobs = FakeJobs()
+    owner = library(tmp_path, jobs)
+    assert not owner.locked()
+    owner.start()
+    assert len(jobs.submitted) == 2
+
+
+def test_nothing_submitted_when_cached(tmp_path):
+    jobs = FakeJobs()
+    first = library(tmp_path, jobs)
+    for name, config in PRESETS.items():
+        first.cache.put(preset_key(name, config), {"name": name})
+    second = library(tmp_path, jobs)
+    second.start()
+    assert jobs.submitted == []
+    assert not second.lock_path.exists()
+    assert second.job("small")["job_id"] is None
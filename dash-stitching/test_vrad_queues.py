@@ -0,0 +1,67 @@
+import pytest
+
+import vrad_utils as vru
+from vrad_queues import EDFQueue, FIFOQueue, PriorityQueue, get_discipline
+
+
+def images(urgencies, image_type=1, facility=None):
+    return [vru.MedicalImage(i, float(i), urgency, image_type, facility) for i, urgency in enumerate(urgencies)]
+
+
+@pytest.mark.parametrize(
+    "discipline, expected",
+    (
+        (FIFOQueue, [0, 1, 2, 3]),
+        (PriorityQueue, [1, 3, 2, 0]),
+        # Deadlines are time_created + target time, 5, 3, 5 and 5, ties in arrival order
+        (EDFQueue, [1, 0, 2, 3]),
+    ),
+)
+def test_service_order(discipline, expected):
+    queue = discipline()
+    imgs = images([3, 1, 2, 1])
+    for img in imgs:
+        queue.push(img)
+    assert [img.img_id for img in queue.images()] == expected
+    assert [queue.pop().img_id for _ in range(4)] == expected
+    assert queue.pop() is None
+
+
+@pytest.mark.parametrize("discipline", (FIFOQueue, PriorityQueue, EDFQueue))
+def test_push_front_serves_first_within_its_class(discipline):
+    queue = discipline()
+    imgs = images([2, 2, 2, 2])
+    for img in imgs[:3]:
+        queue.push(img)
+    queue.push_front(imgs[3])
+    assert queue.pop() is imgs[3]
+    assert len(queue) == 3
+
+
+def test_priority_push_front_stays_behind_more_urgent():
+    queue = PriorityQueue()
+    imgs = images([1, 2, 2])
+    for img in imgs[:2]:
+        queue.push(img)
+    queue.push_front(imgs[2])
+    assert [queue.pop() for _ in range(3)] == [imgs[0], imgs[2], imgs[1]]
+
+
+@pytest.mark.parametrize("discipline", (FIFOQueue, PriorityQueue, EDFQueue))
+def test_lazy_remove(discipline):
+    queue = discipline()
+    imgs = images([3, 1, 2])
+    for img in imgs:
+        queue.push(img)
+    queue.remove(imgs[1])
+    assert len(queue) == 2
+    assert imgs[1] not in queue.images()
+    assert {queue.pop(), queue.pop(), queue.pop()} == {imgs[0], imgs[2], None}
+    assert len(queue) == 0
+
+
+def test_get_discipline():
+    assert get_discipline() is PriorityQueue
+    assert get_discipline("preemptive").preemptive
+    with pytest.raises(ValueError):
+        get_discipline("lifo")
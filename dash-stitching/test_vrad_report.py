@@ -0,0 +1,43 @@
+import os
+
+import pytest
+
+import vrad_utils as vru
+from vrad_jobs import sim_result
+from vrad_report import FIGURES, build_report
+
+
+@pytest.fixture(scope="module")
+def results():
+    configs = {
+        "calm": vru.SimConfig(60, 4, (6, 6, 6), cutoff=True, seed=1),
+        "busy": vru.SimConfig(60, 2, (2, 2, 2), cutoff=True, seed=1),
+    }
+    return {name: sim_result(vru.sim(config)) for name, config in configs.items()}
+
+
+def figure_times(out_dir):
+    return {path.name: path.stat().st_mtime_ns for path in (out_dir / "figures").iterdir()}
+
+
+def test_report_reuses_unchanged_figures(tmp_path, results):
+    index = build_report(results, tmp_path, formats=("png",), max_workers=1)
+    # One file per figure of each scenario, plus the sweep
+    first = figure_times(tmp_path)
+    assert len(first) == len(results) * len(FIGURES) + 1
+    text = index.read_text()
+    for name in first:
+        assert os.path.join("figures", name) in text
+    assert all(name in text for name in results)
+
+    # Nothing changed, nothing is drawn again
+    build_report(results, tmp_path, formats=("png",), max_workers=1)
+    assert figure_times(tmp_path) == first
+
+    # Only the changed scenario and the sweep are drawn
+    changed = dict(results, busy=sim_result(vru.sim(vru.SimConfig(60, 2, (2, 2, 2), cutoff=True, seed=2))))
+    build_report(changed, tmp_path, formats=("png",), max_workers=1)
+    second = figure_times(tmp_path)
+    assert {name: second[name] for name in first} == first
+    new = set(second) - set(first)
+    assert len(new) == len(FIGURES) + 1
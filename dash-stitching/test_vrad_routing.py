@@ -0,0 +1,90 @@
+import random
+
+import pytest
+
+import vrad_utils as vru
+from vrad_routing import (
+    BroadcastRouter,
+    JSQRouter,
+    LeastWorkRouter,
+    PowerOfDRouter,
+    RoundRobinRouter,
+    make_router,
+)
+
+
+class FakeState:
+    # Every radiologist is eligible for every image
+    def __init__(self, rads):
+        self.rads = rads
+
+    def eligible_rads(self, image):
+        return list(self.rads)
+
+
+def loaded_rads(loads):
+    # One rad per entry of loads, a list of the urgencies queued with it
+    rads = [vru.Radiologist(i, [1]) for i in range(len(loads))]
+    for rad, urgencies in zip(rads, loads):
+        for urgency in urgencies:
+            rad.add_job(vru.MedicalImage(0, 0.0, urgency, 1), 0)
+    return rads
+
+
+def image(facility=None):
+    return vru.MedicalImage(0, 0.0, 2, 1, facility)
+
+
+def test_broadcast_routes_to_every_eligible_rad():
+    rads = loaded_rads([[], [3], [1, 1]])
+    assert BroadcastRouter().route(image(), FakeState(rads)) == rads
+
+
+def test_jsq_picks_shortest_queue():
+    # Urgency 3 jobs take 10 minutes, urgency 1 jobs 2
+    rads = loaded_rads([[1, 1, 1], [3], [3, 3]])
+    assert JSQRouter().route(image(), FakeState(rads)) == [rads[1]]
+
+
+def test_least_work_picks_least_queued_time():
+    rads = loaded_rads([[1, 1, 1], [3], [3, 3]])
+    assert LeastWorkRouter().route(image(), FakeState(rads)) == [rads[0]]
+
+
+@pytest.mark.parametrize("metric, expected", (("work", 0), ("length", 1)))
+def test_power_of_d_with_every_rad_sampled(metric, expected):
+    rads = loaded_rads([[1, 1, 1], [3], [3, 3]])
+    assert PowerOfDRouter(d=3, metric=metric).route(image(), FakeState(rads)) == [rads[expected]]
+
+
+def test_power_of_d_picks_least_loaded_of_sample():
+    rads = loaded_rads([[3] * n for n in range(10)])
+    router = PowerOfDRouter(d=2)
+    random.seed(0)
+    for _ in range(50):
+        state = random.getstate()
+        sample = random.sample(rads, 2)
+        random.setstate(state)
+        assert router.route(image(), FakeState(rads)) == [min(sample, key=lambda rad: rad.queued_work)]
+
+
+def test_round_robin_cycles_per_specialty_and_facility():
+    rads = loaded_rads([[], [], []])
+    router = RoundRobinRouter()
+    state = FakeState(rads)
+    assert [router.route(image(0), state)[0] for _ in range(4)] == [rads[0], rads[1], rads[2], rads[0]]
+    assert router.route(image(1), state) == [rads[0]]
+
+
+@pytest.mark.parametrize("router", (JSQRouter(), LeastWorkRouter(), PowerOfDRouter(), RoundRobinRouter()))
+def test_no_eligible_rad(router):
+    assert router.route(image(), FakeState([])) == []
+
+
+def test_make_router():
+    assert isinstance(make_router(), BroadcastRouter)
+    assert make_router("power_of_d", d=3).d == 3
+    router = JSQRouter()
+    assert make_router(router) is router
+    with pytest.raises(ValueError):
+        make_router("shortest")
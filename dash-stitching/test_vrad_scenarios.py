@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+import vrad_scenarios as vs
+
+
+def small_scenario(seed=0, **kwargs):
+    params = dict(n_rads=40, n_facilities=12, n_specialties=6, n_procedures=30, n_studies=2000, sim_time=12 * 60)
+    params.update(kwargs)
+    return vs.generate_scenario(seed=seed, **params)
+
+
+def test_tables():
+    scenario = small_scenario()
+    assert set(scenario) == {"fac_id_df", "priv_df", "proc_id_df", "rad_sched_df", "restr_df", "rad_spec_df", "study_df"}
+    study_df = scenario["study_df"]
+    assert len(study_df) == 2000
+    assert study_df["Created Time"].is_monotonic_increasing
+    assert set(study_df["Urgency"]) <= {1, 2, 3}
+    # Specialty of a study is the specialty of its procedure
+    proc_specialty = scenario["proc_id_df"].set_index("ProcedureID")["Specialty"]
+    assert (proc_specialty[study_df["ProcedureID"]].to_numpy() == study_df["Specialty"].to_numpy()).all()
+    assert set(scenario["proc_id_df"]["Specialty"]) == set(range(1, 7))
+
+
+def test_workbook_tables():
+    # The columns the notebooks read from the vRad workbooks
+    scenario = small_scenario(sim_time=36 * 60)
+    rad_sched_df = scenario["rad_sched_df"]
+    assert sorted(rad_sched_df["RadiologistID"].unique()) == list(range(40))
+    assert len(rad_sched_df) == 40 * 2
+    start_time = rad_sched_df["Start Time"][0]
+    for column in ("Start", "End"):
+        relative = (rad_sched_df[f"{column} Time"] - start_time) / np.timedelta64(1, "s") / 60
+        np.testing.assert_array_equal(relative, rad_sched_df[f"Relative {column} Time"])
+    assert (rad_sched_df["Relative End Time"] - rad_sched_df["Relative Start Time"] == 24 * 60).all()
+    restr_df = scenario["restr_df"]
+    assert restr_df.empty
+    assert list(restr_df.columns) == ["RadiologistID", "FacilityID", "ProcedureID"]
+    assert (restr_df.dtypes == np.int32).all()
+
+
+def test_seeded_scenarios_are_reproducible():
+    first, second = small_scenario(seed=3), small_scenario(seed=3)
+    for name in first:
+        assert first[name].equals(second[name])
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_every_specialty_and_facility_is_covered(seed):
+    # Few radiologists for many specialties, where the skewed draw leaves specialties out
+    scenario = small_scenario(seed, n_rads=8, n_specialties=20, n_facilities=30)
+    rad_spec_df, priv_df = scenario["rad_spec_df"], scenario["priv_df"]
+    assert set(rad_spec_df["Specialty"]) == set(range(1, 21))
+    assert set(rad_spec_df["RadiologistID"]) == set(range(8))
+    assert not rad_spec_df.duplicated().any()
+    pairs = rad_spec_df.merge(priv_df, on="RadiologistID")
+    assert len(pairs[["Specialty", "FacilityID"]].drop_duplicates()) == 20 * 30
+
+
+def test_popularity_is_skewed():
+    study_df = small_scenario(n_studies=20000)["study_df"]
+    volumes = np.bincount(study_df["FacilityID"], minlength=12)
+    assert volumes[0] > 3 * volumes[-1]
+
+
+@pytest.mark.parametrize("dispatch", ("push", "pull"))
+def test_scenario_runs(dispatch):
+    scenario = small_scenario()
+    s = vs.gen_scenario_state(scenario, (2, 5, 10), cutoff=True, dispatch=dispatch)
+    assert len(s.images) == 2000
+    assert len(s.rads) == 40
+    s.run_simulation()
+    assert len(s.img_table) + len(s.unfin_img_table) == 2000
+    # Every study was read by a radiologist with the specialty and the privileges
+    rads = {rad.rad_id: rad for rad in s.rads}
+    images = {img.img_id: img for img in s.images}
+    for img_id, rad_id in zip(s.img_table["img_id"], s.img_table["rad_id"]):
+        img, rad = images[img_id], rads[rad_id]
+        assert img.image_type in rad.specialties
+        assert rad.has_privileges(img.facility)
@@ -0,0 +1,98 @@
+import math
+
+import numpy as np
+import pytest
+
+from vrad_stats import KPIStats, RunningStats, TDigest, merge_kpis
+
+
+def digest_of(values, **kwargs):
+    digest = TDigest(**kwargs)
+    for x in values:
+        digest.add(x)
+    return digest
+
+
+@pytest.mark.parametrize("q, tolerance", ((0.01, 0.002), (0.1, 0.01), (0.5, 0.02), (0.9, 0.01), (0.99, 0.002)))
+def test_quantile_rank_error(q, tolerance):
+    # Error measured in rank, tightest in the tails
+    values = np.random.default_rng(0).exponential(10, 50000)
+    estimate = digest_of(values).quantile(q)
+    assert abs(np.mean(values <= estimate) - q) < tolerance
+
+
+def test_memory_stays_bounded():
+    digest = digest_of(np.random.default_rng(1).normal(size=100000), delta=100)
+    digest.quantile(0.5)
+    assert len(digest.means) <= 100
+    assert digest.weights.sum() == digest.count == 100000
+
+
+def test_extremes():
+    values = np.random.default_rng(2).normal(size=2000)
+    digest = digest_of(values)
+    assert digest.quantile(0) == values.min()
+    assert digest.quantile(1) == values.max()
+
+
+def test_merge_matches_single_digest():
+    rng = np.random.default_rng(3)
+    parts = [rng.lognormal(size=n) for n in (5000, 20000, 700)]
+    merged = TDigest()
+    for part in parts:
+        merged.merge(digest_of(part))
+    values = np.concatenate(parts)
+    assert merged.count == len(values)
+    for q in (0.1, 0.5, 0.9, 0.99):
+        assert abs(np.mean(values <= merged.quantile(q)) - q) < 0.02
+
+
+def test_merge_keeps_extremes():
+    # The extremes of other sit inside its centroids, not at their means
+    low = digest_of(np.linspace(0, 1, 5000))
+    high = digest_of(np.linspace(10, 20, 5000))
+    low.merge(high)
+    assert low.min == 0 and low.max == 20
+    assert low.quantile(1) == 20
+    empty = TDigest()
+    empty.merge(digest_of([3.0, 4.0]))
+    assert (empty.min, empty.max) == (3.0, 4.0)
+
+
+def test_empty_and_single_value():
+    assert math.isnan(TDigest().quantile(0.5))
+    assert digest_of([7.0]).quantile(0.9) == 7.0
+
+
+def test_running_stats_merge():
+    rng = np.random.default_rng(4)
+    a, b = rng.normal(size=300), rng.normal(5, 2, size=200)
+    stats = RunningStats()
+    for x in a:
+        stats.add(x)
+    other = RunningStats()
+    for x in b:
+        other.add(x)
+    stats.merge(other)
+    values = np.concatenate([a, b])
+    assert stats.count == 500
+    assert stats.mean == pytest.approx(values.mean())
+    assert stats.var == pytest.approx(values.var(ddof=1))
+    assert (stats.min, stats.max) == (values.min(), values.max())
+
+
+def test_kpi_summary_and_merge():
+    first, second = KPIStats(), KPIStats()
+    for kpi, waits in ((first, [1.0, 2.0, 3.0]), (second, [10.0])):
+        for wait in waits:
+            kpi.arrive(1)
+            kpi.add(1, wait, wait + 2, target=4)
+    second.arrive(2)
+    summary = merge_kpis([first, second]).summary().set_index("urgency")
+    assert summary.loc[1, "arrived"] == 4 and summary.loc[1, "completed"] == 4
+    assert summary.loc[1, "sla_breaches"] == 2
+    assert summary.loc[1, "wait_mean"] == 4.0
+    assert summary.loc[1, "wait_p99"] <= 10.0
+    assert summary.loc[2, "completion_rate"] == 0
+    # The inputs are left unchanged
+    assert first.total[1].count == 3
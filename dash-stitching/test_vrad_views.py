@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import vrad_views
+from vrad_views import filter_mask, minmax_decimate, results_figure, table_page, view_positions
+
+
+@pytest.fixture
+def img_table():
+    return pd.DataFrame({
+        "img_id": np.arange(10),
+        "urgency": [1, 2, 3, 1, 2, 3, 1, 2, 3, 1],
+        "rad_id": [0, 1, 2, 3, 0, 1, 2, 3, 0, 1],
+        "wait_time": [5.0, 40.0, 12.5, 31.0, 0.0, 60.0, 2.0, 33.0, 90.0, 7.5],
+    })
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    (
+        ("{urgency} = 1", [0, 3, 6, 9]),
+        ("{urgency} eq 1 && {wait_time} > 6", [3, 9]),
+        ("{wait_time} >= 33 && {wait_time} < 90", [1, 7, 5]),
+        ("{rad_id} contains 3", [3, 7]),
+        ("{wait_time} <= 2", [4, 6]),
+        ("{urgency} != 3 && {rad_id} ne 0", [1, 3, 6, 7, 9]),
+    ),
+)
+def test_filter_mask(img_table, query, expected):
+    assert sorted(np.flatnonzero(filter_mask(img_table, query))) == sorted(expected)
+
+
+@pytest.mark.parametrize("query", ("{missing} = 1", "{urgency} > high", "urgency", ""))
+def test_unparseable_filter_parts_are_ignored(img_table, query):
+    assert filter_mask(img_table, query).all()
+
+
+def test_view_positions_sort_and_filter(img_table):
+    positions = view_positions(img_table, (("urgency", "asc"), ("wait_time", "desc")), "{rad_id} < 3")
+    view = img_table.iloc[positions]
+    assert list(view["img_id"]) == [9, 0, 6, 1, 4, 8, 5, 2]
+    assert list(view_positions(img_table, (), "")) == list(range(10))
+
+
+def test_sort_keeps_ties_in_row_order(img_table):
+    positions = view_positions(img_table, (("urgency", "desc"),), "")
+    assert list(img_table.iloc[positions]["img_id"]) == [2, 5, 8, 1, 4, 7, 0, 3, 6, 9]
+
+
+def test_table_pages_cover_the_view(img_table):
+    positions = view_positions(img_table, (("wait_time", "asc"),), "{urgency} != 2")
+    pages = []
+    for page_current in range(3):
+        page, page_count = table_page(img_table, positions, page_current, 3)
+        assert page_count == 3
+        pages.append(page)
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert list(pd.concat(pages)["wait_time"]) == sorted(img_table.loc[img_table.urgency != 2, "wait_time"])
+    page, page_count = table_page(img_table, positions[:0], 0, 3)
+    assert page.empty and page_count == 1
+
+
+def test_minmax_decimate_keeps_extrema_of_every_bin():
+    rng = np.random.default_rng(0)
+    x = rng.uniform(0, 100, 10000)
+    y = rng.exponential(10, 10000)
+    # Bins 2 wide
+    x[:2] = 0, 100
+    kept = minmax_decimate(x, y, 50)
+    assert len(kept) <= 100
+    assert len(np.unique(kept)) == len(kept)
+    bins = np.minimum((x // 2).astype(int), 49)
+    for b in range(50):
+        in_bin = np.flatnonzero(bins == b)
+        kept_in_bin = kept[bins[kept] == b]
+        assert y[kept_in_bin].min() == y[in_bin].min()
+        assert y[kept_in_bin].max() == y[in_bin].max()
+
+
+def test_minmax_decimate_single_point_and_constant_x():
+    assert list(minmax_decimate(np.array([3.0]), np.array([1.0]), 10)) == [0]
+    kept = minmax_decimate(np.zeros(5), np.array([4.0, 1.0, 9.0, 2.0, 3.0]), 10)
+    assert sorted(kept) == [1, 2]
+
+
+def results_table(n):
+    rng = np.random.default_rng(1)
+    return pd.DataFrame({
+        "img_id": np.arange(n),
+        "urgency": rng.integers(1, 4, n),
+        "time_created": np.sort(rng.uniform(0, 1000, n)),
+        "total_time": rng.exponential(20, n),
+    })
+
+
+def test_results_figure_decimates_large_views(monkeypatch):
+    monkeypatch.setattr(vrad_views, "max_graph_points", 1000)
+    monkeypatch.setattr(vrad_views, "decimation_bins", 20)
+    img_table = results_table(5000)
+    fig = results_figure(img_table)
+    assert sum(len(trace.x) for trace in fig.data) <= 3 * 2 * 20
+    assert fig.layout.title.text is not None
+    # The worst study of each urgency stays visible
+    for trace in fig.data:
+        of_urgency = img_table[img_table["urgency"] == int(trace.name)]
+        assert max(trace.y) == of_urgency["total_time"].max()
+    # Zoomed in on few enough studies, every one is drawn
+    fig = results_figure(img_table, x_range=(0, 100))
+    in_range = (img_table["time_created"] <= 100).sum()
+    assert sum(len(trace.x) for trace in fig.data) == in_range
+    assert fig.layout.title.text is None
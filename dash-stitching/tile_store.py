@@ -0,0 +1,30 @@
+import numpy as np
+
+from lru_store import LRUStore
+
+
+class TileStore(LRUStore):
+    """
+    Mosaics of uploaded tiles, keyed by a hash of the upload.
+
+    The most recently used mosaics are kept in memory, up to ``max_bytes``.
+    When ``disk_dir`` is given, every mosaic is also saved there as a
+    ``.npy`` file, so all server processes can read any upload. Past
+    ``disk_max_bytes``, the least recently used files are removed. See
+    ``lru_store.LRUStore``.
+    """
+
+    suffix = ".npy"
+    load_errors = (OSError, ValueError)
+
+    def __init__(self, max_bytes=512 * 2 ** 20, disk_dir=None, disk_max_bytes=2 * 2 ** 30):
+        super().__init__(max_bytes, disk_dir, disk_max_bytes)
+
+    def _nbytes(self, mosaic):
+        return mosaic.nbytes
+
+    def _load_file(self, file):
+        return np.load(file)
+
+    def _dump_file(self, file, mosaic):
+        np.save(file, mosaic)
@@ -0,0 +1,64 @@
+import hashlib
+import json
+import pickle
+
+import pandas as pd
+
+from lru_store import LRUStore
+
+
+def cache_key(*params):
+    # Stable hash of a normalized parameter tuple
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+
+def result_hash(result):
+    # Content hash of a result's frames and scalars, other objects (the kpi) are derived from them
+    digest = hashlib.sha1()
+    for name in sorted(result):
+        value = result[name]
+        if isinstance(value, pd.DataFrame):
+            digest.update(name.encode())
+            digest.update(json.dumps(list(map(str, value.columns))).encode())
+            digest.update(pd.util.hash_pandas_object(value).to_numpy().tobytes())
+        elif isinstance(value, (int, float, bool, str)):
+            digest.update(json.dumps([name, value]).encode())
+    return digest.hexdigest()
+
+
+def result_nbytes(result):
+    nbytes = 0
+    for value in result.values():
+        if isinstance(value, pd.DataFrame):
+            nbytes += int(value.memory_usage(deep=True).sum())
+        else:
+            nbytes += getattr(value, "nbytes", 64)
+    return nbytes
+
+
+class ResultCache(LRUStore):
+    """
+    Bounded LRU cache of simulation results, with an optional on-disk tier.
+
+    The in-memory tier holds at most ``max_bytes`` of results, sized by
+    ``result_nbytes``, and evicts the least recently used ones. When
+    ``disk_dir`` is given, results are also pickled there (capped at
+    ``disk_max_bytes``, least recently used files removed first), so they
+    survive restarts and are shared between server processes. See
+    ``lru_store.LRUStore``.
+    """
+
+    suffix = ".pkl"
+    load_errors = (OSError, pickle.UnpicklingError, EOFError)
+
+    def __init__(self, max_bytes=256 * 2 ** 20, disk_dir=None, disk_max_bytes=2 * 2 ** 30):
+        super().__init__(max_bytes, disk_dir, disk_max_bytes)
+
+    def _nbytes(self, result):
+        return result_nbytes(result)
+
+    def _load_file(self, file):
+        return pickle.load(file)
+
+    def _dump_file(self, file, result):
+        pickle.dump(result, file, protocol=pickle.HIGHEST_PROTOCOL)
@@ -0,0 +1,85 @@
+import dataclasses
+import random
+from dataclasses import dataclass
+
+from vrad_queues import DISCIPLINES
+from vrad_routing import ROUTERS
+
+DISPATCH_MODES = ("push", "pull", "batch")
+
+
+@dataclass(frozen=True)
+class SimConfig:
+    """
+    Immutable parameters of one simulation run.
+
+    Passed explicitly to ``vrad_utils.sim`` and ``SystemState`` instead of
+    module globals, so concurrent runs in threads or processes cannot see
+    each other's parameters. Per urgency values (``arr_rates``,
+    ``urg_times``, ``target_times``) are tuples indexed by urgency - 1.
+    ``router`` names a routing policy of ``vrad_routing.ROUTERS`` and
+    ``router_options`` holds its keyword arguments as sorted (name, value)
+    pairs; every ``SystemState`` builds its own router from them, so no run
+    shares a router's state (e.g. a round robin cursor) with another.
+    The queue length of every radiologist is sampled every
+    ``queue_sample_every`` minutes, ``None`` turns the sampling off.
+    """
+
+    sim_time: float
+    rads_count: int = 0
+    arr_rates: tuple = ()
+    urg_times: tuple = (2, 5, 10)
+    constant_rads: bool = False
+    cutoff: bool = False
+    verbose: bool = False
+    router: str = None
+    router_options: tuple = ()
+    dispatch: str = "push"
+    batch_interval: float = 15
+    batch_threshold: int = None
+    discipline: str = None
+    seed: int = None
+    queue_sample_every: float = 60
+    target_times: tuple = (2, 3, 5)
+    specialties: tuple = (1, 2, 3, 4, 5)
+
+    def __post_init__(self):
+        # Lists from callers and JSON are frozen into tuples
+        for name in ("arr_rates", "urg_times", "target_times", "specialties"):
+            object.__setattr__(self, name, tuple(getattr(self, name)))
+        object.__setattr__(self, "router_options", tuple(sorted(dict(self.router_options).items())))
+        self.validate()
+
+    def validate(self):
+        if self.sim_time < 0 or self.rads_count < 0:
+            raise ValueError("sim_time and rads_count must not be negative")
+        if self.router is not None and self.router not in ROUTERS:
+            raise ValueError(f"Unknown routing policy {self.router!r}, choose from {sorted(ROUTERS)}")
+        if self.dispatch not in DISPATCH_MODES:
+            raise ValueError(f"Unknown dispatch mode {self.dispatch!r}, choose from {list(DISPATCH_MODES)}")
+        if self.discipline is not None and self.discipline not in DISCIPLINES:
+            raise ValueError(f"Unknown queue discipline {self.discipline!r}, choose from {sorted(DISCIPLINES)}")
+        if self.batch_interval <= 0:
+            raise ValueError("batch_interval must be positive")
+        if self.queue_sample_every is not None and self.queue_sample_every <= 0:
+            raise ValueError("queue_sample_every must be positive, or None to turn the sampling off")
+        if len(self.urg_times) != len(self.target_times) or len(self.arr_rates) > len(self.urg_times):
+            raise ValueError("arr_rates, urg_times and target_times need one value per urgency")
+
+    def target_time(self, urgency):
+        return self.target_times[urgency - 1]
+
+    def process_time(self, urgency):
+        return self.urg_times[urgency - 1]
+
+    def replace(self, **changes):
+        return dataclasses.replace(self, **changes)
+
+    def rad_specialties(self, rng=random):
+        # Specialties of each radiologist, the same every run when constant_rads is set
+        if self.constant_rads:
+            rng = random.Random(0)
+        return [
+            rng.sample(self.specialties, rng.randrange(2, len(self.specialties)))
+            for _ in range(self.rads_count)
+        ]
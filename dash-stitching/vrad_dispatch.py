@@ -0,0 +1,194 @@
+import heapq
+import itertools
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+
+def urgency_priority(image):
+    # Most urgent first, oldest first within an urgency
+    return (image.urgency, image.time_created)
+
+
+class PullDispatcher:
+    """
+    Central pull queues (work-stealing mode).
+
+    Waiting studies sit in one heap per (image type, facility) instead of
+    being copied into every capable radiologist's queue. An arrival goes
+    straight to an idle capable radiologist if there is one, otherwise it is
+    pushed on its heap in O(log n). The head of every heap is also kept in
+    one heap of heads per image type, with lazy invalidation: a head that
+    has since been popped or overtaken is dropped when it reaches the top.
+    A radiologist finishing a job pulls the best study it can read from
+    the top of the heads of its specialties, only falling back to the heaps
+    of its own facilities when a facility it lacks privileges for is ahead.
+    """
+
+    def __init__(self, rads, priority=urgency_priority):
+        self.priority = priority
+        self.heaps = {}
+        self.heads = {}
+        self.facilities_by_type = {}
+        self.counter = itertools.count()
+        self.size = 0
+        self.idle_by_specialty = {}
+        for rad in rads:
+            self.set_idle(rad)
+
+    def __len__(self):
+        return self.size
+
+    def set_idle(self, rad):
+        for specialty in rad.specialties:
+            self.idle_by_specialty.setdefault(specialty, {})[rad] = None
+
+    def set_busy(self, rad):
+        for specialty in rad.specialties:
+            self.idle_by_specialty[specialty].pop(rad, None)
+
+    def find_idle_rad(self, image):
+        for rad in self.idle_by_specialty.get(image.image_type, {}):
+            if rad.has_privileges(image.facility):
+                return rad
+        return None
+
+    def push(self, image):
+        self._push((self.priority(image), next(self.counter), image))
+
+    def push_front(self, image):
+        # Ahead of the waiting studies of its class, e.g. a preempted job: the last element
+        # of the priority orders studies within their class and a prefix sorts first
+        self._push((self.priority(image)[:-1], -next(self.counter), image))
+
+    def _push(self, entry):
+        image = entry[-1]
+        key = (image.image_type, image.facility)
+        if key not in self.heaps:
+            self.heaps[key] = []
+            self.heads.setdefault(image.image_type, [])
+            self.facilities_by_type.setdefault(image.image_type, []).append(image.facility)
+        heapq.heappush(self.heaps[key], entry)
+        self.size += 1
+        if self.heaps[key][0] is entry:
+            self._push_head(key)
+
+    def _push_head(self, key):
+        # Record the current head of a heap, compacting the heads once mostly stale
+        heap = self.heaps[key]
+        if not heap:
+            return
+        specialty = key[0]
+        heads = self.heads[specialty]
+        facilities = self.facilities_by_type[specialty]
+        if len(heads) > 2 * len(facilities):
+            heads[:] = [self.heaps[(specialty, f)][0] for f in facilities if self.heaps[(specialty, f)]]
+            heapq.heapify(heads)
+        heapq.heappush(heads, heap[0])
+
+    def _is_head(self, entry):
+        heap = self.heaps[(entry[-1].image_type, entry[-1].facility)]
+        return bool(heap) and heap[0] is entry
+
+    def _best_entry(self, rad, specialty):
+        # Best entry of a specialty the radiologist can read, or None
+        heads = self.heads.get(specialty)
+        while heads and not self._is_head(heads[0]):
+            heapq.heappop(heads)
+        if not heads:
+            return None
+        if rad.has_privileges(heads[0][-1].facility):
+            return heads[0]
+        if len(rad.facilities) < len(heads):
+            heaps = (self.heaps.get((specialty, facility)) for facility in itertools.chain(rad.facilities, [None]))
+            entries = [heap[0] for heap in heaps if heap]
+        else:
+            entries = [entry for entry in heads if self._is_head(entry) and rad.has_privileges(entry[-1].facility)]
+        return min(entries, default=None)
+
+    def pop(self, rad):
+        # Best waiting study among the heaps the radiologist is eligible for
+        best = None
+        for specialty in rad.specialties:
+            entry = self._best_entry(rad, specialty)
+            if entry is not None and (best is None or entry < best):
+                best = entry
+        if best is None:
+            return None
+        image = best[-1]
+        key = (image.image_type, image.facility)
+        heapq.heappop(self.heaps[key])
+        self.size -= 1
+        self._push_head(key)
+        return image
+
+    def remove(self, images):
+        # Bulk removal, each touched heap is filtered and re-heapified once
+        removed = set(images)
+        for key in {(image.image_type, image.facility) for image in removed}:
+            heap = [entry for entry in self.heaps[key] if entry[-1] not in removed]
+            heapq.heapify(heap)
+            self.size -= len(self.heaps[key]) - len(heap)
+            self.heaps[key] = heap
+            self._push_head(key)
+
+    def waiting_images(self):
+        return [entry[-1] for heap in self.heaps.values() for entry in heap]
+
+
+class BatchDispatcher(PullDispatcher):
+    """
+    Periodic batch assignment between waiting studies and free radiologists.
+
+    Arrivals wait in the central heaps for the next batch, run every
+    ``interval`` minutes of simulated time or as soon as the backlog reaches
+    ``threshold``. A radiologist finishing a job still pulls its next study
+    straight away, as in pull mode, so only the radiologists left idle in
+    between are matched and throughput is never capped at one study per
+    radiologist per batch. Each batch solves a rectangular
+    min-cost assignment (``scipy.optimize.linear_sum_assignment``) where
+    ineligible pairs are never matched, studies with the least slack before
+    their target time go first, and generalists are kept free for the
+    studies only they can read.
+    """
+
+    def __init__(self, rads, interval=15, threshold=None, max_batch=2000, priority=urgency_priority):
+        super().__init__(rads, priority)
+        self.interval = interval
+        self.threshold = threshold
+        self.max_batch = max_batch
+
+    def backlog_exceeded(self):
+        return self.threshold is not None and self.size >= self.threshold
+
+    def idle_rads(self):
+        rads = {}
+        for idle in self.idle_by_specialty.values():
+            rads.update(idle)
+        return list(rads)
+
+    def match(self, time):
+        rads = self.idle_rads()
+        entries = [entry for heap in self.heaps.values() for entry in heap]
+        if not rads or not entries:
+            return []
+        if len(entries) > self.max_batch:
+            entries = heapq.nsmallest(self.max_batch, entries)
+        images = [entry[-1] for entry in entries]
+        types, facilities = {}, {}
+        type_codes = np.array([types.setdefault(img.image_type, len(types)) for img in images])
+        fac_codes = np.array([facilities.setdefault(img.facility, len(facilities)) for img in images])
+        rad_types = np.array([[t in rad.specialties for t in types] for rad in rads])
+        rad_facilities = np.array([[rad.has_privileges(f) for f in facilities] for rad in rads])
+        eligible = rad_types[:, type_codes].T & rad_facilities[:, fac_codes].T
+        if not eligible.any():
+            return []
+        slack = np.array([img.time_created + img.target_time for img in images]) - time
+        # Any eligible pair beats leaving a study unmatched, then least slack wins
+        big = 2 * np.abs(slack).max() + 1
+        n_specialties = np.array([len(rad.specialties) for rad in rads])
+        cost = np.where(eligible, slack[:, None] - big + 1e-3 * n_specialties[None, :], 0)
+        rows, cols = linear_sum_assignment(cost)
+        keep = eligible[rows, cols]
+        pairs = [(images[i], rads[j]) for i, j in zip(rows[keep], cols[keep])]
+        self.remove([img for img, _ in pairs])
+        return pairs
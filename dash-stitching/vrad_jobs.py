@@ -0,0 +1,170 @@
+import json
+import os
+import pathlib
+import pickle
+import random
+import shutil
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import vrad_utils as vru
+
+
+def _write_json(path, data):
+    # Write to a temporary file first so readers never see a partial file
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w") as file:
+        json.dump(data, file)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def sim_result(s):
+    # Compact, picklable result of a run, without the object graph of the state
+    img_table = s.img_table.astype(
+        {"img_id": np.int64, "urgency": np.int8, "rad_id": np.int32}
+    )
+    return {
+        "img_table": img_table,
+        "unfin_img_table": s.unfin_img_table,
+        "timeline": vru.timeline_table(s.rads),
+        "kpi": s.kpi,
+        "queue_history": pd.DataFrame({
+            "time": np.array(s.time_steps, dtype=float),
+            "queued": np.array(s.queued, dtype=np.int32),
+        }),
+        "sim_time": s.time,
+        "n_events": s.n_events,
+        "cancelled": s.cancelled,
+    }
+
+
+def run_job(job_path, config, progress_every=2000, snapshot_every=60):
+    """
+    Run one simulation in a worker process.
+
+    Progress is written to ``status.json`` in the job directory every
+    ``progress_every`` events, and the run stops early once a ``cancel``
+    file shows up there. Every ``snapshot_every`` simulated minutes the
+    engine's snapshot delta is appended as one line to ``snapshots.jsonl``.
+    The result is pickled to ``result.pkl``.
+    """
+    job_path = pathlib.Path(job_path)
+    if not isinstance(config, vru.SimConfig):
+        config = vru.SimConfig(**config)
+    status_path = job_path / "status.json"
+    cancel_path = job_path / "cancel"
+    snapshots = open(job_path / "snapshots.jsonl", "a")
+    start = time.time()
+    horizon = config.sim_time * 2 if config.cutoff else config.sim_time
+
+    def status(state, s=None):
+        data = {"state": state, "wall_time": time.time() - start, "horizon": horizon}
+        if s is not None:
+            data.update(sim_time=s.time, n_events=s.n_events)
+        _write_json(status_path, data)
+
+    def progress(s):
+        status("running", s)
+        return cancel_path.exists()
+
+    def publish(delta):
+        # One complete line per write, so readers never see half a snapshot
+        snapshots.write(json.dumps(delta) + "\n")
+        snapshots.flush()
+
+    status("running")
+    if config.seed is None:
+        # Forked workers inherit the parent's random state, draw fresh entropy instead
+        random.seed()
+        np.random.seed()
+    try:
+        s = vru.gen_system_state(config)
+        s.run_simulation(progress, progress_every, publish, snapshot_every)
+        with open(job_path / "result.pkl", "wb") as file:
+            pickle.dump(sim_result(s), file, protocol=pickle.HIGHEST_PROTOCOL)
+        status("cancelled" if s.cancelled else "done", s)
+    except Exception as e:
+        _write_json(status_path, {"state": "failed", "error": repr(e), "wall_time": time.time() - start})
+        raise
+    finally:
+        snapshots.close()
+
+
+class JobManager:
+    """
+    Local queue of background simulation jobs backed by a process pool.
+
+    Job state lives in one directory per job under ``job_dir``, so any
+    server thread or process sharing that directory can poll, cancel or
+    fetch the result of a job, whoever submitted it.
+    """
+
+    def __init__(self, job_dir=None, max_workers=None, max_age=24 * 3600):
+        if job_dir is None:
+            job_dir = pathlib.Path(tempfile.gettempdir()) / "vrad_jobs"
+        self.job_dir = pathlib.Path(job_dir)
+        self.job_dir.mkdir(parents=True, exist_ok=True)
+        self.max_workers = max_workers
+        self.max_age = max_age
+        self.executor = None
+
+    def submit(self, config):
+        # config is a vrad_utils.SimConfig, or a dict of its fields
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(self.max_workers)
+        self.prune()
+        job_id = uuid.uuid4().hex
+        job_path = self.job_dir / job_id
+        job_path.mkdir()
+        _write_json(job_path / "status.json", {"state": "queued", "wall_time": 0})
+        self.executor.submit(run_job, str(job_path), config)
+        return job_id
+
+    def status(self, job_id):
+        status = _read_json(self.job_dir / job_id / "status.json")
+        if status is None:
+            return {"state": "unknown"}
+        return status
+
+    def cancel(self, job_id):
+        job_path = self.job_dir / job_id
+        if job_path.exists():
+            (job_path / "cancel").touch()
+
+    def snapshots(self, job_id, offset=0):
+        # Snapshot deltas published after byte offset, and the offset to resume from
+        try:
+            with open(self.job_dir / job_id / "snapshots.jsonl", "rb") as file:
+                file.seek(offset)
+                data = file.read()
+        except OSError:
+            return [], offset
+        # Leave a partly written last line for the next read
+        data = data[:data.rfind(b"\n") + 1]
+        return [json.loads(line) for line in data.splitlines()], offset + len(data)
+
+    def result(self, job_id):
+        try:
+            with open(self.job_dir / job_id / "result.pkl", "rb") as file:
+                return pickle.load(file)
+        except OSError:
+            return None
+
+    def prune(self):
+        # Drop the directories of jobs older than max_age seconds
+        now = time.time()
+        for job_path in self.job_dir.iterdir():
+            if now - job_path.stat().st_mtime > self.max_age:
+                shutil.rmtree(job_path, ignore_errors=True)
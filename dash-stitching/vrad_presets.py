@@ -0,0 +1,143 @@
+import dataclasses
+import os
+import pathlib
+import threading
+import time
+
+import vrad_cache
+import vrad_utils as vru
+
+
+# Seeded so each preset has one result per engine version
+PRESETS = {
+    "demo": vru.SimConfig(5 * 60, 6, (2, 2, 2), (2, 5, 10), cutoff=True, seed=1),
+    "weekday": vru.SimConfig(10 * 60, 10, (6, 2, 1.5), (2, 5, 10), cutoff=True, seed=1),
+    "surge": vru.SimConfig(10 * 60, 10, (3, 1, 0.75), (2, 5, 10), cutoff=True, seed=1),
+    "night_shift": vru.SimConfig(8 * 60, 3, (8, 6, 6), (2, 5, 10), cutoff=True, seed=1),
+}
+
+PRESET_LABELS = {
+    "demo": "Demo",
+    "weekday": "Typical weekday",
+    "surge": "Surge",
+    "night_shift": "Night shift",
+}
+
+
+def preset_key(name, config):
+    # Changes with the engine version, so stale results are never served
+    return vrad_cache.cache_key("preset", name, vru.ENGINE_VERSION, dataclasses.asdict(config))
+
+
+class PresetLibrary:
+    """
+    Preset scenarios computed once in the background and kept in a result cache.
+
+    ``start`` submits the presets missing from ``cache`` to ``jobs`` and
+    stores their results as they finish. With an on-disk cache, presets
+    are only computed again after an engine version change. ``start`` only
+    runs once per library, and with a ``lock_dir`` shared by several
+    processes (e.g. gunicorn workers) only the process holding the lock
+    file submits presets. The lock is released once every submitted preset
+    has finished, and the other processes wait for the results to show up
+    in the shared cache rather than running the presets again. A lock
+    older than ``lock_timeout`` seconds is left over by a process that
+    died and is taken over.
+    """
+
+    def __init__(self, jobs, cache, presets=PRESETS, poll_interval=1, lock_dir=None, lock_timeout=3600):
+        self.jobs = jobs
+        self.cache = cache
+        self.presets = presets
+        self.poll_interval = poll_interval
+        self.lock_timeout = lock_timeout
+        self.lock_path = None
+        if lock_dir is not None:
+            keys = sorted(preset_key(name, config) for name, config in presets.items())
+            self.lock_path = pathlib.Path(lock_dir) / f"presets-{vrad_cache.cache_key(*keys)}.lock"
+        self.job_ids = {}
+        self.started = False
+        self.start_lock = threading.Lock()
+
+    def start(self):
+        with self.start_lock:
+            if self.started:
+                return
+            self.started = True
+            missing = [name for name, config in self.presets.items() if preset_key(name, config) not in self.cache]
+            if missing and self._acquire():
+                self._submit(missing)
+
+    def _submit(self, names):
+        # Called with the lock held, _collect releases it
+        for name in names:
+            self.job_ids[name] = self.jobs.submit(self.presets[name])
+        threading.Thread(target=self._collect, args=({name: self.job_ids[name] for name in names},),
+                         daemon=True).start()
+
+    def _acquire(self):
+        # Create the lock file of this set of presets, False if another process holds it
+        if self.lock_path is None:
+            return True
+        try:
+            if time.time() - self.lock_path.stat().st_mtime > self.lock_timeout:
+                self.lock_path.unlink()
+        except FileNotFoundError:
+            pass
+        try:
+            os.close(os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            return False
+        return True
+
+    def _release(self):
+        if self.lock_path is None:
+            return
+        try:
+            self.lock_path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def locked(self):
+        # True while some process holds a live lock on this set of presets
+        if self.lock_path is None:
+            return False
+        try:
+            return time.time() - self.lock_path.stat().st_mtime <= self.lock_timeout
+        except FileNotFoundError:
+            return False
+
+    def _collect(self, pending):
+        try:
+            while pending:
+                time.sleep(self.poll_interval)
+                for name, job_id in list(pending.items()):
+                    if self.jobs.status(job_id)["state"] in ("queued", "running"):
+                        continue
+                    result = self.jobs.result(job_id)
+                    if result is not None:
+                        self.cache.put(preset_key(name, self.presets[name]), result)
+                    del pending[name]
+        finally:
+            self._release()
+
+    def pending(self, key):
+        # True while the preset with this key is computed by another process
+        return key not in self.cache and self.locked()
+
+    def job(self, name):
+        """
+        sim-job store of a preset. A preset this process submitted is polled
+        like a regular run, one computed by another process has no job id
+        and is waited for in the cache. Only when nobody is computing it is
+        the preset submitted again.
+        """
+        key = preset_key(name, self.presets[name])
+        if key in self.cache:
+            return {"job_id": None, "key": key}
+        with self.start_lock:
+            if name not in self.job_ids:
+                if not self._acquire():
+                    return {"job_id": None, "key": key}
+                self._submit([name])
+            return {"job_id": self.job_ids[name], "key": key}
@@ -0,0 +1,163 @@
+import heapq
+import itertools
+from collections import deque
+
+
+class FIFOQueue:
+    """
+    Waiting images of a radiologist, served in arrival order.
+
+    All disciplines share the same interface (push, push_front, pop,
+    remove, images) and use lazy deletion: ``remove`` only marks the
+    image, which is dropped when it reaches the front, so no event costs
+    O(queue length).
+    ``priority`` is the ordering key, also used by the central pull queues,
+    whose last element orders images within their class. ``push_front``
+    puts an image back at the head of its class, e.g. a preempted job.
+    """
+
+    preemptive = False
+
+    @staticmethod
+    def priority(image):
+        return (image.time_created,)
+
+    def __init__(self):
+        self.items = deque()
+        self.removed = set()
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def push(self, image):
+        self.removed.discard(image)
+        self.items.append(image)
+        self.size += 1
+
+    def push_front(self, image):
+        self.removed.discard(image)
+        self.items.appendleft(image)
+        self.size += 1
+
+    def remove(self, image):
+        self.removed.add(image)
+        self.size -= 1
+
+    def _pop_live(self, items):
+        while items:
+            image = items.popleft()
+            if image in self.removed:
+                self.removed.discard(image)
+            else:
+                return image
+        return None
+
+    def pop(self):
+        image = self._pop_live(self.items)
+        if image is not None:
+            self.size -= 1
+        return image
+
+    def images(self):
+        return [image for image in self.items if image not in self.removed]
+
+
+class PriorityQueue(FIFOQueue):
+    # Static priority: one FIFO bucket per urgency, most urgent first
+    @staticmethod
+    def priority(image):
+        return (image.urgency, image.time_created)
+
+    def __init__(self):
+        super().__init__()
+        self.buckets = {}
+
+    def _bucket(self, urgency):
+        if urgency not in self.buckets:
+            self.buckets[urgency] = deque()
+            self.buckets = dict(sorted(self.buckets.items()))
+        return self.buckets[urgency]
+
+    def push(self, image):
+        self.removed.discard(image)
+        self._bucket(image.urgency).append(image)
+        self.size += 1
+
+    def push_front(self, image):
+        self.removed.discard(image)
+        self._bucket(image.urgency).appendleft(image)
+        self.size += 1
+
+    def pop(self):
+        for bucket in self.buckets.values():
+            image = self._pop_live(bucket)
+            if image is not None:
+                self.size -= 1
+                return image
+        return None
+
+    def images(self):
+        return [
+            image
+            for bucket in self.buckets.values()
+            for image in bucket
+            if image not in self.removed
+        ]
+
+
+class PreemptiveQueue(PriorityQueue):
+    # Static priority, and an urgency 1 arrival preempts a less urgent job in service
+    preemptive = True
+
+
+class EDFQueue(FIFOQueue):
+    # Earliest deadline first on time_created + target_time, backed by a heap
+    @staticmethod
+    def priority(image):
+        return (image.time_created + image.target_time,)
+
+    def __init__(self):
+        super().__init__()
+        self.items = []
+        self.counter = itertools.count()
+
+    def push(self, image):
+        self.removed.discard(image)
+        heapq.heappush(self.items, (self.priority(image), next(self.counter), image))
+        self.size += 1
+
+    def push_front(self, image):
+        self.removed.discard(image)
+        heapq.heappush(self.items, ((), -next(self.counter), image))
+        self.size += 1
+
+    def pop(self):
+        while self.items:
+            image = heapq.heappop(self.items)[-1]
+            if image in self.removed:
+                self.removed.discard(image)
+            else:
+                self.size -= 1
+                return image
+        return None
+
+    def images(self):
+        return [entry[-1] for entry in sorted(self.items) if entry[-1] not in self.removed]
+
+
+DISCIPLINES = {
+    "fifo": FIFOQueue,
+    "priority": PriorityQueue,
+    "edf": EDFQueue,
+    "preemptive": PreemptiveQueue,
+}
+
+
+def get_discipline(discipline=None):
+    if discipline is None:
+        discipline = "priority"
+    try:
+        return DISCIPLINES[discipline]
+    except KeyError:
+        raise ValueError(f"Unknown queue discipline {discipline!r}, choose from {sorted(DISCIPLINES)}")
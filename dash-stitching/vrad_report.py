@@ -0,0 +1,152 @@
+import html
+import os
+import pathlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import vrad_cache
+
+# matplotlib is only imported in the worker processes, see _pyplot
+
+URGENCY_COLORS = {1: "red", 2: "orange", 3: "green"}
+
+
+def _pyplot():
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def draw_queue_lengths(ax, result):
+    history = result["queue_history"]
+    ax.plot(history["time"], history["queued"], drawstyle="steps-post", linewidth=0.8)
+    ax.set_xlabel("time")
+    ax.set_ylabel("Images queued")
+    ax.set_title("Queue length")
+
+
+def draw_wait_hist(ax, result):
+    img_table = result["img_table"]
+    for urg, wait in img_table.groupby("urgency")["wait_time"]:
+        ax.hist(wait.astype(float), bins=40, color=URGENCY_COLORS.get(urg), alpha=0.5,
+                label=f"urgency {urg}: {len(wait)} images")
+    ax.set_xlabel("time (mins)")
+    ax.set_ylabel("Number of Images")
+    ax.set_title("Wait time")
+    ax.legend()
+
+
+def draw_utilization(ax, result):
+    timeline = result["timeline"]
+    total = timeline.groupby("rad_id")["duration"].sum()
+    busy = timeline["duration"].where(timeline["busy"], 0).groupby(timeline["rad_id"]).sum()
+    ax.bar(total.index, busy / total)
+    ax.set_xlabel("Radiologist ID")
+    ax.set_ylabel("Fraction of Time Busy")
+    ax.set_title("Utilization")
+
+
+def draw_completion(ax, result):
+    finished = np.sort(result["img_table"]["time_job_finished"].to_numpy(dtype=float))
+    created = np.sort(np.concatenate([
+        result["img_table"]["time_created"].to_numpy(dtype=float),
+        result["unfin_img_table"]["time_created"].to_numpy(dtype=float),
+    ]))
+    ax.step(created, np.arange(1, len(created) + 1), where="post", label="arrived")
+    ax.step(finished, np.arange(1, len(finished) + 1), where="post", label="completed")
+    ax.set_xlabel("time")
+    ax.set_ylabel("Number of Images")
+    ax.set_title("Completion")
+    ax.legend()
+
+
+FIGURES = {
+    "queue_lengths": draw_queue_lengths,
+    "wait_hist": draw_wait_hist,
+    "utilization": draw_utilization,
+    "completion": draw_completion,
+}
+
+
+def render_scenario(result, paths, formats):
+    # Worker: draws every figure of one scenario and saves it in each format
+    plt = _pyplot()
+    for name, draw in FIGURES.items():
+        fig, ax = plt.subplots(figsize=(6, 4))
+        draw(ax, result)
+        fig.tight_layout()
+        for fmt in formats:
+            fig.savefig(f"{paths[name]}.{fmt}")
+        plt.close(fig)
+
+
+def render_sweep(names, completion_rates, path, formats):
+    # Worker: completion rate of each scenario of the sweep
+    plt = _pyplot()
+    fig, ax = plt.subplots(figsize=(max(6, len(names) * 0.15), 4))
+    ax.bar(range(len(names)), completion_rates)
+    ax.set_xticks(range(len(names)))
+    ax.set_xticklabels(names, rotation=90, fontsize=6)
+    ax.set_ylabel("Fraction of Images completed")
+    ax.set_title("Completion by scenario")
+    fig.tight_layout()
+    for fmt in formats:
+        fig.savefig(f"{path}.{fmt}")
+    plt.close(fig)
+
+
+def build_report(results, out_dir, formats=("png", "svg"), max_workers=None):
+    """
+    Write the standard figures of every scenario of a sweep and an HTML index.
+
+    ``results`` maps a scenario name to its result (``vrad_jobs.sim_result``).
+    Figures are rendered headless in a process pool and stored under the
+    hash of the result they were drawn from, so scenarios whose result did
+    not change since the last build are not drawn again. Returns the path
+    of ``index.html``.
+    """
+    out_dir = pathlib.Path(out_dir)
+    fig_dir = out_dir / "figures"
+    fig_dir.mkdir(parents=True, exist_ok=True)
+    entries = []
+    with ProcessPoolExecutor(max_workers) as executor:
+        futures = []
+        for name, result in results.items():
+            digest = vrad_cache.result_hash(result)
+            paths = {fig: fig_dir / f"{digest}_{fig}" for fig in FIGURES}
+            missing = any(not os.path.exists(f"{path}.{fmt}") for path in paths.values() for fmt in formats)
+            if missing:
+                futures.append(executor.submit(render_scenario, result, paths, formats))
+            entries.append((name, paths, result["kpi"].summary()))
+        rates = [
+            kpi["completed"].sum() / kpi["arrived"].sum() if kpi["arrived"].sum() else 0.0
+            for _, _, kpi in entries
+        ]
+        sweep_digest = vrad_cache.cache_key([name for name, _, _ in entries], rates)
+        sweep_path = fig_dir / f"{sweep_digest}_sweep"
+        if any(not os.path.exists(f"{sweep_path}.{fmt}") for fmt in formats):
+            futures.append(executor.submit(render_sweep, [name for name, _, _ in entries], rates, sweep_path, formats))
+        for future in futures:
+            future.result()
+    index_path = out_dir / "index.html"
+    with open(index_path, "w") as file:
+        file.write(_index_html(entries, sweep_path, out_dir, formats[0]))
+    return index_path
+
+
+def _index_html(entries, sweep_path, out_dir, fmt):
+    def img(path):
+        return f'<img src="{os.path.relpath(f"{path}.{fmt}", out_dir)}" width="480">'
+
+    parts = ["<html><head><title>Simulation report</title></head><body>",
+             "<h1>Simulation report</h1>", img(sweep_path), "<ul>"]
+    parts += [f'<li><a href="#s{i}">{html.escape(str(name))}</a></li>' for i, (name, _, _) in enumerate(entries)]
+    parts.append("</ul>")
+    for i, (name, paths, kpi) in enumerate(entries):
+        parts.append(f'<h2 id="s{i}">{html.escape(str(name))}</h2>')
+        parts.append(kpi.to_html(index=False, float_format="%.3g"))
+        parts.append("<div>" + "".join(img(path) for path in paths.values()) + "</div>")
+    parts.append("</body></html>")
+    return "\n".join(parts)
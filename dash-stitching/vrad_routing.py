@@ -0,0 +1,98 @@
+import random
+
+
+class Router:
+    """
+    Base class of the routing policies.
+
+    ``route(image, state)`` returns the list of radiologists whose queue the
+    image is added to. ``state.eligible_rads(image)`` gives the radiologists
+    able to read it, from an index built once per simulation.
+    """
+
+    def route(self, image, state):
+        raise NotImplementedError
+
+
+class BroadcastRouter(Router):
+    # Image goes to every capable radiologist, the first to start it wins
+    def route(self, image, state):
+        return state.eligible_rads(image)
+
+
+class JSQRouter(Router):
+    # Join the shortest queue
+    def route(self, image, state):
+        rads = state.eligible_rads(image)
+        if not rads:
+            return []
+        return [min(rads, key=lambda rad: rad.queue_size())]
+
+
+class LeastWorkRouter(Router):
+    # Join the queue with the least estimated work left
+    def route(self, image, state):
+        rads = state.eligible_rads(image)
+        if not rads:
+            return []
+        return [min(rads, key=lambda rad: rad.estimate_queue_time())]
+
+
+class PowerOfDRouter(Router):
+    """
+    Sample ``d`` capable radiologists and keep the least loaded one.
+
+    The cost per arrival is O(d) whatever the size of the roster.
+    ``metric`` is either "work" (estimated queue time) or "length".
+    """
+
+    def __init__(self, d=2, metric="work"):
+        self.d = d
+        if metric == "length":
+            self.load = lambda rad: rad.queue_size()
+        else:
+            self.load = lambda rad: rad.estimate_queue_time()
+
+    def route(self, image, state):
+        rads = state.eligible_rads(image)
+        if len(rads) > self.d:
+            rads = random.sample(rads, self.d)
+        if not rads:
+            return []
+        return [min(rads, key=self.load)]
+
+
+class RoundRobinRouter(Router):
+    # Cycle through the capable radiologists of each specialty
+    def __init__(self):
+        self.next_index = {}
+
+    def route(self, image, state):
+        rads = state.eligible_rads(image)
+        if not rads:
+            return []
+        key = (image.image_type, image.facility)
+        ind = self.next_index.get(key, 0)
+        self.next_index[key] = ind + 1
+        return [rads[ind % len(rads)]]
+
+
+ROUTERS = {
+    "broadcast": BroadcastRouter,
+    "jsq": JSQRouter,
+    "least_work": LeastWorkRouter,
+    "power_of_d": PowerOfDRouter,
+    "round_robin": RoundRobinRouter,
+}
+
+
+def make_router(policy=None, **kwargs):
+    # Accepts a policy name from ROUTERS or a Router instance
+    if policy is None:
+        policy = "broadcast"
+    if isinstance(policy, Router):
+        return policy
+    try:
+        return ROUTERS[policy](**kwargs)
+    except KeyError:
+        raise ValueError(f"Unknown routing policy {policy!r}, choose from {sorted(ROUTERS)}")
@@ -0,0 +1,195 @@
+import numpy as np
+import pandas as pd
+import vrad_utils as vru
+
+
+def _zipf_weights(n, skew):
+    weights = 1.0 / np.arange(1, n + 1) ** skew
+    return weights / weights.sum()
+
+
+def _weighted_subsets(rng, weights, sizes):
+    # Gumbel top-k: one weighted sample without replacement per row, all rows at once
+    keys = np.log(weights)[None, :] + rng.gumbel(size=(len(sizes), len(weights)))
+    order = np.argsort(-keys, axis=1)
+    keep = np.arange(len(weights))[None, :] < sizes[:, None]
+    rows = np.nonzero(keep)[0]
+    return rows, order[keep]
+
+
+def generate_scenario(
+    n_rads=2000,
+    n_facilities=300,
+    n_specialties=20,
+    n_procedures=400,
+    n_studies=1000000,
+    sim_time=7 * 24 * 60,
+    urgency_mix=(0.1, 0.3, 0.6),
+    skew=1.1,
+    start_time="2021-01-04",
+    seed=None,
+):
+    """
+    Generate a synthetic large-scale scenario.
+
+    Facility volumes, specialty popularity and privilege counts all follow
+    heavy-tailed distributions, so a few large facilities and common
+    specialties dominate the load the way they do on production rosters.
+
+    Parameters
+    ----------
+
+    n_rads: int
+        number of radiologists.
+    n_facilities: int
+        number of facilities.
+    n_specialties: int
+        number of specialties (image types).
+    n_procedures: int
+        number of procedure codes, each mapped to one specialty.
+    n_studies: int
+        number of studies created over ``sim_time``.
+    sim_time: float
+        length of the scenario in minutes.
+    urgency_mix: tuple
+        fraction of studies with urgency 1, 2 and 3.
+    skew: float
+        Zipf exponent used for facility and specialty popularity.
+    start_time: str
+        wall-clock time corresponding to minute 0.
+    seed: int
+        seed of the random generator.
+
+    Returns
+    -------
+
+    Dictionary of DataFrames laid out like the vRad workbooks
+    (``fac_id_df``, ``priv_df``, ``proc_id_df``, ``rad_sched_df``,
+    ``restr_df``), plus ``rad_spec_df`` (RadiologistID, Specialty) and
+    ``study_df`` (one row per study). Every radiologist works all-day
+    shifts, one row per day in ``rad_sched_df``, and ``restr_df`` is empty.
+    """
+    rng = np.random.default_rng(seed)
+    start_time = pd.Timestamp(start_time)
+    rad_ids = np.arange(n_rads, dtype=np.int32)
+    fac_ids = np.arange(n_facilities, dtype=np.int32)
+    specialties = np.arange(1, n_specialties + 1, dtype=np.int16)
+    fac_weights = _zipf_weights(n_facilities, skew)
+    spec_weights = _zipf_weights(n_specialties, skew)
+
+    fac_id_df = pd.DataFrame(
+        {"FacilityID": fac_ids, "FacilityName": [f"Facility {i}" for i in fac_ids]}
+    )
+    # Every specialty gets at least one procedure code
+    n_procedures = max(n_procedures, n_specialties)
+    proc_specialty = np.concatenate(
+        [specialties, rng.choice(specialties, n_procedures - n_specialties, p=spec_weights)]
+    )
+    proc_id_df = pd.DataFrame(
+        {
+            "ProcedureID": np.arange(len(proc_specialty), dtype=np.int32),
+            "Modality": rng.choice(["CT", "MR", "XR", "US", "NM"], len(proc_specialty)),
+            "Specialty": proc_specialty,
+        }
+    )
+
+    # Most radiologists read a couple of specialties, a few read many
+    n_spec = np.clip(rng.geometric(0.45, n_rads), 1, n_specialties)
+    rows, cols = _weighted_subsets(rng, spec_weights, n_spec)
+    spec_matrix = np.zeros((n_rads, n_specialties), dtype=bool)
+    spec_matrix[rows, cols] = True
+    # Every specialty needs at least one radiologist reading it
+    uncovered = np.flatnonzero(~spec_matrix.any(axis=0))
+    spec_matrix[rng.choice(n_rads, len(uncovered)), uncovered] = True
+    rows, cols = np.nonzero(spec_matrix)
+    rad_spec_df = pd.DataFrame({"RadiologistID": rad_ids[rows], "Specialty": specialties[cols]})
+
+    # Privilege counts are heavy tailed, big facilities credential more radiologists
+    n_priv = np.clip(np.rint(rng.pareto(1.5, n_rads) * 3) + 1, 1, n_facilities).astype(int)
+    rows, cols = _weighted_subsets(rng, fac_weights, n_priv)
+    priv = np.zeros((n_rads, n_facilities), dtype=bool)
+    priv[rows, cols] = True
+    # Every (specialty, facility) pair needs at least one eligible radiologist
+    coverage = spec_matrix.T.astype(np.int32) @ priv.astype(np.int32)
+    for spec_ind, fac in zip(*np.nonzero(coverage == 0)):
+        priv[rng.choice(np.flatnonzero(spec_matrix[:, spec_ind])), fac] = True
+    rows, cols = np.nonzero(priv)
+    priv_df = pd.DataFrame({"RadiologistID": rad_ids[rows], "FacilityID": fac_ids[cols]})
+
+    # All-day shifts, with the relative times in minutes the notebooks add to the workbook
+    n_days = int(np.ceil(sim_time / (24 * 60)))
+    shift_start = np.tile(np.arange(n_days) * 24 * 60, n_rads)
+    rad_sched_df = pd.DataFrame(
+        {
+            "RadiologistID": np.repeat(rad_ids, n_days),
+            "Start Time": start_time + pd.to_timedelta(shift_start, unit="m"),
+            "End Time": start_time + pd.to_timedelta(shift_start + 24 * 60, unit="m"),
+            "Relative Start Time": shift_start.astype(float),
+            "Relative End Time": shift_start + 24 * 60.0,
+        }
+    )
+    restr_df = pd.DataFrame(
+        {
+            "RadiologistID": np.array([], dtype=np.int32),
+            "FacilityID": np.array([], dtype=np.int32),
+            "ProcedureID": np.array([], dtype=np.int32),
+        }
+    )
+
+    time_created = np.sort(rng.uniform(0, sim_time, n_studies))
+    facility = rng.choice(fac_ids, n_studies, p=fac_weights)
+    proc_weights = spec_weights[proc_specialty - 1] / np.bincount(proc_specialty)[proc_specialty]
+    procedure = rng.choice(len(proc_specialty), n_studies, p=proc_weights / proc_weights.sum())
+    study_df = pd.DataFrame(
+        {
+            "StudyID": np.arange(n_studies, dtype=np.int64),
+            "FacilityID": facility.astype(np.int32),
+            "ProcedureID": procedure.astype(np.int32),
+            "Specialty": proc_specialty[procedure],
+            "Urgency": rng.choice(np.arange(1, 4, dtype=np.int8), n_studies, p=urgency_mix),
+            "Created Time": start_time + pd.to_timedelta(time_created, unit="m"),
+        }
+    )
+    return {
+        "fac_id_df": fac_id_df,
+        "priv_df": priv_df,
+        "proc_id_df": proc_id_df,
+        "rad_sched_df": rad_sched_df,
+        "restr_df": restr_df,
+        "rad_spec_df": rad_spec_df,
+        "study_df": study_df,
+    }
+
+
+def load_scenario(scenario, config=vru.DEFAULT_CONFIG):
+    # Build engine objects from the scenario tables
+    study_df = scenario["study_df"]
+    start_time = study_df["Created Time"].iloc[0].normalize()
+    rel_time = (study_df["Created Time"] - start_time) / np.timedelta64(1, "s") / 60
+    med_images = [
+        vru.MedicalImage(img_id, time_created, urgency, image_type, facility, config)
+        for img_id, time_created, urgency, image_type, facility in zip(
+            study_df.StudyID.tolist(),
+            rel_time.tolist(),
+            study_df.Urgency.tolist(),
+            study_df.Specialty.tolist(),
+            study_df.FacilityID.tolist(),
+        )
+    ]
+    specs_by_rad = scenario["rad_spec_df"].groupby("RadiologistID")["Specialty"].apply(list)
+    facs_by_rad = scenario["priv_df"].groupby("RadiologistID")["FacilityID"].apply(set)
+    radiologists = [
+        vru.Radiologist(rad_id, specs_by_rad[rad_id], facilities=facs_by_rad.get(rad_id, set()))
+        for rad_id in specs_by_rad.index
+    ]
+    return med_images, radiologists
+
+
+def gen_scenario_state(scenario, urg_times, cutoff=False, verbose=False, router=None, dispatch="push"):
+    study_df = scenario["study_df"]
+    sim_time = (study_df["Created Time"].iloc[-1] - study_df["Created Time"].iloc[0].normalize()) / np.timedelta64(1, "m")
+    config = vru.SimConfig(sim_time, len(scenario["rad_spec_df"].RadiologistID.unique()), urg_times=urg_times,
+                           cutoff=cutoff, verbose=verbose, router=router, dispatch=dispatch)
+    med_images, radiologists = load_scenario(scenario, config)
+    events = vru.create_initial_events(config.sim_time, med_images, cutoff)
+    return vru.SystemState(config, events, med_images, radiologists)
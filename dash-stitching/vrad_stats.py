@@ -0,0 +1,225 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+
+class RunningStats:
+    # Count, mean and variance updated in O(1) (Welford), mergeable (Chan et al.)
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+
+    def merge(self, other):
+        count = self.count + other.count
+        if count == 0:
+            return self
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.mean += delta * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def var(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else math.nan
+
+    @property
+    def std(self):
+        return math.sqrt(self.var)
+
+
+class TDigest:
+    """
+    Merging t-digest (Dunning) for streaming quantiles.
+
+    Values are buffered and folded into at most about ``delta`` centroids
+    once ``buffer_size`` of them have arrived, so ``add`` is O(1) amortized
+    and memory stays bounded. Digests of separate runs merge without their
+    raw data, and quantile estimates are most accurate in the tails.
+    """
+
+    def __init__(self, delta=100, buffer_size=500):
+        self.delta = delta
+        self.buffer_size = buffer_size
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.buffer = []
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x):
+        self.buffer.append(x)
+        self.count += 1
+        if len(self.buffer) >= self.buffer_size:
+            self._compress()
+
+    @property
+    def nbytes(self):
+        # Centroid arrays and buffered values, for sizing caches of results
+        return self.means.nbytes + self.weights.nbytes + 8 * len(self.buffer) + 64
+
+    def merge(self, other):
+        other._compress()
+        self._compress(other.means, other.weights)
+        self.count += other.count
+        # The centroid means of other lie inside its range, its extremes are kept separately
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def _compress(self, means=None, weights=None):
+        buffer = np.asarray(self.buffer, dtype=float)
+        self.buffer = []
+        parts_m = [self.means, buffer]
+        parts_w = [self.weights, np.ones(len(buffer))]
+        if means is not None:
+            parts_m.append(means)
+            parts_w.append(weights)
+        all_means = np.concatenate(parts_m)
+        all_weights = np.concatenate(parts_w)
+        if len(all_means) == 0:
+            return
+        self.min = min(self.min, all_means.min())
+        self.max = max(self.max, all_means.max())
+        order = np.argsort(all_means, kind="mergesort")
+        all_means = all_means[order]
+        all_weights = all_weights[order]
+        total = all_weights.sum()
+        # Scale function k1: centroids span at most one unit of k, small near q=0 and q=1
+        k_scale = self.delta / (2 * math.pi)
+        new_means, new_weights = [], []
+        cum = 0.0
+        mean, weight = all_means[0], all_weights[0]
+        k_left = k_scale * math.asin(-1.0)
+        for m, w in zip(all_means[1:], all_weights[1:]):
+            q = (cum + weight + w) / total
+            if k_scale * math.asin(2 * min(q, 1.0) - 1) - k_left <= 1:
+                weight += w
+                mean += (m - mean) * w / weight
+            else:
+                new_means.append(mean)
+                new_weights.append(weight)
+                cum += weight
+                k_left = k_scale * math.asin(2 * cum / total - 1)
+                mean, weight = m, w
+        new_means.append(mean)
+        new_weights.append(weight)
+        self.means = np.array(new_means)
+        self.weights = np.array(new_weights)
+
+    def quantile(self, q):
+        self._compress()
+        if self.count == 0:
+            return math.nan
+        if len(self.means) == 1:
+            return float(self.means[0])
+        # Centroid means sit at the middle of their weight, the ends are pinned to min and max
+        positions = np.concatenate([[0], np.cumsum(self.weights) - self.weights / 2, [self.count]])
+        values = np.concatenate([[self.min], self.means, [self.max]])
+        return float(np.interp(q * self.count, positions, values))
+
+
+class KPIStats:
+    """
+    Online per-urgency KPIs of a run, updated in O(1) per completion.
+
+    Tracks arrivals, completions, running mean and variance and t-digest
+    quantiles of wait and total time, and the number of studies finished
+    after their target time (SLA breaches). Stats of parallel replications
+    combine with ``merge``.
+    """
+
+    quantiles = (0.5, 0.9, 0.99)
+
+    def __init__(self):
+        self.arrived = {}
+        self.breaches = {}
+        self.wait = {}
+        self.total = {}
+        self.wait_digest = {}
+        self.total_digest = {}
+
+    def _init_urgency(self, urgency):
+        self.arrived[urgency] = 0
+        self.breaches[urgency] = 0
+        self.wait[urgency] = RunningStats()
+        self.total[urgency] = RunningStats()
+        self.wait_digest[urgency] = TDigest()
+        self.total_digest[urgency] = TDigest()
+
+    def arrive(self, urgency):
+        if urgency not in self.arrived:
+            self._init_urgency(urgency)
+        self.arrived[urgency] += 1
+
+    def add(self, urgency, wait, total, target):
+        if urgency not in self.arrived:
+            self._init_urgency(urgency)
+        self.wait[urgency].add(wait)
+        self.total[urgency].add(total)
+        self.wait_digest[urgency].add(wait)
+        self.total_digest[urgency].add(total)
+        if total > target:
+            self.breaches[urgency] += 1
+
+    @property
+    def nbytes(self):
+        # Approximate size, dominated by the t-digests
+        digests = list(self.wait_digest.values()) + list(self.total_digest.values())
+        return sum(digest.nbytes for digest in digests) + 256 * len(self.arrived) + 64
+
+    def merge(self, other):
+        for urgency in other.arrived:
+            if urgency not in self.arrived:
+                self._init_urgency(urgency)
+            self.arrived[urgency] += other.arrived[urgency]
+            self.breaches[urgency] += other.breaches[urgency]
+            self.wait[urgency].merge(other.wait[urgency])
+            self.total[urgency].merge(other.total[urgency])
+            self.wait_digest[urgency].merge(other.wait_digest[urgency])
+            self.total_digest[urgency].merge(other.total_digest[urgency])
+        return self
+
+    def summary(self):
+        # One row per urgency
+        rows = []
+        for urgency in sorted(self.arrived):
+            completed = self.total[urgency].count
+            row = {
+                "urgency": urgency,
+                "arrived": self.arrived[urgency],
+                "completed": completed,
+                "completion_rate": completed / self.arrived[urgency] if self.arrived[urgency] else math.nan,
+                "sla_breaches": self.breaches[urgency],
+                "breach_rate": self.breaches[urgency] / completed if completed else math.nan,
+            }
+            for name, stats, digest in (("wait", self.wait, self.wait_digest), ("total", self.total, self.total_digest)):
+                row[f"{name}_mean"] = stats[urgency].mean if completed else math.nan
+                row[f"{name}_std"] = stats[urgency].std
+                for q in self.quantiles:
+                    row[f"{name}_p{round(q * 100)}"] = digest[urgency].quantile(q)
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+
+def merge_kpis(kpis):
+    # Combined stats of several replications, the inputs are left unchanged
+    merged = KPIStats()
+    for kpi in kpis:
+        merged.merge(kpi)
+    return merged
@@ -4,46 +4,24 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
+from matplotlib.collections import PolyCollection
 import sys
+import heapq
+import itertools
+from vrad_routing import make_router
+from vrad_queues import get_discipline
+from vrad_dispatch import PullDispatcher, BatchDispatcher
+from vrad_config import SimConfig
+from vrad_stats import KPIStats
 sys.setrecursionlimit(10000)
 
 
-class G:
-    ITERATIONS = 100
-    DURATIONS = 6120
+#Bump whenever a change to the engine changes the results of a seeded run
+ENGINE_VERSION = 7
 
-    
-G.target_times = {
-    1: 2,
-    2: 3,
-    3: 5
-}
-
-
-def update_target_times(target_times):
-    G.target_times = {
-        1: target_times[0],
-        2: target_times[1],
-        3: target_times[2]
-    }
+#Defaults for objects built outside of a run, e.g. in notebooks
+DEFAULT_CONFIG = SimConfig(sim_time=0)
 
-    
-G.specialties = {
-    1: '1',
-    2: '2',
-    3: '3',
-    4: '4',
-    5: '5'
-}
-
-
-def update_globals(urg_times):
-    G.process_times = {
-                        1: urg_times[0],
-                        2: urg_times[1],
-                        3: urg_times[2]
-                    }    
-    
 
 def create_arrival_times(sim_time, arr_rates):  #[time_between_urg 1 images, etc..]
     arrival_times_dict = {}
@@ -63,28 +41,18 @@ def create_arrival_times(sim_time, arr_rates):  #[time_between_urg 1 images, etc
     return arrival_times_dict, arrival_times_tuples_list
 
 
-def create_medical_images(arrival_times_tuples_list):
+def create_medical_images(arrival_times_tuples_list, config=DEFAULT_CONFIG):
     med_images = []
+    specialties = list(config.specialties)
     for img_id, tup in enumerate(arrival_times_tuples_list):
-        med_images.append(MedicalImage(img_id, tup[1], tup[0], random.sample(list(G.specialties.keys()), 1)[0]))
+        med_images.append(MedicalImage(img_id, tup[1], tup[0], random.sample(specialties, 1)[0], config=config))
     print(f"{len(med_images)} medical images")
     return med_images
 
-
-def create_constant_rads(num_rads):
-    specialties_list = []
-    for i in range(num_rads):
-        specialties_list.append(random.sample(list(G.specialties.keys()), random.randrange(2,len(G.specialties))))
-    G.const_specialities = specialties_list
-
     
-def create_radiologists(num_rads, constant_rads):
+def create_radiologists(config):
     radiologists = []
-    for i in range(num_rads):
-        if constant_rads:
-            specialties_temp = G.const_specialities[i] 
-        else:
-            specialties_temp = random.sample(list(G.specialties.keys()), random.randrange(2,len(G.specialties)))
+    for i, specialties_temp in enumerate(config.rad_specialties()):
         radiologists.append(Radiologist(i, specialties_temp))
     return radiologists
 
@@ -99,35 +67,35 @@ def create_initial_events(sim_duration, med_images, cutoff=False):
     return events
 
 
-def start_simulation(events, med_images, radiologists, constant_rads, cutoff=False):
-    s = SystemState(events, med_images, G.radiologists, cutoff)
-    s.run_simulation()
-
-
 class MedicalImage(object):    
-    def __init__(self, img_id, time_created, urgency, image_type):#, modality, speciality, urgency, image_label):
+    def __init__(self, img_id, time_created, urgency, image_type, facility=None, config=DEFAULT_CONFIG):#, modality, speciality, urgency, image_label):
         self.img_id = img_id
         self.time_created = time_created
         self.urgency = urgency
         self.image_type = image_type
-        self.target_time = G.target_times[urgency]
-        self.time_remaining = G.target_times[urgency]
-        self.est_process_time = G.process_times[urgency]
+        self.facility = facility
+        self.target_time = config.target_time(urgency)
+        self.time_remaining = self.target_time
+        self.est_process_time = config.process_time(urgency)
         self.in_queues = []   #keep track on which queues image is in [rad_id, position]
         self.time_seen = 0
         self.time_done = 0
         self.rad_seen = "None"
+        self.remaining_service = None   #set when the job is preempted
         
     def update_time_remaining(self, t):
         self.time_remaining = self.target_time - (t - self.time_created)
         
         
 class Radiologist:
-    def __init__(self, rad_id, specialties, working=True):
-        self.queue = []
+    def __init__(self, rad_id, specialties, working=True, facilities=None, discipline=None):
+        self.current = None     #image in service
+        self.waiting = get_discipline(discipline)()     #images waiting, ordered by the queue discipline
+        self.done_event = None
         self.queue_data = []#[med_image, image_id, image_urgency, time_left, est_time]
         self.rad_id = rad_id
         self.specialties = specialties
+        self.facilities = facilities    #facilities the rad is privileged at, None means all
         self.is_working = working
         self.is_idle = 1
         self.images_served = []
@@ -141,18 +109,35 @@ class Radiologist:
         self.service_starts = []
         self.service_ends = []
         self.service_time = []  
+        self.queued_work = 0    #running sum of est_process_time over the queue
         
+    @property
+    def queue(self):
+        #image in service first, then the waiting images in service order
+        current = [] if self.current is None else [self.current]
+        return current + self.waiting.images()
+
+    def queue_size(self):
+        return (self.current is not None) + len(self.waiting)
+
+    def set_discipline(self, discipline):
+        self.waiting = get_discipline(discipline)()
+
     def get_stats(self):
         return self.idle_times, self.busy_times, self.queue_length, self.service_starts, self.service_ends, self.service_time 
         
     def show_queue(self):
         return self.queue
+
+    def has_privileges(self, facility):
+        return self.facilities is None or facility is None or facility in self.facilities
     
     def estimate_queue_time(self):
-        t = 0
-        for img in self.queue:
-            t += img.est_process_time
-        return t
+        return self.queued_work
+
+    def remove_job(self, med_image):
+        self.waiting.remove(med_image)
+        self.queued_work -= med_image.est_process_time
     
     def add_job(self, med_image, time):
         #update idle time tracker
@@ -160,42 +145,24 @@ class Radiologist:
             self.idle_times.append(time - self.time_idle_start)
             self.time_busy_start = time
         self.is_idle = 0
-        #add img to queue and sort
-        #self.queue.append(med_image)
-        #if len(self.queue) > 1:
-        #    self.sort_queue()
-        if len(self.queue) <= 1:
-            self.queue.append(med_image)
+        self.queued_work += med_image.est_process_time
+        if self.queue_size() <= 1:
             self.queue_data.append([med_image, med_image.img_id, med_image.urgency, med_image.time_remaining, med_image.est_process_time, med_image.est_process_time]) #[image_id, image_urgency, time_left, est_time]
-        else:
-            if med_image.urgency == 1:
-                ins_ind = 1
-                for ind, img in enumerate(self.queue[1:]):
-                    if img.urgency > 1:
-                        ins_ind = ind + 1
-                        break          
-                self.queue.insert(ins_ind, med_image)
-            elif med_image.urgency == 2:
-                ins_ind = 1
-                for ind, img in enumerate(self.queue[1:]):
-                    if img.urgency > 2:
-                        ins_ind = ind + 1
-                        break          
-                self.queue.insert(ins_ind, med_image)
-            else:
-                self.queue.append(med_image)
-
-    def sort_queue(self):
-        curr_img = self.queue[0]
-        queue_tuple = [[img, img.urgency] for img in self.queue[1:]]
-        queue_tuple = sorted(queue_tuple, key=lambda x: x[1])
-        #print(queue_tuple)
-        queue_tuple_list = [tup[0] for tup in queue_tuple]
-        self.queue = queue_tuple_list
-        self.queue.insert(0, curr_img)
+        self.waiting.push(med_image)
+
+    def next_job(self):
+        self.current = self.waiting.pop()
+        return self.current
+
+    def end_job(self):
+        med_image = self.current
+        self.current = None
+        self.done_event = None
+        self.queued_work -= med_image.est_process_time
+        return med_image
        
     def finish_job(self, time):
-        if len(self.queue) == 0:
+        if self.queue_size() == 0:
             self.time_finished_last_job = time
             self.time_idle_start = time
             self.busy_times.append(time - self.time_busy_start)
@@ -210,109 +177,252 @@ class Radiologist:
     def update_queue(self, time):
         for img in self.queue:
             img.update_time_remaining(time)
-        #sort_queue()        
-    #def sort_queue(self):
-                   
+
+    def timeline(self):
+        #Alternating idle and busy segments from time 0, as start, duration and busy arrays
+        durations = np.empty(len(self.idle_times) + len(self.busy_times))
+        durations[0::2] = self.idle_times
+        durations[1::2] = self.busy_times
+        busy = np.zeros(len(durations), dtype=bool)
+        busy[1::2] = True
+        return np.cumsum(durations) - durations, durations, busy
         
         
 class SystemState:
-    def __init__(self, sim_duration, events, images, rads, cutoff=False, verbose=False):
+    def __init__(self, config, events, images, rads):
+        self.config = config
         self.time = 0
-        self.sim_duration = sim_duration
+        self.sim_duration = config.sim_time
         self.continue_running = True
-        self.events = events
+        #heap of [time, seq, event], seq keeps same-time events in creation order
+        self.event_counter = itertools.count()
+        self.events = [[event[0], next(self.event_counter), event] for event in events]
+        heapq.heapify(self.events)
         self.images = images
         self.rads = rads
         self.rads_working = rads
         self.rads_not_working = []
         self.events_history = []
-        self.queue_lengths = []
+        #total queue length after every event, kept as a counter rather than summed over the rads
+        self.n_queued = 0
         self.time_steps = []
-        self.img_table = pd.DataFrame(columns=['img_id','urgency', 'rad_id', 'time_created','time_rad_job_starts', 'time_job_finished', 'wait_time', 'time_w_rad', 'total_time'])
+        self.queued = []
+        #queue length of every rad, sampled every config.queue_sample_every minutes
+        self.sample_times = []
+        self.queue_lengths = []
+        self.next_sample = 0
+        #one row per completed image, the img_table frame is built from them on demand
+        self.img_rows = []
+        self._img_table = None
         self.rad_table = pd.DataFrame()
         self.unfin_img_table = pd.DataFrame(columns=['img_id','urgency', 'rad_id', 'time_created','time_rad_job_starts', 'time_job_finished', 'wait_time', 'time_w_rad', 'total_time'])
-        self.verbose = verbose
+        self.verbose = config.verbose
+        self.n_events = 0
+        self.cancelled = False
+        #counters and completions window for the live snapshots
+        self.n_arrived = 0
+        self.n_completed = 0
+        self.publish = None
+        self.window = []
+        self.kpi = KPIStats()
+        #a fresh router per run, routers such as round robin keep state
+        self.router = make_router(config.router, **dict(config.router_options))
+        self.rads_by_specialty = {}
+        for rad in self.rads_working:
+            for specialty in rad.specialties:
+                self.rads_by_specialty.setdefault(specialty, []).append(rad)
+        self.eligible_cache = {}
+        discipline = get_discipline(config.discipline)
+        self.preemptive = discipline.preemptive
+        for rad in self.rads:
+            if type(rad.waiting) is not discipline:
+                rad.waiting = discipline()
+        self.dispatch = config.dispatch
+        if self.dispatch == "pull":
+            self.pull_dispatcher = PullDispatcher(self.rads_working, discipline.priority)
+        elif self.dispatch == "batch":
+            self.pull_dispatcher = BatchDispatcher(self.rads_working, config.batch_interval, config.batch_threshold,
+                                                   priority=discipline.priority)
+            self.create_event(config.batch_interval, "Batch Assign", None)
         
     def create_event(self, time, event_type, obj):
-        self.events.append([time, event_type, obj])
-        self.events = sorted(self.events, key=lambda x: x[0])
+        event = [time, event_type, obj]
+        heapq.heappush(self.events, [time, next(self.event_counter), event])
+        return event
+
+    def cancel_event(self, event):
+        #lazy deletion, the event is skipped when it reaches the top of the heap
+        event[1] = "Cancelled"
 
     def update_img_table(self, med_img):
-        column_names = ['img_id','urgency', 'rad_id', 'time_created','time_rad_job_starts', 'time_job_finished', 'wait_time', 'time_w_rad', 'total_time']
-        values = [med_img.img_id, med_img.urgency, med_img.rad_seen, med_img.time_created, med_img.time_seen, self.time, med_img.time_seen - med_img.time_created, self.time - med_img.time_seen, self.time - med_img.time_created] #[[med_img.time_created], [med_img.time_seen], [self.time], [self.time - med_img.time_seen], [self.time - med_img.time_created]]
-        temp_df = pd.DataFrame(values).T
-        temp_df.columns = column_names
-        self.img_table = self.img_table.append(temp_df, ignore_index = True)
+        self.img_rows.append([med_img.img_id, med_img.urgency, med_img.rad_seen, med_img.time_created, med_img.time_seen, self.time, med_img.time_seen - med_img.time_created, self.time - med_img.time_seen, self.time - med_img.time_created])
+
+    @property
+    def img_table(self):
+        #appending a frame per completion was quadratic in the number of images
+        if self._img_table is None or len(self._img_table) != len(self.img_rows):
+            column_names = ['img_id','urgency', 'rad_id', 'time_created','time_rad_job_starts', 'time_job_finished', 'wait_time', 'time_w_rad', 'total_time']
+            self._img_table = pd.DataFrame(self.img_rows, columns=column_names)
+        return self._img_table
         
     def unfinished_jobs(self):
         unfin_med_images = []
         for rad in self.rads:
             unfin_med_images += rad.queue
-            unfin_med_images = list(set(unfin_med_images))
+        unfin_med_images = list(set(unfin_med_images))
+        if self.dispatch != "push":
+            unfin_med_images += self.pull_dispatcher.waiting_images()
         print(f"There are {len(unfin_med_images)} that were not completed in time")
-        column_names = [['img_id','urgency', 'rad_id', 'time_created','time_rad_job_starts', 'time_job_finished', 'wait_time', 'time_w_rad', 'total_time']]
+        column_names = ['img_id','urgency', 'rad_id', 'time_created','time_rad_job_starts', 'time_job_finished', 'wait_time', 'time_w_rad', 'total_time']
+        rows = []
         for med_img in unfin_med_images:
-            values = [med_img.img_id, med_img.urgency, med_img.rad_seen, med_img.time_created, med_img.time_seen, self.time, med_img.time_seen - med_img.time_created, self.time - med_img.time_seen, self.time - med_img.time_created] #[[med_img.time_created], [med_img.time_seen], [self.time], [self.time - med_img.time_seen], [self.time - med_img.time_created]]
-            temp_df = pd.DataFrame(values).T
-            temp_df.columns = column_names
-            self.unfin_img_table = self.unfin_img_table.append(temp_df, ignore_index = True)
+            rows.append([med_img.img_id, med_img.urgency, med_img.rad_seen, med_img.time_created, med_img.time_seen, self.time, med_img.time_seen - med_img.time_created, self.time - med_img.time_seen, self.time - med_img.time_created])
+        #one frame for all rows, appending row by row was quadratic in the backlog
+        self.unfin_img_table = pd.DataFrame(rows, columns=column_names)
         
     def process_event(self):
-        event = self.events[0]
+        event = heapq.heappop(self.events)[2]
+        event_type = event[1]
+        if event_type == "Cancelled":
+            return
         self.events_history.append(event)
         self.time = event[0]       
-        event_type = event[1]
-        del self.events[0]
-        temp_list = []
-        for r in self.rads:
-            temp_list.append(len(r.queue))
-        self.queue_lengths.append(temp_list)
-        self.time_steps.append(self.time)        
+        if self.config.queue_sample_every is not None and self.time >= self.next_sample:
+            self.sample_queue_lengths()
             
         if event_type == "New Job":
+            self.n_arrived += 1
+            self.kpi.arrive(event[2].urgency)
             self.distribute_job(event[2])
         elif event_type == "Job Done":
             rad = event[2]
             self.complete_job(rad)
+        elif event_type == "Batch Assign":
+            self.batch_assign()
+            if len(self.events) > 0:    #stop ticking once nothing else can happen
+                self.create_event(self.time + self.pull_dispatcher.interval, "Batch Assign", None)
         elif event_type == "Sim End":
             self.continue_running = False 
         if self.verbose==True:
             print("Event processed")
-        if (len(self.events) == 0) or (self.events[0][1]=="Sim End"):
+        if (len(self.events) == 0) or (self.events[0][2][1]=="Sim End"):
             self.continue_running = False 
-        if self.continue_running:
-            self.process_event()
-        else:
-            for rad in self.rads:
-                rad.update_idle_lists(self.time)
-            self.unfinished_jobs()
-            print(f"Simulation complete at {self.time} minutes")
+        self.time_steps.append(self.time)
+        self.queued.append(self.n_queued)
+
+    def sample_queue_lengths(self):
+        self.sample_times.append(self.time)
+        self.queue_lengths.append([r.queue_size() for r in self.rads])
+        interval = self.config.queue_sample_every
+        self.next_sample = (self.time // interval + 1) * interval
+
+    def end_simulation(self):
+        for rad in self.rads:
+            rad.update_idle_lists(self.time)
+        self.unfinished_jobs()
+        print(f"Simulation complete at {self.time} minutes")
                 
     def distribute_job(self, med_image):
         urgency = med_image.urgency
         image_type = med_image.image_type
-        # Function to route medical images based on some algorithm
-        chosen_rads = self.choose_rads(image_type)       
+        if self.dispatch != "push":
+            rad = self.preemptable_rad(med_image) if self.preemptive and urgency == 1 else None
+            if rad is not None:
+                self.preempt(rad, med_image)
+            elif self.dispatch == "pull":
+                self.pull_job(med_image)
+            else:
+                self.pull_dispatcher.push(med_image)
+                if self.pull_dispatcher.backlog_exceeded():
+                    self.batch_assign()
+            return
+        # Route medical images with the selected policy
+        chosen_rads = self.router.route(med_image, self)
         for rad in chosen_rads:
-            rad.add_job(med_image, self.time)
-            med_image.in_queues.append(rad)    #keep track of which rads have image in queue
-            if len(rad.queue)==1:
+            self.enqueue(rad, med_image)
+            if rad.current is None:
                 self.start_job(rad)
-                break         
-        self.update_queues() 
+                return
+        if self.preemptive and urgency == 1:
+            for rad in chosen_rads:
+                if rad.current.urgency > 1:
+                    self.preempt(rad)
+                    break
+
+    def preempt(self, rad, urgent_image=None):
+        #preemptive-resume: the job in service goes back to the head of its class with its remaining service time
+        #in push mode it stays with rad, otherwise rad takes urgent_image and an idle capable rad resumes the job
+        #or it waits at the head of its class in the central queue
+        med_image = rad.current
+        med_image.remaining_service = rad.done_event[0] - self.time
+        self.cancel_event(rad.done_event)
+        if urgent_image is None:
+            rad.current = None
+            rad.waiting.push_front(med_image)
+        else:
+            rad.end_job()
+            self.n_queued -= 1
+            med_image.in_queues = []
+            self.enqueue(rad, urgent_image)
+        self.events_history.append([self.time, "Job Preempted", med_image])
+        if self.verbose==True:
+            print(f"Image {med_image.img_id} is preempted on radiologist {rad.rad_id} at {self.time}")
+        self.start_job(rad)
+        if urgent_image is not None:
+            self.pull_job(med_image, front=True)
+
+    def preemptable_rad(self, med_image):
+        #pull and batch modes: a capable rad serving a less urgent job, if every capable rad is busy
+        if self.pull_dispatcher.find_idle_rad(med_image) is not None:
+            return None
+        for rad in self.eligible_rads(med_image):
+            if rad.current is not None and rad.current.urgency > med_image.urgency:
+                return rad
+        return None
+
+    def pull_job(self, med_image, front=False):
+        #hand the image to an idle capable rad, or leave it in the central queue, at the head of its class if front
+        rad = self.pull_dispatcher.find_idle_rad(med_image)
+        if rad is None:
+            if front:
+                self.pull_dispatcher.push_front(med_image)
+            else:
+                self.pull_dispatcher.push(med_image)
+            return
+        self.pull_dispatcher.set_busy(rad)
+        self.enqueue(rad, med_image)
+        self.start_job(rad)
+
+    def batch_assign(self):
+        #batch mode: apply the min-cost matching of waiting images to idle rads
+        for med_image, rad in self.pull_dispatcher.match(self.time):
+            self.pull_dispatcher.set_busy(rad)
+            self.enqueue(rad, med_image)
+            self.start_job(rad)
+
+    def enqueue(self, rad, med_image):
+        rad.add_job(med_image, self.time)
+        med_image.in_queues.append(rad)    #keep track of which rads have image in queue
+        self.n_queued += 1
+
+    def eligible_rads(self, med_image):
+        #radiologists capable of working on image, cached per (image type, facility)
+        key = (med_image.image_type, med_image.facility)
+        if key not in self.eligible_cache:
+            self.eligible_cache[key] = self.choose_rads(med_image.image_type, med_image.facility)
+        return self.eligible_cache[key]
         
-    def choose_rads(self, image_type):
+    def choose_rads(self, image_type, facility=None):
         capable_rads = []
-        for rad in self.rads_working:      #finds radiologists capable of working on image
-            if image_type in rad.specialties:
+        for rad in self.rads_by_specialty.get(image_type, []):      #finds radiologists capable of working on image
+            if rad.has_privileges(facility):
                 capable_rads.append(rad)
-        chosen_rads = self.n_quickest_queues(capable_rads, 3)
         return capable_rads
     
     def n_shortest_queues(self, rads_list, n):
         rads_tuples = []
         for rad in rads_list:
-            rads_tuples.append([rad, len(rad.queue)])
+            rads_tuples.append([rad, rad.queue_size()])
         rads_tuples.sort(key = lambda x: x[1])
         return [rad[0] for rad in rads_tuples[:n]]
     
@@ -328,62 +438,119 @@ class SystemState:
             rad.update_queue(self.time)
                 
     def start_job(self, rad):
-        med_image = rad.queue[0]
+        med_image = rad.next_job()
         image_type = med_image.image_type
         urgency = med_image.urgency
         rad.service_starts = self.time
-        med_image.time_seen = self.time
-        med_image.rad_seen = rad.rad_id
         self.events_history.append([self.time, "Job Started", med_image])
-        process_time = np.random.exponential(G.target_times[urgency])
-        self.create_event(self.time+process_time, "Job Done", rad)
+        if med_image.remaining_service is not None:     #resuming a preempted job
+            process_time = med_image.remaining_service
+            med_image.remaining_service = None
+        else:
+            med_image.time_seen = self.time
+            med_image.rad_seen = rad.rad_id
+            process_time = np.random.exponential(self.config.target_time(urgency))
+        rad.done_event = self.create_event(self.time+process_time, "Job Done", rad)
         if self.verbose==True:
             print(f"Image {med_image.img_id} is seen by radiologist {rad.rad_id} at {self.time}")
         for r in med_image.in_queues:
             if r != rad:
-                r.queue.remove(med_image)           
+                r.remove_job(med_image)
+                self.n_queued -= 1
+        med_image.in_queues = [rad]
         
     def complete_job(self, rad):
-        med_image = rad.queue[0]
+        med_image = rad.end_job()
+        self.n_queued -= 1
         self.update_img_table(med_image)
         rad.images_served.append(med_image.img_id)
         rad.service_ends.append(self.time)
         med_image.time_done = self.time
+        self.n_completed += 1
+        self.kpi.add(med_image.urgency, med_image.time_seen - med_image.time_created,
+                     self.time - med_image.time_created, med_image.target_time)
+        if self.publish is not None:
+            self.window.append((med_image.urgency, med_image.time_seen - med_image.time_created))
         if self.verbose==True:
             print(f"Image {med_image.img_id} is done by radiologist {rad.rad_id} at {self.time}")
-        del rad.queue[0]
+        if self.dispatch != "push" and rad.queue_size() == 0:
+            #batch mode too: a finishing rad pulls between batches, only arrivals wait for the next batch
+            next_image = self.pull_dispatcher.pop(rad)
+            if next_image is None:
+                self.pull_dispatcher.set_idle(rad)
+            else:
+                self.enqueue(rad, next_image)
         rad.finish_job(self.time)
-        if len(rad.queue) > 0:
+        if rad.queue_size() > 0:
             self.start_job(rad)
 
-    def run_simulation(self):
-        self.process_event()
-
-def gen_system_state(sim_time, rads_count, arr_rates, urg_times, constant_rads, cutoff, verbose):
-    #Define urgency times
-    update_globals(urg_times)
+    def snapshot_delta(self):
+        """
+        Changes since the previous snapshot: completions and wait time
+        percentiles per urgency over the window, plus the current backlog
+        (arrived, not finished and not in service) and busy radiologists.
+        """
+        completed, wait_p50, wait_p90 = {}, {}, {}
+        if self.window:
+            urgency, wait = np.array(self.window, dtype=float).T
+            for urg in np.unique(urgency):
+                waits = wait[urgency == urg]
+                completed[str(int(urg))] = len(waits)
+                wait_p50[str(int(urg))] = float(np.percentile(waits, 50))
+                wait_p90[str(int(urg))] = float(np.percentile(waits, 90))
+        self.window = []
+        busy = sum(rad.current is not None for rad in self.rads)
+        return {"time": self.time, "completed": completed, "wait_p50": wait_p50, "wait_p90": wait_p90,
+                "backlog": self.n_arrived - self.n_completed - busy, "busy": busy}
+
+    def run_simulation(self, progress=None, progress_every=1000, publish=None, snapshot_every=60):
+        #loop rather than recurse so long runs don't hit the recursion limit
+        #progress(self) is called every progress_every events, returning True cancels the run
+        #publish(delta) is called every snapshot_every simulated minutes with snapshot_delta()
+        self.publish = publish
+        next_snapshot = self.time + snapshot_every
+        while self.continue_running and len(self.events) > 0:
+            self.process_event()
+            self.n_events += 1
+            if publish is not None and self.time >= next_snapshot:
+                publish(self.snapshot_delta())
+                next_snapshot = (self.time // snapshot_every + 1) * snapshot_every
+            if progress is not None and self.n_events % progress_every == 0 and progress(self):
+                self.cancelled = True
+                break
+        if publish is not None:
+            publish(self.snapshot_delta())
+        self.end_simulation()
+
+def gen_system_state(config, *args, **kwargs):
+    #Takes a SimConfig, or its fields in order (sim_time, rads_count, arr_rates, urg_times, ...)
+    if not isinstance(config, SimConfig):
+        config = SimConfig(config, *args, **kwargs)
+    #Seed both generators so a run can be reproduced
+    if config.seed is not None:
+        random.seed(config.seed)
+        np.random.seed(config.seed)
     #Create the intervals
-    arrivals_dict, arrival_times_tuples_list = create_arrival_times(sim_time, arr_rates)
+    arrivals_dict, arrival_times_tuples_list = create_arrival_times(config.sim_time, config.arr_rates)
     #Create the images with their arrival time_seen
-    med_images = create_medical_images(arrival_times_tuples_list)
+    med_images = create_medical_images(arrival_times_tuples_list, config)
     #Create the radiologists
-    radiologists = create_radiologists(rads_count, constant_rads)
+    radiologists = create_radiologists(config)
     #Create the image arrival events
-    events = create_initial_events(sim_time, med_images, cutoff)
-    s = SystemState(sim_time, events, med_images, radiologists, cutoff, verbose)
+    events = create_initial_events(config.sim_time, med_images, config.cutoff)
+    s = SystemState(config, events, med_images, radiologists)
     return s
 
 
-def sim(sim_time, rads_count, arr_rates, urg_times, constant_rads=False, cutoff=False, verbose=False):  
-    s = gen_system_state(sim_time, rads_count, arr_rates, urg_times, constant_rads, cutoff, verbose)
+def sim(config, *args, **kwargs):  
+    s = gen_system_state(config, *args, **kwargs)
     s.run_simulation()    
     return s
 
 
 def plot_queue_lengths(s):
     fig, ax = plt.subplots()
-    for i in range(len(s.queue_lengths[0])):
-        plt.plot(s.time_steps, [item[i] for item in s.queue_lengths])
+    plt.plot(s.sample_times, s.queue_lengths)
 
         
 def wait_time_plot(img_table):
@@ -416,57 +583,72 @@ def total_time_plot(img_table):
 def plt_mean_queue_length(s_list):
     fig, ax = plt.subplots()
     for s in s_list:
-        plt.plot(s.time_steps, pd.DataFrame(s.queue_lengths).sum(axis=1), label=f"{len(s.rads)}")
+        plt.plot(s.time_steps, s.queued, label=f"{len(s.rads)}")
     plt.xlabel("time")
     plt.ylabel("Mean Queue Length")
     plt.legend()
     plt.show()
     
 
+def timeline_table(rads):
+    #Idle and busy segments of every radiologist in one frame, one row per segment
+    timelines = [rad.timeline() for rad in rads]
+    return pd.DataFrame({
+        "rad_id": np.repeat([rad.rad_id for rad in rads], [len(t[0]) for t in timelines]).astype(np.int32),
+        "start": np.concatenate([t[0] for t in timelines]) if timelines else [],
+        "duration": np.concatenate([t[1] for t in timelines]) if timelines else [],
+        "busy": np.concatenate([t[2] for t in timelines]) if timelines else [],
+    })
+
+
+def busy_fractions(timeline):
+    #Fraction of time busy per radiologist, from a timeline_table frame
+    total = timeline.groupby("rad_id")["duration"].sum()
+    busy = timeline["duration"].where(timeline["busy"], 0).groupby(timeline["rad_id"]).sum()
+    return busy / total
+
+
+def timeline_collections(timeline, height=0.8):
+    #One PolyCollection per state, so a run of any length draws as two artists
+    collections = []
+    for busy, color, label in ((False, "red", "idle"), (True, "orange", "busy")):
+        seg = timeline[timeline["busy"] == busy]
+        x0 = seg["start"].to_numpy()
+        x1 = x0 + seg["duration"].to_numpy()
+        y0 = seg["rad_id"].to_numpy() - height / 2
+        y1 = y0 + height
+        verts = np.stack([np.column_stack(corner) for corner in ((x0, y0), (x0, y1), (x1, y1), (x1, y0))], axis=1)
+        collections.append(PolyCollection(verts, facecolors=color, edgecolors="none", label=label))
+    return collections
+
+
 def rad_idle_plot(rad):
-    idle_times = rad.idle_times
-    busy_times = rad.busy_times
-    left_var = 0
-    for i in range(len(idle_times)):
-        plt.barh(rad.rad_id, idle_times[i], left=left_var, color="red")
-        left_var = left_var + idle_times[i]
-        if i < len(busy_times):
-                plt.barh(rad.rad_id, busy_times[i], left=left_var, color="orange")
-                left_var = left_var + busy_times[i]
-
-    plt.legend(["idle", "busy"], title="Idle Times", loc="upper right")
+    fig, ax = plt.subplots()
+    starts, durations, busy = rad.timeline()
+    ax.broken_barh(list(zip(starts[~busy], durations[~busy])), (rad.rad_id - 0.4, 0.8), facecolors="red", label="idle")
+    ax.broken_barh(list(zip(starts[busy], durations[busy])), (rad.rad_id - 0.4, 0.8), facecolors="orange", label="busy")
+    ax.autoscale_view()
+    plt.legend(title="Idle Times", loc="upper right")
     plt.show()
     
     
 def idle_plots(rads):
-    plot_list = {}
-    total_idle = 0
-    total_busy = 0
-    avg_busy_times = {}
-    for rad in rads:
-        idle_times = rad.idle_times
-        busy_times = rad.busy_times
-        left_var = 0
-        for i in range(len(idle_times)):
-            plt.barh(rad.rad_id, idle_times[i], left=left_var, color="red")
-            left_var = left_var + idle_times[i]
-            if i < len(busy_times):
-                plt.barh(rad.rad_id, busy_times[i], left=left_var, color="orange")
-                left_var = left_var + busy_times[i]
-        per_busy = np.sum(busy_times)/(np.sum(busy_times) + np.sum(idle_times))
-        avg_busy_times[rad.rad_id] = per_busy
-        total_idle += np.sum(idle_times)
-        total_busy += np.sum(busy_times)
-        #print(f"Radiologist {rad.rad_id} was busy {round(per_busy, 3)} of the time.")
-        plt.legend(["idle", "busy"], title="Idle Times", loc="upper right")
+    timeline = timeline_table(rads)
+    fig, ax = plt.subplots()
+    for collection in timeline_collections(timeline):
+        ax.add_collection(collection)
+    ax.autoscale_view()
+    plt.legend(title="Idle Times", loc="upper right")
     plt.xlabel("time")
     plt.ylabel("Radiologist ID")
     plt.show()
     
-    total_per_busy = total_busy/(total_busy + total_idle)
+    avg_busy_times = busy_fractions(timeline)
+    total_busy = timeline["duration"][timeline["busy"]].sum()
+    total_per_busy = total_busy/timeline["duration"].sum()
     # Busy percent plots
     fig, ax = plt.subplots()
-    plt.bar(avg_busy_times.keys(), avg_busy_times.values())
+    plt.bar(avg_busy_times.index, avg_busy_times.values)
     plt.xlabel("Radiologist ID")
     plt.ylabel("Percent of Time Busy")
     plt.show()
@@ -488,22 +670,20 @@ def total_time_hist(curr_sim):
     
     #urgencies seperated
     fig, ax = plt.subplots()
-    plt.hist(curr_sim.img_table[curr_sim.img_table.urgency==3].total_time, label=f"urgency 3: {len(curr_sim.img_table[curr_sim.img_table.urgency==3])} images", color="red", alpha=0.6)
-    plt.hist(curr_sim.img_table[curr_sim.img_table.urgency==2].total_time, label=f"urgency 2: {len(curr_sim.img_table[curr_sim.img_table.urgency==2])} images", color="yellow", alpha=0.5)
-    plt.hist(curr_sim.img_table[curr_sim.img_table.urgency==1].total_time, label=f"urgency 1: {len(curr_sim.img_table[curr_sim.img_table.urgency==1])} images", color="green", alpha=0.5)
+    by_urgency = dict(tuple(curr_sim.img_table.groupby("urgency")["total_time"]))
+    for urg, color, alpha in ((3, "red", 0.6), (2, "yellow", 0.5), (1, "green", 0.5)):
+        times = by_urgency.get(urg, [])
+        plt.hist(times, label=f"urgency {urg}: {len(times)} images", color=color, alpha=alpha)
     plt.xlabel("time")
     plt.ylabel("Number of Images")
     plt.title("Time to be processed from creation (All Medical Images)")
     plt.legend()
     plt.show()
     
-    t1 = np.mean(curr_sim.img_table[curr_sim.img_table.urgency==1].total_time)
-    t2 = np.mean(curr_sim.img_table[curr_sim.img_table.urgency==2].total_time)
-    t3 = np.mean(curr_sim.img_table[curr_sim.img_table.urgency==3].total_time)
+    kpi = curr_sim.kpi.summary().set_index("urgency")
     print(f"The average total time for urgency 1, 2, and 3 medical images are:")
-    print(f"Urgency 1: {t1}")
-    print(f"Urgency 2: {t2}")
-    print(f"Urgency 3: {t3}")
+    for urg, mean in kpi["total_mean"].items():
+        print(f"Urgency {urg}: {mean}")
     
 
 def wait_time_hist(curr_sim):
@@ -519,30 +699,27 @@ def wait_time_hist(curr_sim):
     
     #urgencies seperated
     fig, ax = plt.subplots()
-    plt.hist(curr_sim.img_table[curr_sim.img_table.urgency==3].img_wait_time, label=f"urgency 3: {len(curr_sim.img_table[curr_sim.img_table.urgency==3])} images", color="red", alpha=0.6)
-    plt.hist(curr_sim.img_table[curr_sim.img_table.urgency==2].img_wait_time, label=f"urgency 2: {len(curr_sim.img_table[curr_sim.img_table.urgency==2])} images", color="yellow", alpha=0.5)
-    plt.hist(curr_sim.img_table[curr_sim.img_table.urgency==1].img_wait_time, label=f"urgency 1: {len(curr_sim.img_table[curr_sim.img_table.urgency==1])} images", color="green", alpha=0.5)
+    by_urgency = dict(tuple(curr_sim.img_table.groupby("urgency")["wait_time"]))
+    for urg, color, alpha in ((3, "red", 0.6), (2, "yellow", 0.5), (1, "green", 0.5)):
+        times = by_urgency.get(urg, [])
+        plt.hist(times, label=f"urgency {urg}: {len(times)} images", color=color, alpha=alpha)
     plt.xlabel("time (mins)")
     plt.ylabel("Number of Images")
     plt.title("Time to be processed from creation (All Medical Images)")
     plt.legend()
     plt.show()
     
-    t1 = np.mean(curr_sim.img_table[curr_sim.img_table.urgency==1].img_wait_time)
-    t2 = np.mean(curr_sim.img_table[curr_sim.img_table.urgency==2].img_wait_time)
-    t3 = np.mean(curr_sim.img_table[curr_sim.img_table.urgency==3].img_wait_time)
+    kpi = curr_sim.kpi.summary().set_index("urgency")
     print(f"The average wait time for urgency 1, 2, and 3 medical images are:")
-    print(f"Urgency 1: {t1}")
-    print(f"Urgency 2: {t2}")
-    print(f"Urgency 3: {t3}")
+    for urg, mean in kpi["wait_mean"].items():
+        print(f"Urgency {urg}: {mean}")
     
 def completion_plot(sims_dict):
     arr_rates = []
     sims_compl_rates = []
     for arr_val, sim in sims_dict.items():
-        compl_num = len(sim.img_table)
-        un_fin_num = len(sim.unfin_img_table)
-        perc_compl = compl_num/(compl_num + un_fin_num)
+        kpi = sim.kpi.summary()
+        perc_compl = kpi["completed"].sum()/kpi["arrived"].sum()
         sims_compl_rates.append(perc_compl)
         arr_rates.append(arr_val)
         sim_duration = sim.sim_duration
@@ -0,0 +1,104 @@
+import numpy as np
+import plotly.graph_objects as go
+
+# Server-side views of the app_vrad2 results, kept free of dash so they can be tested and reused
+
+
+FILTER_OPERATORS = {
+    ">=": np.greater_equal, "<=": np.less_equal, "!=": np.not_equal,
+    "<": np.less, ">": np.greater, "=": np.equal,
+    "ge": np.greater_equal, "le": np.less_equal, "ne": np.not_equal,
+    "lt": np.less, "gt": np.greater, "eq": np.equal,
+}
+
+
+def filter_mask(img_table, filter_query):
+    """
+    Boolean mask of the rows matching a DataTable filter query,
+    e.g. ``{urgency} = 1 && {wait_time} > 30``.
+    Unparseable parts are ignored.
+    """
+    mask = np.ones(len(img_table), dtype=bool)
+    for part in filter_query.split(" && "):
+        name, _, rest = part.strip().partition("} ")
+        name = name.lstrip("{")
+        operator, _, value = rest.strip().partition(" ")
+        if name not in img_table.columns:
+            continue
+        column = img_table[name]
+        value = value.strip().strip("'\"`")
+        if operator == "contains":
+            mask &= column.astype(str).str.contains(value, regex=False).to_numpy()
+        elif operator in FILTER_OPERATORS:
+            try:
+                value = float(value)
+            except ValueError:
+                continue
+            mask &= FILTER_OPERATORS[operator](column.to_numpy(), value)
+    return mask
+
+
+def view_positions(img_table, sort_by, filter_query):
+    # Row positions after filtering, then a stable sort on the (column, "asc" or "desc") pairs of sort_by
+    positions = np.flatnonzero(filter_mask(img_table, filter_query)) if filter_query else np.arange(len(img_table))
+    if sort_by:
+        view = img_table.iloc[positions]
+        order = view.sort_values([col for col, _ in sort_by],
+                                 ascending=[direction == "asc" for _, direction in sort_by],
+                                 kind="mergesort").index
+        positions = img_table.index.get_indexer(order)
+    return positions
+
+
+def table_page(img_table, positions, page_current, page_size):
+    # Rows of one page of a view, and the number of pages
+    start = page_current * page_size
+    page = img_table.iloc[positions[start:start + page_size]]
+    return page, max(1, -(-len(positions) // page_size))
+
+
+urgency_colors = {1: "red", 2: "orange", 3: "green"}
+#Above this many studies in view the graph shows min-max decimated points
+max_graph_points = 20000
+decimation_bins = 1000
+
+
+def minmax_decimate(x, y, n_bins):
+    #Positions of the lowest and highest y in each of n_bins equal-width x bins
+    edges = np.linspace(x.min(), x.max(), n_bins + 1)
+    bins = np.clip(np.searchsorted(edges, x, side="right") - 1, 0, n_bins - 1)
+    order = np.lexsort((y, bins))
+    sorted_bins = bins[order]
+    starts = np.flatnonzero(np.r_[True, sorted_bins[1:] != sorted_bins[:-1]])
+    ends = np.r_[starts[1:], len(order)] - 1
+    return np.unique(np.r_[order[starts], order[ends]])
+
+
+def results_figure(img_table, x_range=None, y_range=None):
+    """
+    WebGL scatter of total time against creation time, one trace per urgency.
+    Only the studies inside the zoomed ranges are considered, and when there
+    are more than max_graph_points of them each trace is min-max decimated
+    over time, which keeps the outliers while bounding the payload.
+    """
+    x = img_table["time_created"].to_numpy(dtype=float)
+    y = img_table["total_time"].to_numpy(dtype=float)
+    in_view = np.ones(len(img_table), dtype=bool)
+    if x_range is not None:
+        in_view &= (x >= x_range[0]) & (x <= x_range[1])
+    if y_range is not None:
+        in_view &= (y >= y_range[0]) & (y <= y_range[1])
+    decimate = in_view.sum() > max_graph_points
+    urgency = img_table["urgency"].to_numpy()
+    img_id = img_table["img_id"].to_numpy()
+    fig = go.Figure()
+    for urg, color in urgency_colors.items():
+        positions = np.flatnonzero(in_view & (urgency == urg))
+        if decimate and len(positions):
+            positions = positions[minmax_decimate(x[positions], y[positions], decimation_bins)]
+        fig.add_trace(go.Scattergl(x=x[positions], y=y[positions], mode="markers", name=str(urg),
+                                   marker={"color": color}, hovertext=img_id[positions]))
+    title = "min-max decimated, zoom in for every study" if decimate else None
+    fig.update_layout(xaxis_title="time_created", yaxis_title="total_time", legend_title_text="urgency",
+                      title=title)
+    return fig